@@ -1,53 +1,161 @@
-def procura_DFS(self, start, finish, path=[], visited=set()):
-        visited.add(start)
-        path.append(start)
-
-        if start == finish:
-            cost = self.calcula_custo(path)
-            return path, cost
-        
-        for node, _ in self.getNeighbours(start):
-            if node not in visited:
-                ans = self.procura_DFS(node, finish, path=path, visited=visited)
-                
-                if ans is not None:
-                  return ans
-        
-        path.pop()
-        return None
-
-def procura_BFS(self, start, finish, path=[], visited=set()):
-        q = []
-        q.append(start)
-
-        visited.add(start)
-        origin = ()
-        origin(start) = start
-
-        while len(q) > 0:
-            cur_node = q[0]
-            q = q[1:]
-
-            if cur_node == finish:
-                break
-
-            for node, _ in self.getNeighbours(cur_node):
-                if node not in visited:
-                    visited(node)
-                    q.append(node)
-                    origin(node) = cur_node
-        
-        if origin.get(finish) is None:
-            return None
-        
-        path_cur_node = origin(finish)
-
-        while True:
-            if path_cur_node == origin.get(path_cur_node):
-                break
-            
-            path.insert(0, path_cur_node)
-            path_cur_node = origin.get(path_cur_node)
-        
-        path_cost = self.calcula_custo(path)
-        return path, path_cost
\ No newline at end of file
+import heapq
+import time
+from collections import deque
+
+from heuristicas import heuristica
+
+# Todas as procuras trabalham sobre o GrafoCompacto, com nos identificados pelo indice (0..n-1).
+
+
+class ResultadoProcura:
+    def __init__(self, caminho, custo, nos_expandidos, pico_fronteira, tempo):
+        self.caminho = caminho
+        self.custo = custo
+        self.nos_expandidos = nos_expandidos
+        self.pico_fronteira = pico_fronteira
+        self.tempo = tempo
+
+    def __repr__(self):
+        return (f"Resultado(custo={self.custo:.1f}, expandidos={self.nos_expandidos}, "
+                f"fronteira={self.pico_fronteira}, tempo={self.tempo * 1000:.2f}ms)")
+
+
+def calcula_custo(grafo, caminho):
+    """Soma dos pesos das procuras (grafo.pesos: metros, ou segundos com trafego) ao longo do caminho,
+    na mesma unidade do custo das procuras de custo uniforme, gulosa e A*."""
+    custo = 0.0
+    for peso in grafo.pesos_arestas(caminho[:-1], caminho[1:]).tolist():
+        custo += peso
+    return custo
+
+
+def _reconstruir_caminho(anterior, fim):
+    caminho = [fim]
+    while anterior[caminho[-1]] != caminho[-1]:
+        caminho.append(anterior[caminho[-1]])
+    caminho.reverse()
+    return caminho
+
+
+def procura_BFS(grafo, inicio, fim):
+    t0 = time.perf_counter()
+    offsets, destinos, _ = grafo.listas_adjacencia()
+
+    anterior = {inicio: inicio}
+    fila = deque([inicio])
+    expandidos = 0
+    pico = 1
+
+    while fila:
+        atual = fila.popleft()
+        expandidos += 1
+        if atual == fim:
+            break
+        for k in range(offsets[atual], offsets[atual + 1]):
+            vizinho = destinos[k]
+            if vizinho not in anterior:
+                anterior[vizinho] = atual
+                fila.append(vizinho)
+        if len(fila) > pico:
+            pico = len(fila)
+
+    if fim not in anterior:
+        return ResultadoProcura(None, float('inf'), expandidos, pico, time.perf_counter() - t0)
+
+    caminho = _reconstruir_caminho(anterior, fim)
+    return ResultadoProcura(caminho, calcula_custo(grafo, caminho), expandidos, pico, time.perf_counter() - t0)
+
+
+def procura_DFS(grafo, inicio, fim):
+    t0 = time.perf_counter()
+    offsets, destinos, _ = grafo.listas_adjacencia()
+
+    anterior = {inicio: inicio}
+    visitados = set()
+    pilha = [inicio]
+    expandidos = 0
+    pico = 1
+
+    while pilha:
+        atual = pilha.pop()
+        if atual in visitados:
+            continue
+        visitados.add(atual)
+        expandidos += 1
+        if atual == fim:
+            break
+        # empilhar ao contrario para expandir os vizinhos pela ordem do grafo
+        for k in range(offsets[atual + 1] - 1, offsets[atual] - 1, -1):
+            vizinho = destinos[k]
+            if vizinho not in visitados:
+                anterior[vizinho] = atual
+                pilha.append(vizinho)
+        if len(pilha) > pico:
+            pico = len(pilha)
+
+    if fim not in visitados:
+        return ResultadoProcura(None, float('inf'), expandidos, pico, time.perf_counter() - t0)
+
+    caminho = _reconstruir_caminho(anterior, fim)
+    return ResultadoProcura(caminho, calcula_custo(grafo, caminho), expandidos, pico, time.perf_counter() - t0)
+
+
+def _procura_prioridade(grafo, inicio, fim, peso_g, h):
+    """Base comum de custo uniforme, gulosa e A*: prioridade = peso_g * g + h(n)."""
+    t0 = time.perf_counter()
+    offsets, destinos, pesos = grafo.listas_adjacencia()
+
+    g = {inicio: 0.0}
+    anterior = {inicio: inicio}
+    fechados = set()
+    fronteira = [(h(inicio), inicio)]
+    expandidos = 0
+    pico = 1
+
+    while fronteira:
+        _, atual = heapq.heappop(fronteira)
+        if atual in fechados:
+            continue
+        fechados.add(atual)
+        expandidos += 1
+        if atual == fim:
+            caminho = _reconstruir_caminho(anterior, fim)
+            return ResultadoProcura(caminho, g[fim], expandidos, pico, time.perf_counter() - t0)
+
+        g_atual = g[atual]
+        for k in range(offsets[atual], offsets[atual + 1]):
+            vizinho = destinos[k]
+            if vizinho in fechados:
+                continue
+            novo_g = g_atual + pesos[k]
+            if novo_g < g.get(vizinho, float('inf')):
+                g[vizinho] = novo_g
+                anterior[vizinho] = atual
+                heapq.heappush(fronteira, (peso_g * novo_g + h(vizinho), vizinho))
+        if len(fronteira) > pico:
+            pico = len(fronteira)
+
+    return ResultadoProcura(None, float('inf'), expandidos, pico, time.perf_counter() - t0)
+
+
+def procura_custo_uniforme(grafo, inicio, fim):
+    return _procura_prioridade(grafo, inicio, fim, 1.0, lambda n: 0.0)
+
+
+def procura_gulosa(grafo, inicio, fim):
+    return _procura_prioridade(grafo, inicio, fim, 0.0, lambda n: heuristica(grafo, n, fim))
+
+
+def procura_A_estrela(grafo, inicio, fim, h=None):
+    if h is None:
+        h = lambda n: heuristica(grafo, n, fim)
+    return _procura_prioridade(grafo, inicio, fim, 1.0, h)
+
+
+PROCURAS = {
+    "bfs": procura_BFS,
+    "dfs": procura_DFS,
+    "custo_uniforme": procura_custo_uniforme,
+    "gulosa": procura_gulosa,
+    "a_estrela": procura_A_estrela,
+}
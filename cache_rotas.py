@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class CacheRotas:
+    """Cache LRU de rotas (origem, destino) -> (indices dos nos, distancia).
+
+    Os caminhos ficam guardados como arrays int32 de indices do GrafoCompacto.
+    O tamanho e limitado pelo numero de rotas e pelo total de nos guardados;
+    quando um dos limites e ultrapassado sai a rota usada ha mais tempo.
+    Se a versao do grafo mudar (pesos alterados) o cache e esvaziado."""
+
+    def __init__(self, capacidade=10000, max_nos=2_000_000):
+        self.capacidade = capacidade
+        self.max_nos = max_nos
+        self._rotas = OrderedDict()
+        self._total_nos = 0
+        self._versao_grafo = None
+
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        self.invalidacoes = 0
+
+    def __len__(self):
+        return len(self._rotas)
+
+    @property
+    def taxa_acerto(self):
+        total = self.acertos + self.falhas
+        return self.acertos / total if total else 0.0
+
+    def _verificar_versao(self, versao_grafo):
+        if versao_grafo != self._versao_grafo:
+            if self._rotas:
+                self.invalidar()
+            self._versao_grafo = versao_grafo
+
+    def obter(self, origem, destino, versao_grafo):
+        self._verificar_versao(versao_grafo)
+        entrada = self._rotas.get((origem, destino))
+        if entrada is None:
+            self.falhas += 1
+            return None
+        self._rotas.move_to_end((origem, destino))
+        self.acertos += 1
+        return entrada
+
+    def guardar(self, origem, destino, caminho, distancia, versao_grafo):
+        if self.capacidade <= 0:
+            return
+        self._verificar_versao(versao_grafo)
+        chave = (origem, destino)
+        caminho = np.asarray(caminho if caminho is not None else [], dtype=np.int32)
+        if chave in self._rotas:
+            self._total_nos -= len(self._rotas.pop(chave)[0])
+
+        self._rotas[chave] = (caminho, distancia)
+        self._total_nos += len(caminho)
+
+        while len(self._rotas) > self.capacidade or (self._total_nos > self.max_nos and len(self._rotas) > 1):
+            _, (caminho_antigo, _) = self._rotas.popitem(last=False)
+            self._total_nos -= len(caminho_antigo)
+            self.despejos += 1
+
+    def invalidar(self):
+        self._rotas.clear()
+        self._total_nos = 0
+        self.invalidacoes += 1
+
+    def estatisticas(self):
+        return {
+            "rotas": len(self._rotas),
+            "nos_guardados": self._total_nos,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "despejos": self.despejos,
+            "invalidacoes": self.invalidacoes,
+            "taxa_acerto": self.taxa_acerto,
+        }
@@ -0,0 +1,274 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import despacho as dp
+import frota as fr
+import matriz_hubs as mh
+import motor_simulacao as ms
+import trafego as tr
+from grafo_compacto import carregar_grafo
+
+# Checkpoints de uma simulacao a correr: o estado completo do motor (arrays da frota, rotas,
+# paradas, estado dos geradores aleatorios, passo atual e pedidos pendentes) num .npz sem
+# compressao, para retomar depois, noutro processo, ou para bifurcar a mesma simulacao em varias
+# variantes a partir do mesmo instante.
+#
+#   checkpoint.guardar(sim, "sim.npz", "matosinhos_5km.graphml")
+#   sim = checkpoint.carregar("sim.npz")
+#
+# O grafo nao e guardado: o checkpoint so tem o nome do ficheiro e o hash do conteudo
+# (GrafoCompacto.hash_conteudo), validado ao carregar. As tabelas derivadas do grafo (postos,
+# zonas de despacho; ver matriz_hubs) e a cache de rotas voltam a ser obtidas quando forem precisas.
+# Com trafego ficam os perfis e a hora em vigor, e os pesos dessa hora sao repostos ao carregar.
+
+VERSAO_FORMATO = 4
+
+MOTORES = {"MotorSimulacao": ms.MotorSimulacao}
+
+COLUNAS_FROTA = fr.COLUNAS
+ESCALARES_MOTOR = ("passo_atual", "FATOR_CONSUMO", "semente", "semente_sorteio", "algoritmo_procura",
+                   "segundos_por_passo", "metros_por_passo")
+
+COLUNAS_DESPACHO = ("pendentes_id", "pendentes_origem", "pendentes_destino") + dp.COLUNAS_PEDIDO
+ESCALARES_DESPACHO = ("janela", "espera_maxima", "segundos_por_passo", "_proximo_passo_gerado", "partilha",
+                      "desvio_maximo", "raio_partilha", "max_candidatos", "intervalo_partilha", "metros_por_passo",
+                      "primeiro_pedido", "gerados", "atribuidos", "recolhidos", "concluidos", "abandonados",
+                      "partilhados", "ultimo_passo")
+
+
+def _escalar(valor):
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+def _rotas_para_arrays(rotas):
+    # nos de todas as rotas seguidos, com inicio[i]:inicio[i + 1] os da rota do taxi i
+    # (cursor -1 = sem rota); os acumulados tem mais um elemento por rota
+    cursores = np.full(len(rotas), -1, dtype=np.int32)
+    tamanhos = np.zeros(len(rotas), dtype=np.int64)
+    nos, acumulados = [], []
+    for i, rota in enumerate(rotas):
+        if rota is not None:
+            cursores[i] = rota.cursor
+            tamanhos[i] = len(rota.nos)
+            nos.append(rota.nos)
+            acumulados.append(rota.acumulado)
+    return {
+        "rotas_cursor": cursores,
+        "rotas_tamanho": tamanhos,
+        "rotas_nos": np.concatenate(nos) if nos else np.array([], dtype=np.int32),
+        "rotas_acumulado": np.concatenate(acumulados) if acumulados else np.array([], dtype=np.float64),
+    }
+
+
+def _rotas_de_arrays(dados):
+    cursores, tamanhos = dados["rotas_cursor"], dados["rotas_tamanho"]
+    inicio_nos = np.concatenate(([0], np.cumsum(tamanhos)))
+    inicio_acumulado = inicio_nos + np.concatenate(([0], np.cumsum(cursores >= 0)))
+    nos, acumulado = dados["rotas_nos"], dados["rotas_acumulado"]
+    rotas = [None] * len(cursores)
+    for i in np.flatnonzero(cursores >= 0).tolist():
+        rota = fr.Rota(nos[inicio_nos[i]:inicio_nos[i + 1]],
+                       acumulado[inicio_acumulado[i]:inicio_acumulado[i] + tamanhos[i] + 1])
+        rota.cursor = int(cursores[i])
+        rotas[i] = rota
+    return rotas
+
+
+def _paradas_para_arrays(paradas):
+    tamanhos = np.array([len(p) for p in paradas], dtype=np.int64)
+    planos = [parada for plano in paradas for parada in plano]
+    return {
+        "paradas_tamanho": tamanhos,
+        "paradas_no": np.array([no for no, _, _ in planos], dtype=np.int64),
+        "paradas_pedido": np.array([pedido for _, pedido, _ in planos], dtype=np.int64),
+        "paradas_recolha": np.array([recolha for _, _, recolha in planos], dtype=bool),
+    }
+
+
+def _paradas_de_arrays(dados):
+    planos = list(zip(dados["paradas_no"].tolist(), dados["paradas_pedido"].tolist(),
+                      dados["paradas_recolha"].tolist()))
+    fim = np.cumsum(dados["paradas_tamanho"]).tolist()
+    return [planos[b - t:b] for b, t in zip(fim, dados["paradas_tamanho"].tolist())]
+
+
+def estado(sim):
+    """(meta, arrays) com o estado completo da simulacao."""
+    frota = sim.frota
+    meta = {
+        "versao_formato": VERSAO_FORMATO,
+        "motor": type(sim).__name__,
+        "escalares": {nome: _escalar(getattr(sim, nome)) for nome in ESCALARES_MOTOR},
+        "capacidade_cache_rotas": sim.cache_rotas.capacidade,
+        "rng": sim.rng.getstate(),
+        "pois_frota": sim.pois_frota,
+        "hash_grafo": sim.grafo.hash_conteudo(),
+        "despacho": None,
+        "trafego": None,
+    }
+    if sim.trafego is not None:
+        meta["trafego"] = {"perfis": sim.trafego.para_dict(), "hora_inicial": sim.hora_inicial,
+                           "hora": sim.hora_trafego, "matrizes": sim.matrizes_trafego}
+    arrays = {f"frota_{nome}": getattr(frota, nome) for nome in COLUNAS_FROTA}
+    arrays.update(_rotas_para_arrays(frota.rotas))
+    arrays.update(_paradas_para_arrays(frota.paradas))
+
+    despacho = sim.despacho
+    if despacho is not None:
+        meta["despacho"] = {
+            "escalares": {nome: _escalar(getattr(despacho, nome)) for nome in ESCALARES_DESPACHO},
+            "num_zonas": despacho.gerador.num_zonas,
+            "taxa_por_passo": despacho.gerador.taxa_por_passo,
+            "rng": despacho.gerador.rng.bit_generator.state,
+        }
+        # as colunas por pedido tem folga no fim: so as linhas dos pedidos ja gerados
+        usados = despacho.gerados - despacho.primeiro_pedido
+        arrays.update((f"despacho_{nome}", getattr(despacho, nome)[:usados] if nome in dp.COLUNAS_PEDIDO
+                       else getattr(despacho, nome)) for nome in COLUNAS_DESPACHO)
+        arrays["despacho_nos_zonas"] = despacho.tabelas.nos
+        if despacho.gerador.origens is not None:
+            arrays["despacho_origens"] = despacho.gerador.origens
+        arrays["despacho_esperas"] = despacho.esperas
+    return meta, arrays
+
+
+def guardar(sim, caminho, ficheiro_grafo=""):
+    """Escreve o checkpoint em `caminho` (primeiro para um ficheiro temporario, para que uma falha a
+    meio da escrita nunca estrague o checkpoint anterior)."""
+    meta, arrays = estado(sim)
+    meta["ficheiro_grafo"] = ficheiro_grafo
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+    os.replace(temporario, caminho)
+
+
+def _restaurar_despacho(sim, meta, dados):
+    despacho = dp.Despachante.__new__(dp.Despachante)
+    for nome, valor in meta["escalares"].items():
+        setattr(despacho, nome, valor)
+    for nome in COLUNAS_DESPACHO:
+        setattr(despacho, nome, dados[f"despacho_{nome}"])
+    despacho.esperas = dados["despacho_esperas"]
+
+    despacho.usar_tabelas(mh.obter_matriz(sim.grafo, dados["despacho_nos_zonas"]))
+    despacho._ate_posto_zonas = None
+
+    gerador = dp.GeradorPedidos.__new__(dp.GeradorPedidos)
+    gerador.num_zonas = meta["num_zonas"]
+    gerador.taxa_por_passo = meta["taxa_por_passo"]
+    gerador.origens = dados["despacho_origens"] if "despacho_origens" in dados else None
+    gerador.rng = np.random.default_rng()
+    gerador.rng.bit_generator.state = meta["rng"]
+    despacho.gerador = gerador
+    return despacho
+
+
+def ler_meta(caminho):
+    """Os dados do checkpoint que nao sao arrays (motor, hash e ficheiro do grafo, ...), sem ler a frota."""
+    with np.load(caminho) as ficheiro:
+        return json.loads(str(ficheiro["meta"]))
+
+
+def carregar(caminho, G=None, ficheiro_grafo=None):
+    """Motor com o estado do checkpoint, pronto a continuar.
+
+    Sem G carrega o grafo de `ficheiro_grafo` (por omissao, o indicado no checkpoint); em
+    qualquer caso o grafo tem de ter o mesmo conteudo que tinha quando o checkpoint foi escrito."""
+    with np.load(caminho) as ficheiro:
+        dados = {nome: ficheiro[nome] for nome in ficheiro.files}
+    meta = json.loads(str(dados.pop("meta")))
+    if meta.get("versao_formato") != VERSAO_FORMATO:
+        raise ValueError(f"O checkpoint '{caminho}' tem um formato diferente ({meta.get('versao_formato')}).")
+    if meta["motor"] not in MOTORES:
+        raise ValueError(f"O checkpoint '{caminho}' e de um motor que ja nao existe ({meta['motor']}).")
+
+    if G is None:
+        ficheiro_grafo = ficheiro_grafo or meta["ficheiro_grafo"]
+        if not ficheiro_grafo:
+            raise ValueError(f"O checkpoint '{caminho}' nao indica o grafo: passar G ou ficheiro_grafo.")
+        G = carregar_grafo(ficheiro_grafo)
+    sim = MOTORES[meta["motor"]](G, meta["pois_frota"], meta["escalares"]["algoritmo_procura"],
+                                 meta["capacidade_cache_rotas"])
+    trafego = meta.get("trafego")
+    if trafego is not None:
+        sim.trafego = tr.PerfisVelocidade.de_dict(trafego["perfis"])
+        sim.hora_inicial = trafego["hora_inicial"]
+        sim.matrizes_trafego.update(trafego["matrizes"])
+        sim._atualizar_trafego(trafego["hora"])
+    elif sim.grafo.tem_pesos():
+        # grafo partilhado com uma simulacao com trafego (por exemplo, em bifurcar)
+        sim.grafo.definir_pesos(None)
+    if sim.grafo.hash_conteudo() != meta["hash_grafo"]:
+        raise ValueError(f"O checkpoint '{caminho}' foi escrito com outro grafo.")
+
+    for nome, valor in meta["escalares"].items():
+        setattr(sim, nome, valor)
+    versao, interno, gauss = meta["rng"]
+    sim.rng.setstate((versao, tuple(interno), gauss))
+
+    frota = fr.Frota(sim.grafo, [], [])
+    for nome in COLUNAS_FROTA:
+        setattr(frota, nome, dados[f"frota_{nome}"])
+    frota.rotas = _rotas_de_arrays(dados)
+    frota.paradas = _paradas_de_arrays(dados)
+    sim.frota = frota
+    sim.frota_taxis = frota.taxis()
+
+    if meta["despacho"] is not None:
+        sim.despacho = _restaurar_despacho(sim, meta["despacho"], dados)
+    return sim
+
+
+class GravadorCheckpoint:
+    """Escreve um checkpoint a cada `intervalo` ticks (usado por simulacao_batch.correr_batch)."""
+
+    def __init__(self, caminho, intervalo=0, ficheiro_grafo=""):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.ficheiro_grafo = ficheiro_grafo
+        self.escritos = 0
+        self.tempo_s = 0.0
+
+    def guardar(self, sim):
+        t0 = time.perf_counter()
+        guardar(sim, self.caminho, self.ficheiro_grafo)
+        self.tempo_s += time.perf_counter() - t0
+        self.escritos += 1
+
+
+_bifurcacao = {}
+
+
+def _iniciar_bifurcacao(caminho, ficheiro_grafo):
+    # o grafo e carregado uma vez por processo (cache mapeada em memoria)
+    _bifurcacao.update(caminho=caminho, G=carregar_grafo(ficheiro_grafo))
+
+
+def _correr_variante(tarefa):
+    variante, passos = tarefa
+    sim = carregar(_bifurcacao["caminho"], _bifurcacao["G"])
+    if variante is not None:
+        variante(sim)
+    t0 = time.perf_counter()
+    sim.avancar_ate(sim.passo_atual + passos)
+    kpis = sim.calcular_kpis()
+    kpis["tempo_execucao_s"] = time.perf_counter() - t0
+    return kpis
+
+
+def bifurcar(caminho, passos, variantes=(None,), processos=None, ficheiro_grafo=None):
+    """Retoma o checkpoint uma vez por variante, em processos separados, e corre mais `passos` ticks.
+
+    Cada variante e uma funcao (de modulo, para poder ser enviada aos processos) aplicada a simulacao
+    retomada antes de continuar, por exemplo para mudar a politica de despacho; None = sem alteracoes.
+    Devolve os KPIs finais de cada variante, pela ordem dada."""
+    ficheiro_grafo = ficheiro_grafo or ler_meta(caminho)["ficheiro_grafo"]
+    processos = processos or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(processos, len(variantes)), initializer=_iniciar_bifurcacao,
+                             initargs=(caminho, ficheiro_grafo)) as executor:
+        return list(executor.map(_correr_variante, [(variante, passos) for variante in variantes]))
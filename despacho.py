@@ -0,0 +1,544 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+import frota as fr
+import matriz_hubs as mh
+
+# Procura de passageiros e despacho em lote.
+#
+# Os pedidos chegam a cada zona de recolha (filtrada) como um processo de Poisson e tem como
+# destino outra zona. Como todas as recolhas e entregas sao em zonas, as zonas sao hubs de uma
+# matriz_hubs.MatrizHubs (construida uma vez e guardada com o grafo): as distancias e os caminhos
+# entre zonas sao consultas a uma tabela; a distancia de um taxi a todas as zonas e uma procura
+# por posicao, guardada enquanto essa posicao voltar a ser usada.
+#
+# A cada janela de despacho os pedidos pendentes sao atribuidos aos taxis livres de uma so
+# vez, pela atribuicao otima (algoritmo hungaro) sobre a matriz de distancias de recolha.
+# Com trafego (MotorSimulacao.usar_trafego) essa matriz e de tempos; a autonomia, os desvios e a
+# partilha continuam em metros (MatrizHubs.entre_hubs_metros e os metros de MatrizHubs.colunas).
+#
+# Com partilha=True cada pedido tenta primeiro entrar no plano de paradas de um taxi em servico
+# proximo, na posicao (recolha, entrega) mais barata que respeite a capacidade, o desvio maximo
+# de cada passageiro e a margem de autonomia; os restantes seguem para a atribuicao em lote.
+
+SEGUNDOS_POR_PASSO = 10.0
+CUSTO_INVIAVEL = 1e9
+# probabilidade de um pedido ser de 1, 2 ou 3 passageiros
+PROBABILIDADE_PASSAGEIROS = (0.7, 0.2, 0.1)
+# arrays do Despachante com uma linha por pedido (so dos pedidos a partir de primeiro_pedido)
+COLUNAS_PEDIDO = ("chegada", "passageiros", "viagem_maxima", "odometro_recolha", "proxima_partilha", "em_curso")
+
+
+def _atribuicao_hungara(custos):
+    # algoritmo hungaro com potenciais (O(n^2 m)), para quando o scipy nao esta disponivel; n <= m
+    n, m = custos.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    linha_da_coluna = np.zeros(m + 1, dtype=np.int64)
+    anterior = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        linha_da_coluna[0] = i
+        j0 = 0
+        minimo = np.full(m + 1, np.inf)
+        usada = np.zeros(m + 1, dtype=bool)
+        while True:
+            usada[j0] = True
+            i0 = linha_da_coluna[j0]
+            livres = np.flatnonzero(~usada[1:]) + 1
+            reduzidos = custos[i0 - 1, livres - 1] - u[i0] - v[livres]
+            melhora = reduzidos < minimo[livres]
+            minimo[livres[melhora]] = reduzidos[melhora]
+            anterior[livres[melhora]] = j0
+            j1 = livres[np.argmin(minimo[livres])]
+            delta = minimo[j1]
+            u[linha_da_coluna[usada]] += delta
+            v[usada] -= delta
+            minimo[~usada] -= delta
+            j0 = j1
+            if linha_da_coluna[j0] == 0:
+                break
+        while j0:
+            j1 = anterior[j0]
+            linha_da_coluna[j0] = linha_da_coluna[j1]
+            j0 = j1
+
+    colunas = np.flatnonzero(linha_da_coluna[1:])
+    linhas = linha_da_coluna[colunas + 1] - 1
+    ordem = np.argsort(linhas)
+    return linhas[ordem], colunas[ordem]
+
+
+def atribuicao_otima(custos):
+    """Pares (linhas, colunas) de custo total minimo; cada linha e cada coluna usada no maximo uma vez."""
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(custos)
+    if custos.shape[0] <= custos.shape[1]:
+        return _atribuicao_hungara(custos)
+    colunas, linhas = _atribuicao_hungara(custos.T)
+    ordem = np.argsort(linhas)
+    return linhas[ordem], colunas[ordem]
+
+
+class GeradorPedidos:
+    """Chegadas de Poisson em cada zona; o destino e outra zona escolhida ao acaso.
+
+    Com `origens` (indices de zonas) so essas zonas geram pedidos, a mesma taxa por zona; os
+    destinos continuam a ser qualquer uma das num_zonas."""
+
+    def __init__(self, num_zonas, pedidos_por_hora, segundos_por_passo=SEGUNDOS_POR_PASSO, semente=None,
+                 origens=None):
+        self.num_zonas = num_zonas
+        self.taxa_por_passo = pedidos_por_hora * segundos_por_passo / 3600.0 / max(num_zonas, 1)
+        self.origens = None if origens is None else np.asarray(origens, dtype=np.int64)
+        self.rng = np.random.default_rng(semente)
+
+    def gerar(self, passo_inicio, passo_fim):
+        """Pedidos que chegam nos passos [passo_inicio, passo_fim).
+
+        Devolve (zonas de origem, zonas de destino, passos de chegada, numero de passageiros)."""
+        passos = max(passo_fim - passo_inicio, 0)
+        if self.num_zonas < 2 or passos == 0:
+            vazio = np.array([], dtype=np.int64)
+            return vazio, vazio, vazio, vazio
+        colunas = self.num_zonas if self.origens is None else len(self.origens)
+        contagens = self.rng.poisson(self.taxa_por_passo, size=(passos, colunas))
+        linhas, origens = np.nonzero(contagens)
+        repeticoes = contagens[linhas, origens]
+        if self.origens is not None:
+            origens = self.origens[origens]
+        origens = np.repeat(origens, repeticoes)
+        chegadas = np.repeat(linhas + passo_inicio, repeticoes)
+        destinos = (origens + self.rng.integers(1, self.num_zonas, len(origens))) % self.num_zonas
+        passageiros = self.rng.choice(np.arange(1, len(PROBABILIDADE_PASSAGEIROS) + 1), len(origens),
+                                      p=PROBABILIDADE_PASSAGEIROS)
+        return origens, destinos, chegadas, passageiros
+
+
+class Despachante:
+    def __init__(self, grafo, pontos_recolha, pedidos_por_hora=1000, janela=1, espera_maxima_s=900,
+                 segundos_por_passo=SEGUNDOS_POR_PASSO, semente=None, partilha=False, desvio_maximo=0.5,
+                 raio_partilha=1500, max_candidatos=8, intervalo_partilha=6, zonas_origem=None):
+        nos = mh.nos_de(grafo, pontos_recolha)
+        self.tabelas = mh.obter_matriz(grafo, nos)
+        # zonas_origem: so estas zonas (indices em pontos_recolha) geram pedidos (ver motor_repartido)
+        self.gerador = GeradorPedidos(len(nos), pedidos_por_hora, segundos_por_passo, semente, zonas_origem)
+        self.janela = max(int(janela), 1)
+        self.espera_maxima = espera_maxima_s / segundos_por_passo
+        self.segundos_por_passo = segundos_por_passo
+        self._proximo_passo_gerado = 0
+        self._entre_zonas = self.tabelas.entre_hubs_metros.tolist()
+
+        # partilha de viagens: desvio relativo maximo de cada passageiro e poda dos candidatos
+        self.partilha = partilha
+        self.desvio_maximo = desvio_maximo
+        self.raio_partilha = raio_partilha
+        self.max_candidatos = max_candidatos
+        # um pedido que nao coube em nenhum taxi so volta a ser tentado passados intervalo_partilha passos
+        self.intervalo_partilha = intervalo_partilha
+        # cada passo avanca uma aresta: converte esperas (passos) em distancia
+        self.metros_por_passo = float(np.mean(grafo.comprimentos)) if grafo.num_arestas else 1.0
+        self._ate_posto_zonas = None
+
+        # pedidos pendentes (por atribuir)
+        self.pendentes_id = np.array([], dtype=np.int64)
+        self.pendentes_origem = np.array([], dtype=np.int64)
+        self.pendentes_destino = np.array([], dtype=np.int64)
+        # por pedido: passo de chegada, passageiros, distancia maxima em viagem, odometro do taxi no
+        # momento da recolha, proximo passo em que tenta a partilha e se ainda esta em curso (por
+        # atribuir, ou atribuido e por entregar). A linha do pedido p e p - primeiro_pedido; os
+        # arrays tem folga no fim e os pedidos terminados do inicio sao descartados (ver _reservar)
+        self.primeiro_pedido = 0
+        self.chegada = np.array([], dtype=np.int64)
+        self.passageiros = np.array([], dtype=np.int64)
+        self.viagem_maxima = np.array([], dtype=np.float64)
+        self.odometro_recolha = np.array([], dtype=np.float64)
+        self.proxima_partilha = np.array([], dtype=np.int64)
+        self.em_curso = np.array([], dtype=bool)
+
+        self.gerados = 0
+        self.atribuidos = 0
+        self.recolhidos = 0
+        self.concluidos = 0
+        self.abandonados = 0
+        self.partilhados = 0
+        # histograma das esperas ate a recolha: esperas[k] = pedidos recolhidos k passos depois de
+        # chegarem (o tamanho e o da maior espera, nao o numero de pedidos)
+        self.esperas = np.zeros(0, dtype=np.int64)
+        self.ultimo_passo = 0
+
+    def usar_tabelas(self, tabelas):
+        """Passa a usar outra matriz das mesmas zonas (por exemplo, a dos pesos de outra hora)."""
+        self.tabelas = tabelas
+        self._entre_zonas = tabelas.entre_hubs_metros.tolist()
+
+    def _reservar(self, novos):
+        """Garante espaco para mais `novos` pedidos nos arrays de COLUNAS_PEDIDO.
+
+        Quando enchem, descarta os pedidos ja terminados do inicio e, se isso nao deixar pelo menos
+        metade livre, duplica a capacidade: cada pedido custa O(1) amortizado, em vez de copiar todos
+        os pedidos gerados ate agora, e o checkpoint so leva os pedidos a partir do mais antigo em curso."""
+        usados = self.gerados - self.primeiro_pedido
+        capacidade = len(self.chegada)
+        if usados + novos <= capacidade:
+            return
+        em_curso = np.flatnonzero(self.em_curso[:usados])
+        inicio = int(em_curso[0]) if len(em_curso) else usados
+        restantes = usados - inicio
+        if restantes + novos > capacidade // 2:
+            capacidade = max(2 * capacidade, 2 * (restantes + novos), 64)
+        for nome in COLUNAS_PEDIDO:
+            antigo = getattr(self, nome)
+            novo = np.empty(capacidade, dtype=antigo.dtype)
+            novo[:restantes] = antigo[inicio:usados]
+            setattr(self, nome, novo)
+        self.primeiro_pedido += inicio
+
+    def _gerar(self, passo):
+        origens, destinos, chegadas, passageiros = self.gerador.gerar(self._proximo_passo_gerado, passo + 1)
+        self._proximo_passo_gerado = passo + 1
+        if not len(origens):
+            return
+        self._reservar(len(origens))
+        ids = np.arange(self.gerados, self.gerados + len(origens))
+        linhas = slice(self.gerados - self.primeiro_pedido, self.gerados - self.primeiro_pedido + len(origens))
+        self.gerados += len(origens)
+        self.chegada[linhas] = chegadas
+        self.passageiros[linhas] = passageiros
+        self.viagem_maxima[linhas] = self.tabelas.entre_hubs_metros[origens, destinos] * (1 + self.desvio_maximo)
+        self.odometro_recolha[linhas] = np.nan
+        self.proxima_partilha[linhas] = chegadas
+        self.em_curso[linhas] = True
+        self.pendentes_id = np.concatenate((self.pendentes_id, ids))
+        self.pendentes_origem = np.concatenate((self.pendentes_origem, origens))
+        self.pendentes_destino = np.concatenate((self.pendentes_destino, destinos))
+
+    def _manter_pendentes(self, mascara):
+        self.pendentes_id = self.pendentes_id[mascara]
+        self.pendentes_origem = self.pendentes_origem[mascara]
+        self.pendentes_destino = self.pendentes_destino[mascara]
+
+    def _custos(self, motor, livres):
+        """Matriz (pedidos x taxis) com a distancia de recolha, ou CUSTO_INVIAVEL se nao houver autonomia."""
+        frota = motor.frota
+        motor._garantir_tabela_postos()
+        origens, destinos = self.pendentes_origem, self.pendentes_destino
+        # uma linha da tabela por zona de origem distinta, repetida pelos pedidos dessa zona
+        zonas, linha_da_zona = np.unique(origens, return_inverse=True)
+        distancias, metros = self.tabelas.colunas(frota.no_decisao(livres))
+        custos = distancias[zonas][linha_da_zona]
+        recolha = metros[zonas][linha_da_zona]
+
+        # recolha + viagem + (destino -> posto do tipo do taxi), com a margem de
+        # verificar_e_atribuir_abastecimento, tem de caber na autonomia
+        viagem = self.tabelas.entre_hubs_metros[origens, destinos]
+        nos_destino = self.tabelas.nos[destinos]
+        ate_posto = np.stack([motor.tabela_postos[tipo][0][nos_destino] for tipo in fr.NOMES_MOTOR], axis=1)
+        folga = frota.autonomia[livres] / (motor.FATOR_CONSUMO * 1.10)
+        limite = folga[None, :] - (viagem[:, None] + ate_posto)[:, frota.motor[livres]]
+        custos[recolha >= limite] = CUSTO_INVIAVEL
+        passageiros = self.passageiros[self.pendentes_id - self.primeiro_pedido]
+        custos[passageiros[:, None] > frota.capacidade[livres][None, :]] = CUSTO_INVIAVEL
+        return custos
+
+    def _atribuir(self, motor):
+        frota = motor.frota
+        livres = np.flatnonzero((frota.estado == fr.LIVRE) & (frota.autonomia > 0))
+        if not len(livres) or not len(self.pendentes_id):
+            return
+        custos = self._custos(motor, livres)
+
+        # com P pedidos basta considerar os P taxis mais baratos de cada pedido: numa atribuicao
+        # otima que use outro taxi, um desses P esta livre e nao e mais caro, logo podia ser trocado
+        p = len(self.pendentes_id)
+        if custos.shape[1] > p:
+            colunas = np.unique(np.argpartition(custos, p - 1, axis=1)[:, :p])
+            custos, livres = custos[:, colunas], livres[colunas]
+
+        linhas, colunas = atribuicao_otima(custos)
+        validos = custos[linhas, colunas] < CUSTO_INVIAVEL
+        linhas, colunas = linhas[validos], colunas[validos]
+
+        nos = self.tabelas.nos
+        for k, i in zip(linhas, livres[colunas]):
+            pedido = int(self.pendentes_id[k])
+            frota.estado[i] = fr.EM_SERVICO
+            frota.paradas[i] = [(int(nos[self.pendentes_origem[k]]), pedido, True),
+                                (int(nos[self.pendentes_destino[k]]), pedido, False)]
+            frota.rotas[i] = None
+        self.atribuidos += len(linhas)
+
+        atribuido = np.zeros(p, dtype=bool)
+        atribuido[linhas] = True
+        self._manter_pendentes(~atribuido)
+        self.seguir_paradas(motor, livres[colunas])
+
+    def _custo_plano(self, plano, taxi, pedidos, carga):
+        """Distancia para cumprir o plano [(zona, pedido, recolha)...] a partir da posicao do taxi,
+        ou None se exceder a capacidade, a espera ou o desvio maximo de algum passageiro, ou a autonomia."""
+        capacidade, percorrido, autonomia_util, ate_posto, da_posicao = taxi
+        inicio_viagem = {}
+        total = 0.0
+        anterior = None
+        for zona, pedido, recolha in plano:
+            total += da_posicao[zona] if anterior is None else self._entre_zonas[anterior][zona]
+            anterior = zona
+            passageiros, viagem_maxima, odometro, recolha_maxima = pedidos[pedido]
+            if recolha:
+                carga += passageiros
+                if carga > capacidade or total > recolha_maxima:
+                    return None
+                inicio_viagem[pedido] = total
+            else:
+                carga -= passageiros
+                if pedido in inicio_viagem:
+                    em_viagem = total - inicio_viagem[pedido]
+                else:
+                    em_viagem = total + percorrido - odometro
+                if em_viagem > viagem_maxima:
+                    return None
+
+        if total + ate_posto[anterior] >= autonomia_util:
+            return None
+        return total
+
+    def _melhor_insercao(self, motor, i, pedido, origem, destino, ate_zonas):
+        """(aumento de distancia, plano) da insercao mais barata do pedido no plano do taxi, ou None.
+        `ate_zonas` sao os metros do taxi ate cada zona (a sua coluna das tabelas)."""
+        frota = motor.frota
+        zona_do_no = self.tabelas.hub_do_no
+        plano = [(zona_do_no[no], p, recolha) for no, p, recolha in frota.paradas[i]]
+
+        # limites de cada pedido do plano em valores Python (o ciclo de avaliacao e puro Python)
+        pedidos = {}
+        for p in {p for _, p, _ in plano} | {pedido}:
+            # distancia que o taxi ainda pode fazer antes da recolha sem exceder a espera maxima
+            linha = p - self.primeiro_pedido
+            folga_espera = self.chegada[linha] + self.espera_maxima - motor.passo_atual
+            pedidos[p] = (int(self.passageiros[linha]), float(self.viagem_maxima[linha]),
+                          float(self.odometro_recolha[linha]), folga_espera * self.metros_por_passo)
+        recolhas_por_fazer = {p for _, p, recolha in plano if recolha}
+        carga = sum(pedidos[p][0] for _, p, recolha in plano if not recolha and p not in recolhas_por_fazer)
+        taxi = (int(frota.capacidade[i]), float(frota.distancia[i]),
+                float(frota.autonomia[i]) / (motor.FATOR_CONSUMO * 1.10),
+                self._ate_posto_zonas[frota.motor[i]], ate_zonas.tolist())
+
+        custo_atual = self._custo_plano(plano, taxi, pedidos, carga)
+        if custo_atual is None:
+            return None
+        melhor = None
+        recolha, entrega = (origem, pedido, True), (destino, pedido, False)
+        for a in range(len(plano) + 1):
+            for b in range(a, len(plano) + 1):
+                novo = plano[:a] + [recolha] + plano[a:b] + [entrega] + plano[b:]
+                custo = self._custo_plano(novo, taxi, pedidos, carga)
+                if custo is not None and (melhor is None or custo - custo_atual < melhor[0]):
+                    melhor = (custo - custo_atual, novo)
+        return melhor
+
+    def _inserir_em_servico(self, motor):
+        """Partilha: insere pedidos pendentes nos planos de taxis em servico quando isso custa
+        menos distancia do que mandar o taxi livre mais proximo."""
+        frota = motor.frota
+        passo = motor.passo_atual
+        ocupados = np.flatnonzero(frota.estado == fr.EM_SERVICO)
+        a_tentar = np.flatnonzero(self.proxima_partilha[self.pendentes_id - self.primeiro_pedido] <= passo)
+        if not len(ocupados) or not len(a_tentar):
+            return
+        motor._garantir_tabela_postos()
+        nos = self.tabelas.nos
+        self._ate_posto_zonas = [motor.tabela_postos[tipo][0][nos].tolist() for tipo in fr.NOMES_MOTOR]
+        # metros de cada taxi (em servico, e livre) ate cada zona
+        _, metros_ocupados = self.tabelas.colunas(frota.no_decisao(ocupados))
+        _, metros_livres = self.tabelas.colunas(frota.no_decisao((frota.estado == fr.LIVRE) & (frota.autonomia > 0)))
+
+        inserido = np.zeros(len(self.pendentes_id), dtype=bool)
+        for k in a_tentar:
+            pedido = int(self.pendentes_id[k])
+            origem, destino = int(self.pendentes_origem[k]), int(self.pendentes_destino[k])
+            self.proxima_partilha[pedido - self.primeiro_pedido] = passo + self.intervalo_partilha
+
+            # so taxis a menos de raio_partilha da recolha, e no maximo max_candidatos
+            ate_recolha = metros_ocupados[origem]
+            perto = np.flatnonzero(ate_recolha <= self.raio_partilha)
+            if len(perto) > self.max_candidatos:
+                perto = perto[np.argpartition(ate_recolha[perto], self.max_candidatos - 1)[:self.max_candidatos]]
+            if not len(perto):
+                continue
+
+            # alternativa: o taxi livre mais proximo vai buscar o passageiro e leva-o
+            alternativa = float("inf")
+            if metros_livres.shape[1]:
+                alternativa = self._entre_zonas[origem][destino] + metros_livres[origem].min()
+
+            melhor = None
+            for j in perto:
+                i = ocupados[j]
+                insercao = self._melhor_insercao(motor, i, pedido, origem, destino, metros_ocupados[:, j])
+                if insercao is not None and (melhor is None or insercao[0] < melhor[0]):
+                    melhor = (insercao[0], i, insercao[1])
+            if melhor is None or melhor[0] >= alternativa:
+                continue
+
+            _, i, plano = melhor
+            frota.paradas[i] = [(int(nos[zona]), p, recolha) for zona, p, recolha in plano]
+            frota.rotas[i] = None
+            self.seguir_paradas(motor, np.array([i]))
+            inserido[k] = True
+
+        self.partilhados += int(inserido.sum())
+        self.atribuidos += int(inserido.sum())
+        self._manter_pendentes(~inserido)
+
+    def _libertar_sem_energia(self, motor):
+        """Pedidos dos taxis que ficaram sem energia em servico: os passageiros a bordo desistem e os
+        pedidos por recolher voltam a estar pendentes, com a mesma chegada (e a mesma espera maxima)."""
+        frota = motor.frota
+        parados = [i for i in np.flatnonzero(frota.estado == fr.SEM_ENERGIA).tolist() if frota.paradas[i]]
+        if not parados:
+            return
+        zona_do_no = self.tabelas.hub_do_no
+        ids, origens, destinos = [], [], []
+        for i in parados:
+            recolhas = {pedido: no for no, pedido, recolha in frota.paradas[i] if recolha}
+            for no, pedido, recolha in frota.paradas[i]:
+                if recolha:
+                    continue
+                if pedido in recolhas:
+                    ids.append(pedido)
+                    origens.append(zona_do_no[recolhas[pedido]])
+                    destinos.append(zona_do_no[no])
+                else:
+                    self.abandonados += 1
+                    self.em_curso[pedido - self.primeiro_pedido] = False
+            frota.paradas[i] = []
+            frota.rotas[i] = None
+            frota.objetivo[i] = -1
+        if ids:
+            ids = np.array(ids, dtype=np.int64)
+            self.atribuidos -= len(ids)
+            self.proxima_partilha[ids - self.primeiro_pedido] = motor.passo_atual
+            self.pendentes_id = np.concatenate((self.pendentes_id, ids))
+            self.pendentes_origem = np.concatenate((self.pendentes_origem, np.array(origens, dtype=np.int64)))
+            self.pendentes_destino = np.concatenate((self.pendentes_destino, np.array(destinos, dtype=np.int64)))
+
+    def processar(self, motor):
+        """Chegada de pedidos, pedidos de taxis sem energia, desistencias e atribuicao aos taxis
+        livres (no inicio de um passo)."""
+        passo = motor.passo_atual
+        self.ultimo_passo = passo
+        self._gerar(passo)
+        self._libertar_sem_energia(motor)
+
+        desistem = (passo - self.chegada[self.pendentes_id - self.primeiro_pedido]) > self.espera_maxima
+        if desistem.any():
+            self.abandonados += int(desistem.sum())
+            self.em_curso[self.pendentes_id[desistem] - self.primeiro_pedido] = False
+            self._manter_pendentes(~desistem)
+
+        if self.partilha:
+            self._inserir_em_servico(motor)
+        self._atribuir(motor)
+
+    def _contar_espera(self, espera):
+        if espera >= len(self.esperas):
+            self.esperas = np.concatenate((self.esperas, np.zeros(max(espera + 1, 2 * len(self.esperas))
+                                                                  - len(self.esperas), dtype=np.int64)))
+        self.esperas[espera] += 1
+
+    def seguir_paradas(self, motor, indices):
+        """Faz as paradas no no atual dos taxis em servico sem rota e encaminha-os para a proxima.
+
+        Um taxi a meio de uma aresta so faz paradas quando chegar ao no; a rota parte desse no."""
+        frota = motor.frota
+        passo = motor.passo_atual
+        for i in indices[frota.estado[indices] == fr.EM_SERVICO]:
+            if frota.rotas[i]:
+                continue
+            paradas = frota.paradas[i]
+            posicao = int(frota.no_decisao(i))
+            while paradas and paradas[0][0] == posicao and frota.proximo[i] < 0:
+                _, pedido, recolha = paradas.pop(0)
+                linha = pedido - self.primeiro_pedido
+                if recolha:
+                    self.recolhidos += 1
+                    self.odometro_recolha[linha] = frota.distancia[i]
+                    self._contar_espera(passo - int(self.chegada[linha]))
+                else:
+                    self.concluidos += 1
+                    self.em_curso[linha] = False
+
+            caminho = None
+            if paradas:
+                caminho = self.tabelas.caminho(posicao, self.tabelas.hub_do_no[paradas[0][0]])
+            if caminho is None:
+                # paradas inalcancaveis: os pedidos que faltam deixam de estar em curso
+                for _, pedido, _ in paradas:
+                    self.em_curso[pedido - self.primeiro_pedido] = False
+                frota.estado[i] = fr.LIVRE
+                frota.objetivo[i] = -1
+                frota.paradas[i] = []
+            else:
+                frota.objetivo[i] = paradas[0][0]
+                frota.definir_rota(i, caminho)
+
+    def resumo(self):
+        """Contadores e histograma das esperas, para juntar_estatisticas."""
+        return {
+            "gerados": self.gerados,
+            "pendentes": len(self.pendentes_id),
+            "atribuidos": self.atribuidos,
+            "recolhidos": self.recolhidos,
+            "concluidos": self.concluidos,
+            "abandonados": self.abandonados,
+            "partilhados": self.partilhados,
+            "esperas": self.esperas.copy(),
+            "ultimo_passo": self.ultimo_passo,
+            "segundos_por_passo": self.segundos_por_passo,
+        }
+
+    def estatisticas(self, frota=None):
+        return juntar_estatisticas([self.resumo()], frota)
+
+
+def _percentil(histograma, q):
+    """Percentil q (interpolacao linear, como np.percentile) dos valores k contados em histograma[k]."""
+    acumulado = np.cumsum(histograma)
+    posicao = q / 100.0 * (acumulado[-1] - 1)
+    abaixo = int(posicao)
+    # o valor de ordem r e o primeiro k com mais de r valores ate ele
+    valores = np.searchsorted(acumulado, [abaixo, min(abaixo + 1, acumulado[-1] - 1)], side="right")
+    return valores[0] + (posicao - abaixo) * (valores[1] - valores[0])
+
+
+def juntar_estatisticas(resumos, frota=None):
+    """Estatisticas de varios despachantes (um por regiao) como se fossem um so."""
+    def soma(nome):
+        return sum(r[nome] for r in resumos)
+
+    segundos_por_passo = resumos[0]["segundos_por_passo"]
+    esperas = np.zeros(max(len(r["esperas"]) for r in resumos), dtype=np.int64)
+    for r in resumos:
+        esperas[:len(r["esperas"])] += r["esperas"]
+    recolhas = int(esperas.sum())
+    espera_media = float(esperas @ np.arange(len(esperas))) / recolhas if recolhas else 0.0
+    espera_p90 = float(_percentil(esperas, 90)) if recolhas else 0.0
+    horas = max(max(r["ultimo_passo"] for r in resumos), 1) * segundos_por_passo / 3600.0
+    km = frota.distancia.sum() / 1000.0 if frota is not None else 0.0
+    concluidos = soma("concluidos")
+    return {
+        "pedidos_gerados": soma("gerados"),
+        "pedidos_pendentes": soma("pendentes"),
+        "pedidos_atribuidos": soma("atribuidos"),
+        "pedidos_recolhidos": soma("recolhidos"),
+        "pedidos_concluidos": concluidos,
+        "pedidos_abandonados": soma("abandonados"),
+        "pedidos_partilhados": soma("partilhados"),
+        "pedidos_concluidos_por_hora": concluidos / horas,
+        "espera_media_s": espera_media * segundos_por_passo,
+        "espera_p90_s": espera_p90 * segundos_por_passo,
+        "viagens_por_km": concluidos / km if km else 0.0,
+    }
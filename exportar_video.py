@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+import gestor_mapa as gm
+import trajetoria as tj
+import visualizador as vis
+from grafo_compacto import carregar_grafo
+
+# Exporta uma trajetoria gravada (simulacao_batch.py --trajetoria) para video, sem janela:
+#
+#   python exportar_video.py kpis_trajetoria.npz --saida simulacao.mp4 --fps 30
+#
+# A saida pode ser .mp4 (precisa do ffmpeg no PATH), .gif, ou uma pasta para PNGs numerados.
+# Os frames sao desenhados em paralelo: cada processo desenha o mapa uma vez, guarda-o como
+# fundo e depois, em cada frame, so repoe o fundo e desenha os taxis e o texto por cima. Cada
+# tarefa so descomprime o bloco da trajetoria onde estao os seus frames (trajetoria.ler_blocos).
+
+_estado = {}
+
+
+def _preparar_figura(grafo, pois_frota, zonas, largura, altura, dpi):
+    fig, ax = plt.subplots(figsize=(largura / dpi, altura / dpi), dpi=dpi)
+    if pois_frota is not None:
+        plt.subplots_adjust(left=0.02, right=0.75, top=0.98, bottom=0.02)
+        bombas, carregadores, recolha = gm.filtrar_pontos_com_hierarquia(pois_frota, zonas or {}, 250)
+        vis.desenhar_fundo_mapa(ax, grafo, bombas, carregadores, recolha)
+    else:
+        plt.subplots_adjust(left=0.02, right=0.98, top=0.98, bottom=0.02)
+        vis.desenhar_estradas(ax, grafo, edge_linewidth=0.8, edge_alpha=0.7)
+
+    taxis = ax.scatter([], [], s=30, marker='s', edgecolors='black', linewidths=0.5, zorder=10, animated=True)
+    texto = ax.text(0.01, 0.99, "", transform=ax.transAxes, fontsize=9, family='monospace',
+                    verticalalignment='top', animated=True,
+                    bbox=dict(boxstyle='round', facecolor='white', alpha=0.9, edgecolor='gray'))
+    fig.canvas.draw()
+    return fig, ax, taxis, texto, fig.canvas.copy_from_bbox(fig.bbox)
+
+
+def _iniciar_trabalhador(ficheiro_trajetoria, ficheiro_grafo, ficheiro_pois, ficheiro_zonas, pasta,
+                         largura, altura, dpi):
+    grafo = carregar_grafo(ficheiro_grafo)
+    pois_frota = zonas = None
+    if ficheiro_pois:
+        with open(ficheiro_pois, "r", encoding="utf-8") as f:
+            pois_frota = json.load(f)
+    if ficheiro_zonas:
+        with open(ficheiro_zonas, "r", encoding="utf-8") as f:
+            zonas = json.load(f)
+
+    fig, ax, taxis, texto, fundo = _preparar_figura(grafo, pois_frota, zonas, largura, altura, dpi)
+    _estado.update(ficheiro_trajetoria=ficheiro_trajetoria, grafo=grafo, pasta=pasta, fig=fig, ax=ax, taxis=taxis,
+                   texto=texto, fundo=fundo, cores=matplotlib.colors.to_rgba_array(vis.CORES_ESTADO))
+
+
+def _desenhar_frames(tarefa):
+    """Desenha os frames (numero do ficheiro, indice no bloco) de um bloco da trajetoria, lendo so esse
+    bloco. tarefa = (numero do bloco, frames). Devolve quantos escreveu."""
+    numero_bloco, frames = tarefa
+    bloco = next(tj.ler_blocos(_estado["ficheiro_trajetoria"], ("posicoes", "estados"), [numero_bloco]))
+    grafo = _estado["grafo"]
+    fig, ax, taxis, texto = _estado["fig"], _estado["ax"], _estado["taxis"], _estado["texto"]
+    for numero, k in frames:
+        estados = bloco["estados"][k]
+        visiveis = np.flatnonzero(estados != vis.SEM_ENERGIA)
+        posicoes = bloco["posicoes"][k][visiveis]
+        taxis.set_offsets(np.column_stack((grafo.x[posicoes], grafo.y[posicoes])))
+        taxis.set_facecolors(_estado["cores"][estados[visiveis]])
+        contagens = np.bincount(estados, minlength=len(vis.NOMES_ESTADO_PAINEL))
+        texto.set_text(f"passo {bloco['passos'][k]}\n"
+                       + "\n".join(f"{nome}: {n}" for nome, n in zip(vis.NOMES_ESTADO_PAINEL, contagens)))
+
+        fig.canvas.restore_region(_estado["fundo"])
+        ax.draw_artist(taxis)
+        ax.draw_artist(texto)
+        imagem = np.asarray(fig.canvas.buffer_rgba())
+        Image.fromarray(imagem[:, :, :3]).save(os.path.join(_estado["pasta"], f"frame_{numero:06d}.png"),
+                                               compress_level=1)
+    return len(frames)
+
+
+def _tarefas(ficheiro_trajetoria, salto, tamanho_tarefa):
+    """(numero do bloco, [(numero do frame, indice no bloco), ...]) de um frame em cada `salto`, com ate
+    tamanho_tarefa frames por tarefa. So le os passos de cada bloco, para saber quantos frames tem."""
+    tarefas, inicio, numero = [], 0, 0
+    for b, bloco in enumerate(tj.ler_blocos(ficheiro_trajetoria, colunas=())):
+        fim = inicio + len(bloco["passos"])
+        primeiro = -(-inicio // salto) * salto
+        frames = []
+        for k in range(primeiro, fim, salto):
+            frames.append((numero, k - inicio))
+            numero += 1
+        tarefas += [(b, frames[i:i + tamanho_tarefa]) for i in range(0, len(frames), tamanho_tarefa)]
+        inicio = fim
+    return tarefas
+
+
+def _escrever_gif(pasta, saida, fps, num_frames):
+    # um frame de cada vez, com uma unica paleta (a do primeiro frame) para todos: as cores do mapa
+    # e dos estados nao mudam
+    primeiro = Image.open(os.path.join(pasta, "frame_000000.png")).quantize(colors=255)
+    cabecalho, _ = GifImagePlugin.getheader(primeiro, info={"loop": 0})
+    with open(saida, "wb") as f:
+        f.write(b"".join(cabecalho))
+        for n in range(num_frames):
+            frame = primeiro
+            if n:
+                frame = Image.open(os.path.join(pasta, f"frame_{n:06d}.png")).quantize(palette=primeiro, dither=0)
+            f.write(b"".join(GifImagePlugin.getdata(frame, duration=int(1000 / fps))))
+        f.write(b";")
+
+
+def _juntar_video(pasta, saida, fps, num_frames):
+    if saida.lower().endswith(".gif"):
+        _escrever_gif(pasta, saida, fps, num_frames)
+        return
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("Para exportar .mp4 e preciso o ffmpeg no PATH (alternativas: .gif ou uma pasta de PNGs).")
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps),
+                    "-i", os.path.join(pasta, "frame_%06d.png"),
+                    "-c:v", "libx264", "-pix_fmt", "yuv420p", saida], check=True)
+
+
+def exportar(ficheiro_trajetoria, saida, ficheiro_grafo=None, ficheiro_pois=None, ficheiro_zonas=None,
+             fps=20, salto=1, processos=None, largura=1280, altura=720, dpi=100):
+    """Desenha um frame a cada `salto` gravacoes da trajetoria e escreve o video (ou os PNGs). Devolve o numero de frames."""
+    cabecalho = tj.ler_cabecalho(ficheiro_trajetoria)
+    ficheiro_grafo = ficheiro_grafo or cabecalho["ficheiro_grafo"]
+    salto = max(int(salto), 1)
+    num_frames = len(range(0, cabecalho["frames"], salto))
+    if not num_frames:
+        raise ValueError(f"A trajetoria '{ficheiro_trajetoria}' nao tem frames.")
+    # verificado aqui e nao nos processos: um erro no inicializador so chegaria como BrokenProcessPool
+    # (e a cache fica construida antes de os processos a lerem)
+    if cabecalho["hash_grafo"] and cabecalho["hash_grafo"] != carregar_grafo(ficheiro_grafo).hash_conteudo():
+        raise ValueError(f"A trajetoria '{ficheiro_trajetoria}' foi gravada com outro grafo que nao '{ficheiro_grafo}'.")
+
+    video = saida.lower().endswith((".mp4", ".gif"))
+    pasta = tempfile.mkdtemp(prefix="frames_") if video else saida
+    os.makedirs(pasta, exist_ok=True)
+    try:
+        processos = processos or os.cpu_count() or 1
+        tarefas = _tarefas(ficheiro_trajetoria, salto, max(1, -(-num_frames // (processos * 4))))
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_trabalhador,
+                                 initargs=(ficheiro_trajetoria, ficheiro_grafo, ficheiro_pois, ficheiro_zonas,
+                                           pasta, largura, altura, dpi)) as executor:
+            escritos = sum(executor.map(_desenhar_frames, tarefas))
+        if video:
+            _juntar_video(pasta, saida, fps, escritos)
+    finally:
+        if video:
+            shutil.rmtree(pasta, ignore_errors=True)
+    return escritos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta uma trajetoria gravada para MP4/GIF/PNGs, sem janela")
+    parser.add_argument("trajetoria", help="ficheiro .npz gravado com simulacao_batch.py --trajetoria")
+    parser.add_argument("--saida", default="simulacao.mp4", help=".mp4, .gif ou pasta para PNGs")
+    parser.add_argument("--grafo", default=None, help="por omissao, o grafo indicado na trajetoria")
+    parser.add_argument("--pois", default=None, help="POIs da frota para desenhar no fundo (opcional)")
+    parser.add_argument("--zonas", default=None, help="zonas de recolha para desenhar no fundo (opcional)")
+    parser.add_argument("--fps", type=int, default=20)
+    parser.add_argument("--salto", type=int, default=1, help="desenhar uma gravacao em cada N")
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--largura", type=int, default=1280)
+    parser.add_argument("--altura", type=int, default=720)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    frames = exportar(args.trajetoria, args.saida, args.grafo, args.pois, args.zonas, args.fps, args.salto,
+                      args.processos, args.largura, args.altura)
+    duracao = time.perf_counter() - t0
+    print(f"{frames} frames em {duracao:.1f}s ({frames / max(duracao, 1e-9):.1f} frames/s) -> {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
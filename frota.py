@@ -0,0 +1,290 @@
+import numpy as np
+
+# Estado da frota guardado em arrays NumPy (um elemento por taxi), para que
+# movimento, consumo e carregamento sejam feitos de uma vez para todos os taxis.
+
+LIVRE, A_ABASTECER, SEM_ENERGIA, EM_SERVICO = 0, 1, 2, 3
+NOMES_ESTADO = ("livre", "a_abastecer", "sem_energia", "em_servico")
+CODIGOS_ESTADO = {nome: codigo for codigo, nome in enumerate(NOMES_ESTADO)}
+
+GASOLINA, ELETRICO = 0, 1
+NOMES_MOTOR = ("gasolina", "eletrico")
+
+TAMANHO_HISTORICO = 20
+LIMIAR_ABASTECIMENTO = 0.20
+
+# arrays da Frota com um elemento (ou linha) por taxi; rotas e paradas sao listas a parte
+COLUNAS = ("ids", "motor", "capacidade", "posicao", "objetivo", "estado", "autonomia_max", "autonomia",
+           "custo", "co2", "distancia", "custo_por_km", "emissao_por_km", "velocidade_carregamento",
+           "historico", "posicao_historico", "proximo", "progresso", "comprimento_aresta")
+
+_C1 = np.uint64(0x9E3779B97F4A7C15)
+_C2 = np.uint64(0xBF58476D1CE4E5B9)
+_C3 = np.uint64(0x94D049BB133111EB)
+
+
+def sorteio_uniforme(semente, chaves, contador):
+    """Numeros em [0, 1) que so dependem de (semente, chave, contador) (hash splitmix64).
+
+    Cada taxi (chave = id) tira sempre o mesmo numero no mesmo passo, seja qual for
+    a ordem ou o agrupamento em que os taxis sao processados."""
+    with np.errstate(over="ignore"):
+        x = np.asarray(chaves, dtype=np.uint64) * _C2
+        x ^= np.asarray(contador, dtype=np.uint64) * _C3
+        x ^= np.uint64(semente & 0xFFFFFFFFFFFFFFFF)
+        x += _C1
+        x = (x ^ (x >> np.uint64(30))) * _C2
+        x = (x ^ (x >> np.uint64(27))) * _C3
+        x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+class Rota:
+    """Caminho a percorrer (nos seguintes, sem o no de partida) com um cursor e as distancias
+    acumuladas desde a partida: avancar e saber quanto falta sao O(1)."""
+
+    __slots__ = ("nos", "acumulado", "cursor")
+
+    def __init__(self, nos, acumulado):
+        self.nos = nos
+        self.acumulado = acumulado  # acumulado[k] = metros da partida ate nos[k - 1]; acumulado[0] = 0
+        self.cursor = 0
+
+    @classmethod
+    def de_caminho(cls, grafo, partida, nos):
+        nos = np.asarray(nos, dtype=np.int32)
+        anteriores = np.concatenate(([partida], nos[:-1]))
+        acumulado = np.zeros(len(nos) + 1, dtype=np.float64)
+        np.cumsum(grafo.comprimentos_arestas(anteriores, nos), out=acumulado[1:])
+        return cls(nos, acumulado)
+
+    def __len__(self):
+        return len(self.nos) - self.cursor
+
+    def avancar(self):
+        """Passa ao no seguinte; devolve (no, comprimento da aresta ate ele)."""
+        k = self.cursor
+        self.cursor = k + 1
+        return int(self.nos[k]), float(self.acumulado[k + 1] - self.acumulado[k])
+
+    def restante(self):
+        """Metros desde o ultimo no alcancado ate ao fim da rota."""
+        return float(self.acumulado[-1] - self.acumulado[self.cursor])
+
+    def nos_restantes(self):
+        return self.nos[self.cursor:]
+
+
+class Frota:
+    def __init__(self, grafo, configs, posicoes_iniciais):
+        n = len(configs)
+        self.grafo = grafo
+        self.ids = np.array([c["id"] for c in configs], dtype=np.int64)
+        self.motor = np.array([NOMES_MOTOR.index(c["tipo_motor"]) for c in configs], dtype=np.int8)
+        self.capacidade = np.array([c["capacidade"] for c in configs], dtype=np.int16)
+
+        self.posicao = np.asarray(posicoes_iniciais, dtype=np.int32).copy()
+        self.objetivo = np.full(n, -1, dtype=np.int32)
+        self.estado = np.full(n, LIVRE, dtype=np.int8)
+
+        self.autonomia_max = np.array([c["autonomia_max"] * 1000.0 for c in configs], dtype=np.float64)
+        self.autonomia = self.autonomia_max.copy()
+        self.custo = np.zeros(n, dtype=np.float64)
+        self.co2 = np.zeros(n, dtype=np.float64)
+        self.distancia = np.zeros(n, dtype=np.float64)  # metros percorridos
+
+        eletrico = self.motor == ELETRICO
+        self.custo_por_km = np.where(eletrico, 0.06, 0.30)
+        self.emissao_por_km = np.where(eletrico, 0.0, 0.11)
+        self.velocidade_carregamento = np.where(eletrico, 500.0, self.autonomia_max)
+
+        # historico circular das ultimas posicoes (detecao de taxis presos)
+        self.historico = np.full((n, TAMANHO_HISTORICO), -1, dtype=np.int32)
+        self.posicao_historico = np.zeros(n, dtype=np.int32)
+
+        # rota de cada taxi (Rota, ou None); com movimento por tempo o taxi pode ir a meio da aresta
+        # posicao -> proximo, com `progresso` metros ja feitos dos `comprimento_aresta` metros
+        self.rotas = [None] * n
+        self.proximo = np.full(n, -1, dtype=np.int32)
+        self.progresso = np.zeros(n, dtype=np.float64)
+        self.comprimento_aresta = np.zeros(n, dtype=np.float64)
+        # paradas de servico por fazer: (no, id do pedido, True = recolha / False = entrega)
+        self.paradas = [[] for _ in range(n)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def no_decisao(self, indices):
+        """No a partir do qual cada taxi pode mudar de caminho: o proximo, se estiver a meio de uma aresta."""
+        proximo = self.proximo[indices]
+        return np.where(proximo >= 0, proximo, self.posicao[indices])
+
+    def definir_rota(self, i, nos):
+        """Rota do taxi i a partir do seu no de decisao pelos `nos` dados. Os caminhos das procuras
+        comecam nesse no, que e tirado aqui (sem um passo do no para ele proprio); os de
+        MatrizHubs.caminho ja vem sem ele."""
+        partida = self.proximo[i] if self.proximo[i] >= 0 else self.posicao[i]
+        if len(nos) and nos[0] == partida:
+            nos = nos[1:]
+        self.rotas[i] = Rota.de_caminho(self.grafo, partida, nos) if len(nos) else None
+
+    def distancia_restante(self, i):
+        """Metros ate ao fim da rota (incluindo o que falta da aresta atual)."""
+        rota = self.rotas[i]
+        falta = self.comprimento_aresta[i] - self.progresso[i] if self.proximo[i] >= 0 else 0.0
+        return falta + (rota.restante() if rota else 0.0)
+
+    def coordenadas(self):
+        """(x, y) de cada taxi, interpoladas ao longo da aresta em que vai."""
+        x, y = self.grafo.x[self.posicao], self.grafo.y[self.posicao]
+        em_aresta = np.flatnonzero(self.proximo >= 0)
+        if len(em_aresta):
+            comprimento = self.comprimento_aresta[em_aresta]
+            fracao = np.divide(self.progresso[em_aresta], comprimento, out=np.ones(len(em_aresta)),
+                               where=comprimento > 0)
+            proximos = self.proximo[em_aresta]
+            x[em_aresta] += fracao * (self.grafo.x[proximos] - x[em_aresta])
+            y[em_aresta] += fracao * (self.grafo.y[proximos] - y[em_aresta])
+        return x, y
+
+    def mover(self, indices, novos_nos, distancias):
+        self.chegar(indices, novos_nos)
+        self.consumir(indices, distancias)
+
+    def chegar(self, indices, novos_nos):
+        linhas = self.posicao_historico[indices]
+        self.historico[indices, linhas] = self.posicao[indices]
+        self.posicao_historico[indices] = (linhas + 1) % TAMANHO_HISTORICO
+        self.posicao[indices] = novos_nos
+
+    def consumir(self, indices, distancias):
+        self.autonomia[indices] -= distancias
+        self.distancia[indices] += distancias
+        km = distancias / 1000.0
+        self.custo[indices] += km * self.custo_por_km[indices]
+        self.co2[indices] += km * self.emissao_por_km[indices]
+
+        sem_energia = indices[self.autonomia[indices] <= 0]
+        self.autonomia[sem_energia] = 0
+        self.estado[sem_energia] = SEM_ENERGIA
+
+    def carregar(self, indices):
+        """Um passo de carregamento. Devolve a mascara dos taxis que ja estavam cheios (terminaram)."""
+        cheios = self.autonomia[indices] >= self.autonomia_max[indices]
+        a_carregar = indices[~cheios]
+        self.autonomia[a_carregar] = np.minimum(
+            self.autonomia[a_carregar] + self.velocidade_carregamento[a_carregar],
+            self.autonomia_max[a_carregar])
+        self.limpar_historico(indices[cheios])
+        return cheios
+
+    def limpar_historico(self, indices):
+        self.historico[indices] = -1
+        self.posicao_historico[indices] = 0
+
+    def contagem_no_historico(self, indices):
+        return (self.historico[indices] == self.posicao[indices, None]).sum(axis=1)
+
+    def precisam_abastecer(self):
+        mascara = ((self.estado == LIVRE) & (self.autonomia > 0)
+                   & (self.autonomia <= self.autonomia_max * LIMIAR_ABASTECIMENTO))
+        return np.flatnonzero(mascara)
+
+    def taxis(self):
+        return [Taxi(self, i) for i in range(len(self))]
+
+    def separar(self, indices):
+        """Tira os taxis `indices` desta frota e devolve o seu estado (para juntar noutra frota)."""
+        indices = np.asarray(indices, dtype=np.int64)
+        dados = {nome: getattr(self, nome)[indices] for nome in COLUNAS}
+        dados["rotas"] = [self.rotas[i] for i in indices.tolist()]
+        dados["paradas"] = [self.paradas[i] for i in indices.tolist()]
+        manter = np.ones(len(self), dtype=bool)
+        manter[indices] = False
+        for nome in COLUNAS:
+            setattr(self, nome, getattr(self, nome)[manter])
+        self.rotas = [rota for rota, m in zip(self.rotas, manter.tolist()) if m]
+        self.paradas = [paradas for paradas, m in zip(self.paradas, manter.tolist()) if m]
+        return dados
+
+    def juntar(self, dados):
+        """Acrescenta ao fim da frota os taxis devolvidos por separar."""
+        for nome in COLUNAS:
+            setattr(self, nome, np.concatenate((getattr(self, nome), dados[nome])))
+        self.rotas.extend(dados["rotas"])
+        self.paradas.extend(dados["paradas"])
+
+
+class Taxi:
+    """Vista de um taxi da Frota, com a interface antiga (usada pela consola e pelo visualizador)."""
+
+    def __init__(self, frota, i):
+        self.frota = frota
+        self.i = i
+
+    @property
+    def id(self):
+        return int(self.frota.ids[self.i])
+
+    @property
+    def tipo_motor(self):
+        return NOMES_MOTOR[self.frota.motor[self.i]]
+
+    @property
+    def capacidade(self):
+        return int(self.frota.capacidade[self.i])
+
+    @property
+    def posicao_atual(self):
+        return self.frota.grafo.id_no(self.frota.posicao[self.i])
+
+    @property
+    def objetivo_atual(self):
+        objetivo = self.frota.objetivo[self.i]
+        return None if objetivo < 0 else self.frota.grafo.id_no(objetivo)
+
+    @property
+    def rota_atual(self):
+        rota = self.frota.rotas[self.i]
+        return [self.frota.grafo.id_no(no) for no in rota.nos_restantes()] if rota else []
+
+    @property
+    def estado(self):
+        return NOMES_ESTADO[self.frota.estado[self.i]]
+
+    @estado.setter
+    def estado(self, nome):
+        self.frota.estado[self.i] = CODIGOS_ESTADO[nome]
+
+    @property
+    def autonomia_maxima(self):
+        return float(self.frota.autonomia_max[self.i])
+
+    @property
+    def autonomia_atual(self):
+        return float(self.frota.autonomia[self.i])
+
+    @property
+    def custo_total(self):
+        return float(self.frota.custo[self.i])
+
+    @property
+    def emissoes_CO2(self):
+        return float(self.frota.co2[self.i])
+
+    @property
+    def historico_movimento(self):
+        linha = self.frota.historico[self.i]
+        inicio = self.frota.posicao_historico[self.i]
+        ordem = np.concatenate((linha[inicio:], linha[:inicio]))
+        return [self.frota.grafo.id_no(no) for no in ordem if no >= 0]
+
+    def mover_para(self, novo_no, distancia_metros):
+        self.frota.mover(np.array([self.i]), self.frota.grafo.indice[novo_no], distancia_metros)
+
+    def carregar(self):
+        return bool(self.frota.carregar(np.array([self.i]))[0])
+
+    def __repr__(self):
+        km_restantes = self.autonomia_atual / 1000
+        return (f"Taxi {self.id} ({self.tipo_motor}) | Aut: {km_restantes:.1f}km | Est: {self.estado}")
@@ -0,0 +1,300 @@
+import argparse
+import json
+import math
+import os
+import time
+from xml.sax.saxutils import escape
+
+import networkx as nx
+import numpy as np
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import Delaunay
+except ImportError:
+    coo_matrix = connected_components = Delaunay = None
+
+import indice_espacial as ie
+from grafo_compacto import GrafoCompacto, caminho_cache
+
+# Gera cenarios sinteticos (rede de estradas, POIs da frota, zonas de recolha e frota) nos mesmos
+# formatos que gestor_mapa.criar_mapa_base / criar_zonas_recolha e o frota.json, sem internet:
+#
+#   python gerador_sintetico.py --tipo grelha --nos 100000 --taxis 10000 --prefixo sintetico_100k
+#
+# escreve sintetico_100k.graphml (e a cache binaria sintetico_100k.grafo/, para nao ser preciso
+# ler o GraphML), sintetico_100k_pois.json, sintetico_100k_zonas.json e sintetico_100k_frota.json,
+# que se passam a simulacao_batch.py com --grafo/--pois/--zonas/--frota.
+#
+# Tipos de rede: "grelha" (quarteiroes com ruas em falta), "radial" (aneis e avenidas a partir do
+# centro) e "planar" (triangulacao de Delaunay de pontos aleatorios, sem as arestas mais longas).
+# Uma fracao das ruas e de sentido unico; no fim fica so a maior componente fortemente ligada.
+#
+# As ruas tem classes de estrada (o "highway" do OSM, para os perfis de trafego.py): na grelha uma
+# linha em cada ARTERIAS e "primary" e uma em cada ARTERIAS // 2 "secondary"; na radial uma avenida em
+# cada 3 e "primary" e um anel em cada 5 "secondary"; na planar as ruas dentro de faixas de
+# ARTERIAS quarteiroes (corredores) sao "primary". As restantes sao "residential".
+
+CENTRO = (41.1821, -8.6891)  # Matosinhos, como em gestor_mapa
+METROS_POR_GRAU = 111320.0
+
+CLASSES = ("primary", "secondary", "residential")
+PRIMARY, SECONDARY, RESIDENTIAL = range(len(CLASSES))
+ARTERIAS = 8
+
+CATEGORIAS_ZONAS = {"hospitais": 0.05, "hoteis": 0.15, "estacoes_comboio_metro": 0.1, "estacoes_autocarro": 0.1,
+                    "pracas_taxis": 0.1, "restaurantes": 0.3, "supermercados": 0.2}
+
+
+def _pares_unicos(pares, classes):
+    pares = np.sort(np.asarray(pares, dtype=np.int64).reshape(-1, 2), axis=1)
+    classes = np.asarray(classes, dtype=np.int16)
+    diferentes = pares[:, 0] != pares[:, 1]
+    pares, primeiros = np.unique(pares[diferentes], axis=0, return_index=True)
+    return pares, classes[diferentes][primeiros]
+
+
+def _classe_linha(k):
+    # classe das ruas ao longo da linha (ou coluna) k da grelha
+    return np.where(k % ARTERIAS == 0, PRIMARY, np.where(k % (ARTERIAS // 2) == 0, SECONDARY, RESIDENTIAL))
+
+
+def _rede_grelha(num_nos, espacamento, rng):
+    colunas = max(2, math.ceil(math.sqrt(num_nos)))
+    linhas = max(2, math.ceil(num_nos / colunas))
+    i, j = np.divmod(np.arange(linhas * colunas), colunas)
+    x = (j + rng.uniform(-0.15, 0.15, len(i))) * espacamento
+    y = (i + rng.uniform(-0.15, 0.15, len(i))) * espacamento
+    no = np.arange(linhas * colunas).reshape(linhas, colunas)
+    pares = np.concatenate((np.column_stack((no[:, :-1].ravel(), no[:, 1:].ravel())),
+                            np.column_stack((no[:-1, :].ravel(), no[1:, :].ravel()))))
+    classes = np.concatenate((_classe_linha(i.reshape(linhas, colunas)[:, :-1].ravel()),
+                              _classe_linha(j.reshape(linhas, colunas)[:-1, :].ravel())))
+    # alguns quarteiroes maiores: ruas em falta (mas nunca nas arterias)
+    mantidas = (rng.random(len(pares)) >= 0.1) | (classes != RESIDENTIAL)
+    return x, y, pares[mantidas], classes[mantidas]
+
+
+def _rede_radial(num_nos, espacamento, rng):
+    avenidas = max(6, round(math.sqrt(2 * num_nos)))
+    aneis = max(1, math.ceil((num_nos - 1) / avenidas))
+    anel, avenida = np.divmod(np.arange(aneis * avenidas), avenidas)
+    raio = (anel + 1 + rng.uniform(-0.1, 0.1, len(anel))) * espacamento
+    angulo = (avenida + rng.uniform(-0.2, 0.2, len(anel))) * (2 * math.pi / avenidas)
+    x = np.concatenate(([0.0], raio * np.cos(angulo)))
+    y = np.concatenate(([0.0], raio * np.sin(angulo)))
+    no = 1 + np.arange(aneis * avenidas).reshape(aneis, avenidas)
+    pares = np.concatenate((np.column_stack((np.zeros(avenidas, dtype=np.int64), no[0])),
+                            np.column_stack((no.ravel(), np.roll(no, -1, axis=1).ravel())),
+                            np.column_stack((no[:-1].ravel(), no[1:].ravel()))))
+    classe_avenida = np.where(np.arange(avenidas) % 3 == 0, PRIMARY, RESIDENTIAL)
+    classe_anel = np.where(np.arange(aneis) % 5 == 4, SECONDARY, RESIDENTIAL)
+    classes = np.concatenate((classe_avenida, np.repeat(classe_anel, avenidas),
+                              np.tile(classe_avenida, aneis - 1)))
+    return x, y, pares, classes
+
+
+def _rede_planar(num_nos, espacamento, rng):
+    lado = math.sqrt(num_nos) * espacamento
+    x = rng.uniform(0, lado, num_nos)
+    y = rng.uniform(0, lado, num_nos)
+    if Delaunay is not None:
+        triangulos = Delaunay(np.column_stack((x, y))).simplices
+    else:
+        # sem scipy: pontos numa grelha (um por celula, posicao aleatoria) e uma diagonal por celula
+        colunas = max(2, math.ceil(math.sqrt(num_nos)))
+        linhas = max(2, math.ceil(num_nos / colunas))
+        i, j = np.divmod(np.arange(linhas * colunas), colunas)
+        x = (j + rng.random(len(i))) * espacamento
+        y = (i + rng.random(len(i))) * espacamento
+        no = np.arange(linhas * colunas).reshape(linhas, colunas)
+        a, b, c, d = no[:-1, :-1].ravel(), no[:-1, 1:].ravel(), no[1:, :-1].ravel(), no[1:, 1:].ravel()
+        diagonal = rng.random(len(a)) < 0.5
+        triangulos = np.concatenate((np.column_stack((a, b, np.where(diagonal, d, c))),
+                                     np.column_stack((np.where(diagonal, a, b), d, c))))
+    pares = np.concatenate((triangulos[:, [0, 1]], triangulos[:, [1, 2]], triangulos[:, [2, 0]]))
+    pares, _ = _pares_unicos(pares, np.zeros(len(pares)))
+    comprimento = np.hypot(x[pares[:, 0]] - x[pares[:, 1]], y[pares[:, 0]] - y[pares[:, 1]])
+    # corredores: faixas com um quarteirao de largura a cada ARTERIAS quarteiroes, em x e em y
+    faixa = ARTERIAS * espacamento
+
+    def no_corredor(v):
+        return np.abs(v - np.round(v / faixa) * faixa) < 0.5 * espacamento
+
+    corredor = ((no_corredor(x[pares[:, 0]]) & no_corredor(x[pares[:, 1]]))
+                | (no_corredor(y[pares[:, 0]]) & no_corredor(y[pares[:, 1]])))
+    classes = np.where(corredor, PRIMARY, RESIDENTIAL)
+    # as arestas longas da triangulacao (a volta da rede e entre pracas) nao sao ruas
+    mantidas = (comprimento < 2.0 * espacamento) & (rng.random(len(pares)) >= 0.15)
+    return x, y, pares[mantidas], classes[mantidas]
+
+
+REDES = {"grelha": _rede_grelha, "radial": _rede_radial, "planar": _rede_planar}
+
+
+def _maior_componente_forte(num_nos, origens, destinos):
+    """Mascara dos nos da maior componente fortemente ligada."""
+    if connected_components is not None:
+        adjacencia = coo_matrix((np.ones(len(origens), dtype=np.int8), (origens, destinos)), shape=(num_nos, num_nos))
+        _, etiquetas = connected_components(adjacencia, directed=True, connection="strong")
+    else:
+        G = nx.DiGraph()
+        G.add_nodes_from(range(num_nos))
+        G.add_edges_from(zip(origens.tolist(), destinos.tolist()))
+        etiquetas = np.zeros(num_nos, dtype=np.int64)
+        for k, componente in enumerate(nx.strongly_connected_components(G)):
+            etiquetas[list(componente)] = k
+    return etiquetas == np.bincount(etiquetas).argmax()
+
+
+def gerar_grafo(tipo="grelha", num_nos=10000, espacamento=120.0, sentido_unico=0.2, semente=None, centro=CENTRO):
+    """GrafoCompacto sintetico com cerca de `num_nos` nos (um pouco menos depois de ficar so a maior
+    componente fortemente ligada), `espacamento` metros entre cruzamentos, uma fracao
+    `sentido_unico` de ruas de sentido unico e as classes de estrada de CLASSES."""
+    if tipo not in REDES:
+        raise ValueError(f"Tipo de rede desconhecido: '{tipo}' (tipos: {', '.join(REDES)}).")
+    rng = np.random.default_rng(semente)
+    x, y, pares, classes = REDES[tipo](num_nos, espacamento, rng)
+    pares, classes = _pares_unicos(pares, classes)
+
+    # ruas de sentido unico, num sentido ao acaso; as restantes nos dois sentidos
+    unico = rng.random(len(pares)) < sentido_unico
+    invertido = rng.random(len(pares)) < 0.5
+    u = np.where(invertido, pares[:, 1], pares[:, 0])
+    v = np.where(invertido, pares[:, 0], pares[:, 1])
+    origens = np.concatenate((u, v[~unico]))
+    destinos = np.concatenate((v, u[~unico]))
+    classes = np.concatenate((classes, classes[~unico]))
+
+    mantidos = _maior_componente_forte(len(x), origens, destinos)
+    novo_indice = np.cumsum(mantidos) - 1
+    arestas = mantidos[origens] & mantidos[destinos]
+    origens, destinos = novo_indice[origens[arestas]], novo_indice[destinos[arestas]]
+    classes = classes[arestas]
+    x, y = x[mantidos], y[mantidos]
+
+    lat0, lon0 = centro
+    lats = lat0 + (y - y.mean()) / METROS_POR_GRAU
+    lons = lon0 + (x - x.mean()) / (METROS_POR_GRAU * math.cos(math.radians(lat0)))
+    # as ruas nao sao retas: um pouco mais compridas que a distancia em linha reta
+    comprimentos = (ie.distancia_haversine_vetorial(lats[origens], lons[origens], lats[destinos], lons[destinos])
+                    * rng.uniform(1.0, 1.15, len(origens)))
+    ids = np.arange(1, len(x) + 1, dtype=np.int64)
+    return GrafoCompacto.de_arestas(ids, lons, lats, origens, destinos, comprimentos, classes, CLASSES)
+
+
+def guardar_graphml(grafo, caminho):
+    """Escreve o grafo em GraphML no formato do osmnx.save_graphml e a cache binaria ao lado
+    (depois do GraphML, para a cache ficar mais recente e carregar_grafo a usar diretamente)."""
+    origens = np.repeat(np.arange(grafo.num_nos), np.diff(grafo.offsets))
+    if grafo.classes is not None:
+        classes = [escape(grafo.nomes_classes[c]) for c in grafo.classes.tolist()]
+    else:
+        classes = ["residential"] * grafo.num_arestas
+    grau = np.bincount(origens, minlength=grafo.num_nos) + np.diff(grafo.offsets_rev)
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n"
+                '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
+                'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
+                'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
+                '  <key id="d6" for="edge" attr.name="highway" attr.type="string" />\n'
+                '  <key id="d5" for="edge" attr.name="osmid" attr.type="string" />\n'
+                '  <key id="d4" for="edge" attr.name="length" attr.type="string" />\n'
+                '  <key id="d3" for="node" attr.name="street_count" attr.type="string" />\n'
+                '  <key id="d2" for="node" attr.name="x" attr.type="string" />\n'
+                '  <key id="d1" for="node" attr.name="y" attr.type="string" />\n'
+                '  <key id="d0" for="graph" attr.name="crs" attr.type="string" />\n'
+                '  <graph edgedefault="directed">\n')
+        ids, xs, ys = grafo.ids.tolist(), grafo.x.tolist(), grafo.y.tolist()
+        f.writelines(f'    <node id="{no}">\n      <data key="d1">{lat!r}</data>\n'
+                     f'      <data key="d2">{lon!r}</data>\n      <data key="d3">{g}</data>\n    </node>\n'
+                     for no, lon, lat, g in zip(ids, xs, ys, (grau // 2).tolist()))
+        f.writelines(f'    <edge source="{ids[u]}" target="{ids[v]}" id="0">\n'
+                     f'      <data key="d4">{c!r}</data>\n      <data key="d5">{k + 1}</data>\n'
+                     f'      <data key="d6">{classe}</data>\n    </edge>\n'
+                     for k, (u, v, c, classe) in enumerate(zip(origens.tolist(), grafo.destinos.tolist(),
+                                                               grafo.comprimentos.astype(np.float64).tolist(),
+                                                               classes)))
+        f.write(f'    <data key="d0">{escape("epsg:4326")}</data>\n  </graph>\n</graphml>\n')
+    grafo.guardar(caminho_cache(caminho))
+
+
+def _pontos(grafo, indices):
+    return [{"id_no": grafo.id_no(i), "longitude": float(grafo.x[i]), "latitude": float(grafo.y[i])}
+            for i in indices.tolist()]
+
+
+def gerar_pois(grafo, num_bombas=None, num_carregadores=None, semente=None):
+    """Bombas e carregadores em nos ao acaso, no formato de pontos_interesse_matoshinhos.json."""
+    rng = np.random.default_rng(semente)
+    por_omissao = max(3, grafo.num_nos // 1500)
+    num_bombas = min(num_bombas or por_omissao, grafo.num_nos)
+    num_carregadores = min(num_carregadores or por_omissao, grafo.num_nos)
+    return {"bombas_gasolina": _pontos(grafo, rng.choice(grafo.num_nos, num_bombas, replace=False)),
+            "carregadores_eletricos": _pontos(grafo, rng.choice(grafo.num_nos, num_carregadores, replace=False))}
+
+
+def gerar_zonas(grafo, num_zonas=None, semente=None):
+    """Zonas de recolha por categoria (como criar_zonas_recolha), em nos ao acaso."""
+    rng = np.random.default_rng(semente)
+    num_zonas = num_zonas or max(20, grafo.num_nos // 100)
+    return {categoria: _pontos(grafo, rng.choice(grafo.num_nos, min(max(1, round(num_zonas * peso)), grafo.num_nos),
+                                                 replace=False))
+            for categoria, peso in CATEGORIAS_ZONAS.items()}
+
+
+def gerar_frota(num_taxis, fracao_eletricos=0.5, semente=None):
+    """Lista de taxis no formato do frota.json."""
+    rng = np.random.default_rng(semente)
+    eletrico = rng.random(num_taxis) < fracao_eletricos
+    autonomia = np.where(eletrico, rng.integers(30, 41, num_taxis), rng.integers(12, 17, num_taxis) * 5)
+    capacidade = rng.choice((4, 6), num_taxis, p=(0.7, 0.3))
+    return [{"id": i + 1, "tipo_motor": "eletrico" if e else "gasolina", "capacidade": int(c), "autonomia_max": int(a)}
+            for i, (e, c, a) in enumerate(zip(eletrico.tolist(), capacidade.tolist(), autonomia.tolist()))]
+
+
+def gerar_cenario(prefixo, tipo="grelha", num_nos=10000, num_taxis=50, espacamento=120.0, sentido_unico=0.2,
+                  fracao_eletricos=0.5, semente=None):
+    """Gera e grava os quatro ficheiros do cenario; devolve os respetivos caminhos."""
+    ficheiros = {"grafo": prefixo + ".graphml", "pois": prefixo + "_pois.json",
+                 "zonas": prefixo + "_zonas.json", "frota": prefixo + "_frota.json"}
+    pasta = os.path.dirname(prefixo)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+
+    # sementes diferentes (mas derivadas da mesma) para cada parte do cenario
+    sementes = np.random.SeedSequence(semente).spawn(4)
+    grafo = gerar_grafo(tipo, num_nos, espacamento, sentido_unico, sementes[0])
+    guardar_graphml(grafo, ficheiros["grafo"])
+    dados = {"pois": gerar_pois(grafo, semente=sementes[1]), "zonas": gerar_zonas(grafo, semente=sementes[2]),
+             "frota": gerar_frota(num_taxis, fracao_eletricos, sementes[3])}
+    for nome, conteudo in dados.items():
+        with open(ficheiros[nome], "w", encoding="utf-8") as f:
+            json.dump(conteudo, f, ensure_ascii=False, indent=2 if nome == "frota" else None)
+    return ficheiros
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera mapas, POIs, zonas e frotas sinteticos (sem internet)")
+    parser.add_argument("--tipo", choices=sorted(REDES), default="grelha")
+    parser.add_argument("--nos", type=int, default=10000, help="numero aproximado de cruzamentos")
+    parser.add_argument("--taxis", type=int, default=50)
+    parser.add_argument("--espacamento", type=float, default=120.0, help="metros entre cruzamentos vizinhos")
+    parser.add_argument("--sentido-unico", type=float, default=0.2, help="fracao de ruas de sentido unico")
+    parser.add_argument("--eletricos", type=float, default=0.5, help="fracao de taxis eletricos")
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument("--prefixo", default="sintetico")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    ficheiros = gerar_cenario(args.prefixo, args.tipo, args.nos, args.taxis, args.espacamento, args.sentido_unico,
+                              args.eletricos, args.semente)
+    print(f"Cenario gerado em {time.perf_counter() - t0:.1f}s:")
+    for nome, caminho in ficheiros.items():
+        print(f"  --{nome} {caminho}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,48 @@ import json
 import os
 import random
 import math
+import weakref
+import numpy as np
+import indice_espacial as ie
+import visualizador as vis
+from grafo_compacto import GrafoCompacto, carregar_grafo
+
+# dados espaciais por grafo (ids, coordenadas, grelha de nos e limites), calculados uma vez
+_cache_espacial = weakref.WeakKeyDictionary()
+
+def _dados_espaciais(G):
+    if G not in _cache_espacial:
+        if isinstance(G, GrafoCompacto):
+            ids, xs, ys = G.ids, G.x, G.y
+        else:
+            ids = np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes())
+            xs = np.array([data['x'] for _, data in G.nodes(data=True)], dtype=np.float64)
+            ys = np.array([data['y'] for _, data in G.nodes(data=True)], dtype=np.float64)
+        limites = (ys.min(), ys.max(), xs.min(), xs.max())
+
+        # celulas com ~4 nos em media
+        largura = calcular_distancia(limites[0], limites[2], limites[0], limites[3])
+        altura = calcular_distancia(limites[0], limites[2], limites[1], limites[2])
+        tamanho_celula = max(25.0, 2 * math.sqrt(max(largura * altura, 1.0) / len(ids)))
+        grelha = ie.GrelhaEspacial(ys, xs, tamanho_celula)
+        _cache_espacial[G] = (ids, xs, ys, grelha, limites)
+    return _cache_espacial[G]
+
+def _centroides(features):
+    if features is None or len(features) == 0 or "geometry" not in features:
+        return np.zeros(0), np.zeros(0)
+    geometrias = features.geometry
+    geometrias = geometrias[geometrias.notna() & ~geometrias.is_empty]
+    centroides = geometrias.centroid
+    return centroides.x.to_numpy(dtype=np.float64), centroides.y.to_numpy(dtype=np.float64)
+
+def ligar_ao_grafo(G, lons, lats):
+    """Liga cada coordenada ao no do grafo mais proximo, numa unica consulta a grelha de nos."""
+    if not len(lons):
+        return []
+    ids, xs, ys, grelha, _ = _dados_espaciais(G)
+    indices = grelha.mais_proximo(lats, lons)
+    return [{"id_no": int(ids[i]), "longitude": float(xs[i]), "latitude": float(ys[i])} for i in indices]
 
 def criar_mapa_base():
     ox.settings.log_console = False
@@ -20,38 +62,10 @@ def criar_mapa_base():
     carregadores = ox.features_from_point((lat, lon), tags={"amenity": "charging_station"}, dist=dist)
     
     pois_data = {
-        "bombas_gasolina": [],
-        "carregadores_eletricos": []
+        "bombas_gasolina": ligar_ao_grafo(G, *_centroides(bombas)),
+        "carregadores_eletricos": ligar_ao_grafo(G, *_centroides(carregadores))
     }
     
-    for idx, bomba in bombas.iterrows():
-        if hasattr(bomba, 'geometry') and bomba.geometry is not None:
-            coords = list(bomba.geometry.centroid.coords)[0]
-            try:
-                node_id = ox.nearest_nodes(G, X=coords[0], Y=coords[1])
-                node_data = G.nodes[node_id]
-                pois_data["bombas_gasolina"].append({
-                    "id_no": node_id,
-                    "longitude": float(node_data['x']),
-                    "latitude": float(node_data['y']),
-                })
-            except:
-                pass
-    
-    for idx, carregador in carregadores.iterrows():
-        if hasattr(carregador, 'geometry') and carregador.geometry is not None:
-            coords = list(carregador.geometry.centroid.coords)[0]
-            try:
-                node_id = ox.nearest_nodes(G, X=coords[0], Y=coords[1])
-                node_data = G.nodes[node_id]
-                pois_data["carregadores_eletricos"].append({
-                    "id_no": node_id,
-                    "longitude": float(node_data['x']),
-                    "latitude": float(node_data['y']),
-                })
-            except:
-                pass
-    
     nome_ficheiro_pois = "pontos_interesse_matoshinhos.json"
     with open(nome_ficheiro_pois, "w", encoding="utf-8") as f:
         json.dump(pois_data, f, ensure_ascii=False, indent=2)
@@ -70,7 +84,7 @@ def criar_zonas_recolha():
 
     print("A carregar grafo de estradas...")
     try:
-        G = ox.load_graphml("matosinhos_5km.graphml")
+        G = carregar_grafo("matosinhos_5km.graphml")
     except FileNotFoundError:
         return False
     
@@ -91,20 +105,7 @@ def criar_zonas_recolha():
         print(f"   A buscar: {nome_categoria}...")
         try:
             features = ox.features_from_point((lat, lon), tags=tags, dist=dist)
-            pontos_processados = []
-            for idx, feature in features.iterrows():
-                if hasattr(feature, 'geometry') and feature.geometry is not None:
-                    coords = list(feature.geometry.centroid.coords)[0]
-                    try:
-                        node_id = ox.nearest_nodes(G, X=coords[0], Y=coords[1])
-                        node_data = G.nodes[node_id]
-                        pontos_processados.append({
-                            "id_no": node_id,
-                            "longitude": float(node_data['x']),
-                            "latitude": float(node_data['y']),
-                        })
-                    except:
-                        pass
+            pontos_processados = ligar_ao_grafo(G, *_centroides(features))
             
             zonas_data[nome_categoria] = pontos_processados
             print(f"   - {nome_categoria.capitalize()}: {len(pontos_processados)} encontrados")
@@ -118,10 +119,10 @@ def criar_zonas_recolha():
     print(f"\n- Zonas de recolha guardadas com sucesso em {nome_ficheiro}!")
     return True
 
-def carregar_dados():
+def carregar_dados(ficheiro_grafo="matosinhos_5km.graphml", ficheiro_pois="pontos_interesse_matoshinhos.json"):
     try:
-        G = ox.load_graphml("matosinhos_5km.graphml")
-        with open("pontos_interesse_matoshinhos.json", "r", encoding="utf-8") as f:
+        G = carregar_grafo(ficheiro_grafo)
+        with open(ficheiro_pois, "r", encoding="utf-8") as f:
             pois_data = json.load(f)
         return G, pois_data
     except FileNotFoundError:
@@ -145,56 +146,26 @@ def calcular_distancia(lat1, lon1, lat2, lon2):
     return R * c
 
 def filtrar_pontos_com_hierarquia(pois_frota_data, zonas_data, distancia_minima):
-    
+    # bombas > carregadores > pontos de recolha; cada nivel so fica com pontos a pelo menos
+    # distancia_minima dos niveis de cima (e, na recolha, dos pontos ja aceites)
     plotar_bombas = pois_frota_data.get("bombas_gasolina", [])
-    plotar_carregadores = []
-    plotar_recolha = []
 
     carregadores_brutos = pois_frota_data.get("carregadores_eletricos", [])
-    for carregador in carregadores_brutos:
-        demasiado_perto = False
-        for bomba in plotar_bombas:
-            dist = calcular_distancia(carregador["latitude"], carregador["longitude"], bomba["latitude"], bomba["longitude"])
-            if dist < distancia_minima:
-                demasiado_perto = True
-                break
-        if not demasiado_perto:
-            plotar_carregadores.append(carregador)
+    plotar_carregadores = ie.filtrar_longe_de(carregadores_brutos, plotar_bombas, distancia_minima)
     
     pontos_recolha_brutos = []
     for categoria in zonas_data.values():
         pontos_recolha_brutos.extend(categoria)
     
     pontos_prioritarios = plotar_bombas + plotar_carregadores
-    ids_aceites = set()
-
-    for ponto in pontos_recolha_brutos:
-        if ponto["id_no"] in ids_aceites: continue
-        
-        demasiado_perto = False
-        for poi in pontos_prioritarios:
-            dist = calcular_distancia(ponto["latitude"], ponto["longitude"], poi["latitude"], poi["longitude"])
-            if dist < distancia_minima:
-                demasiado_perto = True
-                break
-        
-        if demasiado_perto: continue
-
-        for aceite in plotar_recolha:
-            dist = calcular_distancia(ponto["latitude"], ponto["longitude"], aceite["latitude"], aceite["longitude"])
-            if dist < distancia_minima:
-                demasiado_perto = True
-                break
-        
-        if not demasiado_perto:
-            plotar_recolha.append(ponto)
-            ids_aceites.add(ponto["id_no"])
+    candidatos = ie.filtrar_longe_de(pontos_recolha_brutos, pontos_prioritarios, distancia_minima)
+    plotar_recolha = ie.selecao_gulosa(candidatos, distancia_minima)
 
     return plotar_bombas, plotar_carregadores, plotar_recolha
 
 def visualizar_mapa_com_pois():
     try:
-        G = ox.load_graphml("matosinhos_5km.graphml")
+        G = carregar_grafo("matosinhos_5km.graphml")
         with open("pontos_interesse_matoshinhos.json", "r") as f: pois_frota = json.load(f)
         with open("zonas_recolha_matosinhos.json", "r") as f: zonas = json.load(f)
     except:
@@ -203,7 +174,7 @@ def visualizar_mapa_com_pois():
     bombas, carregadores, recolha = filtrar_pontos_com_hierarquia(pois_frota, zonas, 250)
     
     fig, ax = plt.subplots(figsize=(15, 15))
-    ox.plot_graph(G, ax=ax, node_size=0, edge_color='#2E86AB', bgcolor='#F8F9FA', show=False)
+    vis.desenhar_estradas(ax, G, edge_color='#2E86AB', bgcolor='#F8F9FA')
     
     if bombas:
         ax.scatter([p["longitude"] for p in bombas], [p["latitude"] for p in bombas], c='red', s=100, zorder=5, label="Bombas")
@@ -215,11 +186,18 @@ def visualizar_mapa_com_pois():
     plt.legend()
     plt.show()
 
+def gerar_pedidos_aleatorios(G, n, rng=None):
+    """N pedidos em locais aleatorios dentro dos limites do grafo, ligados ao no mais proximo."""
+    rng = rng if rng is not None else np.random.default_rng()
+    lat_min, lat_max, lon_min, lon_max = _dados_espaciais(G)[4]
+    lats = rng.uniform(lat_min, lat_max, n)
+    lons = rng.uniform(lon_min, lon_max, n)
+    return [{"id_no_origem": p["id_no"], "latitude": p["latitude"], "longitude": p["longitude"]}
+            for p in ligar_ao_grafo(G, lons, lats)]
+
 def gerar_pedido_local_aleatorio(G):
-    lats = [data['y'] for node, data in G.nodes(data=True)]
-    lons = [data['x'] for node, data in G.nodes(data=True)]
-    rand_lat = random.uniform(min(lats), max(lats))
-    rand_lon = random.uniform(min(lons), max(lons))
-    no_id = ox.nearest_nodes(G, X=rand_lon, Y=rand_lat)
-    node = G.nodes[no_id]
-    return {"id_no_origem": no_id, "latitude": node['y'], "longitude": node['x']}
\ No newline at end of file
+    lat_min, lat_max, lon_min, lon_max = _dados_espaciais(G)[4]
+    rand_lat = random.uniform(lat_min, lat_max)
+    rand_lon = random.uniform(lon_min, lon_max)
+    ponto = ligar_ao_grafo(G, np.array([rand_lon]), np.array([rand_lat]))[0]
+    return {"id_no_origem": ponto["id_no"], "latitude": ponto["latitude"], "longitude": ponto["longitude"]}
@@ -0,0 +1,395 @@
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import numpy as np
+
+VERSAO_FORMATO = 2
+
+
+class GrafoCompacto:
+    """Grafo de estradas em arrays contiguos (CSR).
+
+    Os nos sao indexados de 0 a n-1; `ids` guarda o id OSM de cada indice.
+    As arestas de saida do no i sao destinos[offsets[i]:offsets[i+1]],
+    e o CSR invertido (arestas de entrada) segue o mesmo formato.
+
+    As procuras usam `pesos` (por omissao os proprios comprimentos; ver definir_pesos) e o
+    movimento dos taxis usa sempre os comprimentos. `classes` (opcional) e o codigo da classe
+    de estrada de cada aresta, um indice de `nomes_classes` (o atributo "highway" do OSM)."""
+
+    ARRAYS = ("ids", "x", "y", "offsets", "destinos", "comprimentos",
+              "offsets_rev", "origens_rev", "comprimentos_rev")
+    ARRAYS_GEOMETRIA = ("geometria_offsets", "geometria_x", "geometria_y")
+
+    def __init__(self, ids, x, y, offsets, destinos, comprimentos,
+                 offsets_rev, origens_rev, comprimentos_rev, geometria=None, classes=None, nomes_classes=()):
+        self.ids = ids
+        self.x = x
+        self.y = y
+        self.offsets = offsets
+        self.destinos = destinos
+        self.comprimentos = comprimentos
+        self.offsets_rev = offsets_rev
+        self.origens_rev = origens_rev
+        self.comprimentos_rev = comprimentos_rev
+        # geometria opcional das arestas (ordem do CSR): pontos da aresta k em
+        # geometria_x/y[geometria_offsets[k]:geometria_offsets[k+1]]
+        self.geometria = geometria
+        self.classes = classes
+        self.nomes_classes = tuple(nomes_classes)
+        # pesos das procuras (ordem do CSR e do CSR invertido); os mesmos arrays que os comprimentos
+        # enquanto nao houver definir_pesos
+        self.pesos = comprimentos
+        self.pesos_rev = comprimentos_rev
+
+        self.indice = {int(no): i for i, no in enumerate(ids.tolist())}
+        self.versao = 0
+        self._listas = {}
+        self._chaves_arestas = None
+        self._hash = None  # (versao, hash_conteudo)
+        self._hash_pesos = None  # (versao, hash_pesos)
+        self._escala = None  # (versao, escala_heuristica)
+        # pasta da cache binaria de onde o grafo foi lido (None se foi construido em memoria);
+        # ficheiros derivados do grafo (ver matriz_hubs) podem ser guardados ao lado
+        self.diretorio = None
+
+    @classmethod
+    def de_networkx(cls, G, com_geometria=False):
+        ids = np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes())
+        indice = {int(no): i for i, no in enumerate(ids.tolist())}
+        x = np.array([G.nodes[no]['x'] for no in G.nodes], dtype=np.float64)
+        y = np.array([G.nodes[no]['y'] for no in G.nodes], dtype=np.float64)
+
+        # arestas paralelas (MultiDiGraph) ficam reduzidas a mais curta
+        arestas = {}
+        classes = {}
+        geometrias = {}
+        for u, v, dados in G.edges(data=True):
+            if u == v:
+                continue
+            chave = (indice[u], indice[v])
+            comprimento = float(dados.get('length', 0.0))
+            if chave not in arestas or comprimento < arestas[chave]:
+                arestas[chave] = comprimento
+                # o osmnx junta as classes de segmentos simplificados numa lista: fica a primeira
+                classe = dados.get('highway', '')
+                classes[chave] = str(classe[0] if isinstance(classe, list) and classe else classe)
+                if com_geometria:
+                    geometria = dados.get('geometry')
+                    geometrias[chave] = (list(geometria.coords) if geometria is not None
+                                         else [(x[chave[0]], y[chave[0]]), (x[chave[1]], y[chave[1]])])
+
+        m = len(arestas)
+        origens = np.fromiter((u for u, _ in arestas), dtype=np.int32, count=m)
+        destinos = np.fromiter((v for _, v in arestas), dtype=np.int32, count=m)
+        comprimentos = np.fromiter(arestas.values(), dtype=np.float32, count=m)
+        nomes_classes = sorted(set(classes.values()))
+        codigo = {nome: c for c, nome in enumerate(nomes_classes)}
+        codigos = np.fromiter((codigo[classes[chave]] for chave in arestas), dtype=np.int16, count=m)
+        grafo = cls.de_arestas(ids, x, y, origens, destinos, comprimentos, codigos, nomes_classes)
+
+        if com_geometria:
+            ordem = np.lexsort((destinos, origens))
+            pontos = [geometrias[chave] for chave in arestas]
+            pontos = [pontos[k] for k in ordem.tolist()]
+            geometria_offsets = np.zeros(m + 1, dtype=np.int64)
+            np.cumsum([len(p) for p in pontos], out=geometria_offsets[1:])
+            todos = np.array([c for p in pontos for c in p], dtype=np.float64).reshape(-1, 2)
+            grafo.geometria = (geometria_offsets, todos[:, 0].copy(), todos[:, 1].copy())
+        return grafo
+
+    @classmethod
+    def de_arestas(cls, ids, x, y, origens, destinos, comprimentos, classes=None, nomes_classes=()):
+        """Grafo a partir de arrays de nos e de arestas (indices de 0 a n-1, sem arestas repetidas)."""
+        n = len(ids)
+        origens = np.asarray(origens, dtype=np.int32)
+        destinos = np.asarray(destinos, dtype=np.int32)
+        comprimentos = np.asarray(comprimentos, dtype=np.float32)
+        offsets, destinos_csr, comprimentos_csr, ordem = _construir_csr(n, origens, destinos, comprimentos)
+        offsets_rev, origens_rev, comprimentos_rev, _ = _construir_csr(n, destinos, origens, comprimentos)
+        if classes is not None:
+            classes = np.asarray(classes, dtype=np.int16)[ordem]
+        return cls(np.asarray(ids, dtype=np.int64), np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64),
+                   offsets, destinos_csr, comprimentos_csr, offsets_rev, origens_rev, comprimentos_rev,
+                   classes=classes, nomes_classes=nomes_classes)
+
+    def guardar(self, diretorio):
+        """Guarda cada array num .npy (carregavel com mmap) e um meta.json. Escreve numa pasta
+        temporaria e so no fim a troca pela final, para que outros processos nunca leiam meio ficheiro."""
+        # pasta temporaria por processo: varios processos podem estar a reconstruir a mesma cache
+        temporario = f"{diretorio}.tmp{os.getpid()}"
+        shutil.rmtree(temporario, ignore_errors=True)
+        os.makedirs(temporario)
+        for nome in self.ARRAYS:
+            np.save(os.path.join(temporario, nome + ".npy"), np.ascontiguousarray(getattr(self, nome)))
+        if self.geometria is not None:
+            for nome, array in zip(self.ARRAYS_GEOMETRIA, self.geometria):
+                np.save(os.path.join(temporario, nome + ".npy"), array)
+        if self.classes is not None:
+            np.save(os.path.join(temporario, "classes.npy"), np.ascontiguousarray(self.classes))
+        with open(os.path.join(temporario, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"versao_formato": VERSAO_FORMATO, "num_nos": self.num_nos,
+                       "num_arestas": self.num_arestas, "geometria": self.geometria is not None,
+                       "classes": list(self.nomes_classes) if self.classes is not None else None}, f)
+        try:
+            os.replace(temporario, diretorio)
+        except OSError:
+            # ja ha uma cache (desatualizada, ou de outro processo): sai do caminho com outro nome e
+            # so entao entra a nova; se outro processo puser a sua entretanto, fica a dele
+            antiga = f"{diretorio}.antiga{os.getpid()}"
+            shutil.rmtree(antiga, ignore_errors=True)
+            try:
+                os.replace(diretorio, antiga)
+                os.replace(temporario, diretorio)
+            except OSError:
+                shutil.rmtree(temporario, ignore_errors=True)
+            shutil.rmtree(antiga, ignore_errors=True)
+
+    @classmethod
+    def carregar(cls, diretorio, mmap=True):
+        """Le um grafo guardado com guardar(). Com mmap=True os arrays ficam mapeados em memoria
+        so de leitura, partilhados entre todos os processos que abrirem a mesma pasta."""
+        with open(os.path.join(diretorio, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("versao_formato") != VERSAO_FORMATO:
+            raise ValueError(f"Formato de '{diretorio}' desatualizado.")
+        modo = "r" if mmap else None
+        arrays = [np.load(os.path.join(diretorio, nome + ".npy"), mmap_mode=modo) for nome in cls.ARRAYS]
+        geometria = None
+        if meta.get("geometria"):
+            geometria = tuple(np.load(os.path.join(diretorio, nome + ".npy"), mmap_mode=modo)
+                              for nome in cls.ARRAYS_GEOMETRIA)
+        classes = None
+        if meta.get("classes") is not None:
+            classes = np.load(os.path.join(diretorio, "classes.npy"), mmap_mode=modo)
+        grafo = cls(*arrays, geometria=geometria, classes=classes, nomes_classes=meta.get("classes") or ())
+        grafo.diretorio = diretorio
+        return grafo
+
+    def segmentos(self):
+        """Lista de polilinhas (k x 2: lon, lat), uma por aresta, para desenhar a rede."""
+        if self.geometria is not None:
+            geometria_offsets, gx, gy = self.geometria
+            pontos = np.column_stack((gx, gy))
+            return np.split(pontos, geometria_offsets[1:-1])
+        origens = np.repeat(np.arange(self.num_nos), np.diff(self.offsets))
+        return np.stack((np.column_stack((self.x[origens], self.y[origens])),
+                         np.column_stack((self.x[self.destinos], self.y[self.destinos]))), axis=1)
+
+    @property
+    def num_nos(self):
+        return len(self.ids)
+
+    @property
+    def num_arestas(self):
+        return len(self.destinos)
+
+    def id_no(self, i):
+        return int(self.ids[i])
+
+    def indices(self, ids_nos):
+        return np.array([self.indice[int(no)] for no in ids_nos], dtype=np.int32)
+
+    def vizinhos(self, i):
+        return self.destinos[self.offsets[i]:self.offsets[i + 1]]
+
+    def predecessores(self, i):
+        return self.origens_rev[self.offsets_rev[i]:self.offsets_rev[i + 1]]
+
+    def comprimento_aresta(self, u, v):
+        """Comprimento da aresta u->v; se nao existir, tenta v->u. Devolve None se nenhuma existir."""
+        inicio, fim = self.offsets[u], self.offsets[u + 1]
+        posicoes = np.flatnonzero(self.destinos[inicio:fim] == v)
+        if len(posicoes):
+            return float(self.comprimentos[inicio + posicoes[0]])
+        inicio, fim = self.offsets[v], self.offsets[v + 1]
+        posicoes = np.flatnonzero(self.destinos[inicio:fim] == u)
+        if len(posicoes):
+            return float(self.comprimentos[inicio + posicoes[0]])
+        return None
+
+    def comprimentos_arestas(self, us, vs):
+        """Versao vetorizada de comprimento_aresta para pares (us[k], vs[k]); 0 onde nao ha aresta."""
+        return self._valores_arestas(us, vs, self.comprimentos)
+
+    def pesos_arestas(self, us, vs):
+        """Como comprimentos_arestas, mas com os pesos das procuras (por exemplo, segundos com trafego)."""
+        return self._valores_arestas(us, vs, self.pesos)
+
+    def _valores_arestas(self, us, vs, valores):
+        if self._chaves_arestas is None:
+            origens = np.repeat(np.arange(self.num_nos, dtype=np.int64), np.diff(self.offsets))
+            # o CSR esta ordenado por (origem, destino), logo estas chaves ja estao ordenadas
+            self._chaves_arestas = origens * self.num_nos + self.destinos
+        us = np.asarray(us, dtype=np.int64)
+        vs = np.asarray(vs, dtype=np.int64)
+        resultado = np.zeros(len(us), dtype=np.float64)
+        em_falta = np.ones(len(us), dtype=bool)
+        for a, b in ((us, vs), (vs, us)):
+            chaves = a * self.num_nos + b
+            posicoes = np.minimum(np.searchsorted(self._chaves_arestas, chaves), max(self.num_arestas - 1, 0))
+            existe = em_falta & (self._chaves_arestas[posicoes] == chaves) if self.num_arestas else em_falta & False
+            resultado[existe] = valores[posicoes[existe]]
+            em_falta &= ~existe
+        return resultado
+
+    def listas_adjacencia(self, reverso=False):
+        """Copia do CSR em listas Python, mais rapidas de percorrer em ciclos puros (Dijkstra, BFS...)."""
+        chave = (reverso, self.versao)
+        if chave not in self._listas:
+            if reverso:
+                arrays = (self.offsets_rev, self.origens_rev, self.pesos_rev)
+            else:
+                arrays = (self.offsets, self.destinos, self.pesos)
+            self._listas = {k: v for k, v in self._listas.items() if k[1] == self.versao}
+            self._listas[chave] = tuple(a.tolist() for a in arrays)
+        return self._listas[chave]
+
+    def hash_conteudo(self):
+        """Impressao digital do grafo (nos, adjacencia e comprimentos), para validar ficheiros derivados
+        dele (trajetorias, indices de rotas, checkpoints). Nao depende dos pesos de definir_pesos.
+
+        Calculada uma vez por versao (alteracoes aos comprimentos passam por marcar_alterado)."""
+        if self._hash is None or self._hash[0] != self.versao:
+            h = hashlib.sha1()
+            for array in (self.ids, self.offsets, self.destinos, self.comprimentos):
+                h.update(np.ascontiguousarray(array).tobytes())
+            self._hash = (self.versao, h.hexdigest())
+        return self._hash[1]
+
+    def hash_pesos(self):
+        """Como hash_conteudo, mas inclui os pesos das procuras quando ha pesos proprios: a chave de
+        ficheiros que dependem dos pesos (matrizes de hubs)."""
+        if not self.tem_pesos():
+            return self.hash_conteudo()
+        if self._hash_pesos is None or self._hash_pesos[0] != self.versao:
+            h = hashlib.sha1(self.hash_conteudo().encode())
+            h.update(b"pesos")
+            h.update(np.ascontiguousarray(self.pesos).tobytes())
+            self._hash_pesos = (self.versao, h.hexdigest())
+        return self._hash_pesos[1]
+
+    def marcar_alterado(self):
+        self.versao += 1
+
+    def definir_comprimentos(self, comprimentos):
+        sem_pesos = not self.tem_pesos()
+        self.comprimentos = np.asarray(comprimentos, dtype=np.float32)
+        self.comprimentos_rev = self._invertido(self.comprimentos)
+        if sem_pesos:
+            self.pesos, self.pesos_rev = self.comprimentos, self.comprimentos_rev
+        self.marcar_alterado()
+
+    def tem_pesos(self):
+        """True se as procuras usam pesos proprios (definir_pesos) em vez dos comprimentos."""
+        return self.pesos is not self.comprimentos
+
+    def definir_pesos(self, pesos):
+        """Pesos das procuras por aresta (ordem do CSR), por exemplo tempos de percurso; None volta
+        aos comprimentos. Os arrays anteriores nao sao alterados (matrizes feitas com eles continuam a usa-los)."""
+        if pesos is None:
+            self.pesos, self.pesos_rev = self.comprimentos, self.comprimentos_rev
+        else:
+            self.pesos = np.asarray(pesos, dtype=np.float32)
+            self.pesos_rev = self._invertido(self.pesos)
+        self.marcar_alterado()
+
+    def escala_heuristica(self):
+        """Fator que torna a distancia em linha reta (metros) um limite inferior dos pesos: 1 sem
+        pesos proprios, o menor peso por metro das arestas com eles (por exemplo, 1 / velocidade maxima)."""
+        if not self.tem_pesos():
+            return 1.0
+        if self._escala is None or self._escala[0] != self.versao:
+            com_comprimento = self.comprimentos > 0
+            razao = self.pesos[com_comprimento] / self.comprimentos[com_comprimento]
+            self._escala = (self.versao, float(razao.min()) if len(razao) else 1.0)
+        return self._escala[1]
+
+    def origens_arestas(self):
+        """Origem de cada aresta do CSR (as arestas de saida de i estao seguidas, por ordem)."""
+        return np.repeat(np.arange(self.num_nos, dtype=np.int32), np.diff(self.offsets))
+
+    def _invertido(self, valores):
+        # valores por aresta na ordem do CSR -> na ordem do CSR invertido
+        _, _, invertidos, _ = _construir_csr(self.num_nos, self.destinos, self.origens_arestas(), valores)
+        return invertidos
+
+
+def _construir_csr(n, origens, destinos, pesos):
+    ordem = np.lexsort((destinos, origens))
+    contagem = np.bincount(origens, minlength=n)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(contagem, out=offsets[1:])
+    return offsets, destinos[ordem].astype(np.int32), pesos[ordem].astype(np.float32), ordem
+
+
+def caminho_cache(caminho_graphml):
+    return os.path.splitext(caminho_graphml)[0] + ".grafo"
+
+
+def carregar_grafo(caminho_graphml, com_geometria=True, mmap=True):
+    """GrafoCompacto do ficheiro .graphml, via cache binaria ao lado dele (<nome>.grafo/).
+
+    A cache e (re)construida quando falta ou quando o .graphml e mais recente;
+    so nesse caso e que o GraphML e lido (com osmnx)."""
+    cache = caminho_cache(caminho_graphml)
+    meta = os.path.join(cache, "meta.json")
+    if os.path.exists(meta):
+        desatualizada = (os.path.exists(caminho_graphml)
+                         and os.path.getmtime(caminho_graphml) > os.path.getmtime(meta))
+        if not desatualizada:
+            try:
+                return GrafoCompacto.carregar(cache, mmap=mmap)
+            except ValueError:
+                pass
+
+    import osmnx as ox
+    grafo = GrafoCompacto.de_networkx(ox.load_graphml(caminho_graphml), com_geometria=com_geometria)
+    grafo.guardar(cache)
+    return GrafoCompacto.carregar(cache, mmap=mmap)
+
+
+def dijkstra_multi_origem(grafo, origens, reverso=False, com_anterior=False):
+    """Dijkstra a partir de varias origens em simultaneo.
+
+    Com reverso=True percorre as arestas ao contrario, ou seja, calcula a
+    distancia de cada no *ate* a origem mais proxima. Devolve (dist, origem)
+    em arrays indexados pelo indice do no; origem=-1 onde nao ha caminho.
+    Com com_anterior=True devolve tambem o no anterior na arvore da procura
+    (no modo reverso, o proximo no do caminho ate a origem)."""
+    offsets, adjacentes, pesos = grafo.listas_adjacencia(reverso)
+    n = grafo.num_nos
+    dist = [float('inf')] * n
+    origem = [-1] * n
+    anterior = [-1] * n
+    heap = []
+    for o in origens:
+        if dist[o] > 0.0:
+            dist[o] = 0.0
+            origem[o] = o
+            heap.append((0.0, o))
+    heapq.heapify(heap)
+
+    fechado = [False] * n
+    while heap:
+        d, u = heapq.heappop(heap)
+        if fechado[u]:
+            continue
+        fechado[u] = True
+        ou = origem[u]
+        for k in range(offsets[u], offsets[u + 1]):
+            v = adjacentes[k]
+            nd = d + pesos[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                origem[v] = ou
+                anterior[v] = u
+                heapq.heappush(heap, (nd, v))
+
+    if com_anterior:
+        return (np.array(dist, dtype=np.float64), np.array(origem, dtype=np.int32),
+                np.array(anterior, dtype=np.int32))
+    return np.array(dist, dtype=np.float64), np.array(origem, dtype=np.int32)
+
@@ -0,0 +1,25 @@
+import math
+
+from grafo_compacto import GrafoCompacto
+
+# Estimativas de distancia usadas pelas procuras informadas (algoritmos.py) e pelo motor.
+
+
+def calcular_distancia_haversine(lat1, lon1, lat2, lon2):
+    R = 6371000 
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+def heuristica(G, node_a, node_b):
+    if isinstance(G, GrafoCompacto):
+        # com pesos em tempo (trafego) a distancia passa ao tempo minimo possivel
+        return (calcular_distancia_haversine(G.y[node_a], G.x[node_a], G.y[node_b], G.x[node_b])
+                * G.escala_heuristica())
+    lat1 = G.nodes[node_a]['y']
+    lon1 = G.nodes[node_a]['x']
+    lat2 = G.nodes[node_b]['y']
+    lon2 = G.nodes[node_b]['x']
+    return calcular_distancia_haversine(lat1, lon1, lat2, lon2)
@@ -0,0 +1,254 @@
+import math
+import time
+
+import numpy as np
+
+RAIO_TERRA = 6371000
+_DESLOCAMENTO = 1 << 26
+
+
+def distancia_haversine_vetorial(lat1, lon1, lat2, lon2):
+    """Mesma formula de gestor_mapa.calcular_distancia, aplicada a arrays (com broadcasting)."""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = np.radians(np.subtract(lat2, lat1))
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(delta_phi / 2.0)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2.0)**2
+    return RAIO_TERRA * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+
+
+class GrelhaEspacial:
+    """Grelha regular sobre coordenadas projetadas (metros), para procuras por raio.
+
+    A projecao e equiretangular com o cosseno da maior latitude dos pontos, o que
+    garante que dois pontos a menos de r metros (haversine) nunca ficam a mais de
+    r metros na projecao. As celulas candidatas sao depois confirmadas com a
+    distancia haversine exata."""
+
+    def __init__(self, lats, lons, tamanho_celula):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.tamanho_celula = float(tamanho_celula)
+        self.lat_referencia = float(np.abs(self.lats).max()) if len(self.lats) else 0.0
+
+        cx, cy = self._celulas(self.lats, self.lons)
+        chaves = self._chave(cx, cy)
+        self._ordem = np.argsort(chaves, kind="stable")
+        self._chaves_unicas, self._inicios, self._contagens = np.unique(
+            chaves[self._ordem], return_index=True, return_counts=True)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _projetar(self, lats, lons):
+        x = RAIO_TERRA * math.cos(math.radians(self.lat_referencia)) * np.radians(lons)
+        y = RAIO_TERRA * np.radians(lats)
+        return x, y
+
+    def _celulas(self, lats, lons):
+        x, y = self._projetar(lats, lons)
+        return (np.floor(x / self.tamanho_celula).astype(np.int64),
+                np.floor(y / self.tamanho_celula).astype(np.int64))
+
+    @staticmethod
+    def _chave(cx, cy):
+        return (cx + _DESLOCAMENTO) * (2 * _DESLOCAMENTO) + (cy + _DESLOCAMENTO)
+
+    def _vizinhanca(self, lats, raio):
+        # pontos mais a norte/sul que a referencia ficam mais "apertados" em x: alargar a procura
+        lat_max = max(self.lat_referencia, float(np.abs(lats).max()))
+        fator_x = math.cos(math.radians(self.lat_referencia)) / max(math.cos(math.radians(lat_max)), 1e-9)
+        alcance_x = math.ceil(raio * 1.001 * fator_x / self.tamanho_celula)
+        alcance_y = math.ceil(raio * 1.001 / self.tamanho_celula)
+        return alcance_x, alcance_y
+
+    def _pontos_nas_celulas(self, consultas, cx, cy):
+        """Para cada consulta k, todos os pontos da celula (cx[k], cy[k]). Devolve pares (consulta, ponto)."""
+        chaves = self._chave(cx, cy)
+        posicoes = np.searchsorted(self._chaves_unicas, chaves)
+        posicoes = np.minimum(posicoes, len(self._chaves_unicas) - 1)
+        encontrados = self._chaves_unicas[posicoes] == chaves
+        if not encontrados.any():
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        inicios = self._inicios[posicoes[encontrados]]
+        contagens = self._contagens[posicoes[encontrados]]
+        # expandir cada consulta em todos os pontos da celula
+        total = int(contagens.sum())
+        deslocamentos = np.arange(total) - np.repeat(np.cumsum(contagens) - contagens, contagens)
+        return (np.repeat(consultas[encontrados], contagens),
+                self._ordem[np.repeat(inicios, contagens) + deslocamentos])
+
+    def pares_proximos(self, lats, lons, raio):
+        """Todos os pares (consulta i, ponto j) a menos de `raio` metros. Devolve (i, j, distancias)."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        vazio = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+        if not len(lats) or not len(self):
+            return vazio
+
+        cx, cy = self._celulas(lats, lons)
+        alcance_x, alcance_y = self._vizinhanca(lats, raio)
+        consultas = np.arange(len(lats))
+        todos_i, todos_j = [], []
+
+        for dx in range(-alcance_x, alcance_x + 1):
+            for dy in range(-alcance_y, alcance_y + 1):
+                i, j = self._pontos_nas_celulas(consultas, cx + dx, cy + dy)
+                if len(i):
+                    todos_i.append(i)
+                    todos_j.append(j)
+
+        if not todos_i:
+            return vazio
+        i = np.concatenate(todos_i)
+        j = np.concatenate(todos_j)
+        distancias = distancia_haversine_vetorial(lats[i], lons[i], self.lats[j], self.lons[j])
+        perto = distancias < raio
+        return i[perto], j[perto], distancias[perto]
+
+    def algum_perto(self, lats, lons, raio):
+        """Mascara das consultas que tem pelo menos um ponto da grelha a menos de `raio` metros."""
+        mascara = np.zeros(len(lats), dtype=bool)
+        i, _, _ = self.pares_proximos(lats, lons, raio)
+        mascara[i] = True
+        return mascara
+
+
+    def mais_proximo(self, lats, lons):
+        """Indice do ponto da grelha mais proximo (haversine) de cada consulta.
+
+        Procura em aneis de celulas a volta de cada consulta, todas as consultas ao mesmo
+        tempo, e para cada uma assim que nenhum anel seguinte possa ter um ponto mais perto."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        melhor_j = np.full(len(lats), -1, dtype=np.int64)
+        if not len(lats) or not len(self):
+            return melhor_j
+        melhor_d = np.full(len(lats), np.inf)
+
+        cx, cy = self._celulas(lats, lons)
+        lat_max = max(self.lat_referencia, float(np.abs(lats).max()))
+        fator_x = math.cos(math.radians(self.lat_referencia)) / max(math.cos(math.radians(lat_max)), 1e-9)
+        celulas_x = self._chaves_unicas // (2 * _DESLOCAMENTO) - _DESLOCAMENTO
+        celulas_y = self._chaves_unicas % (2 * _DESLOCAMENTO) - _DESLOCAMENTO
+        max_anel = int(max(np.abs(celulas_x[:, None] - np.array([cx.min(), cx.max()])).max(),
+                           np.abs(celulas_y[:, None] - np.array([cy.min(), cy.max()])).max()))
+
+        pendentes = np.arange(len(lats))
+        for anel in range(max_anel + 1):
+            deslocamentos = [(dx, dy) for dx in range(-anel, anel + 1) for dy in range(-anel, anel + 1)
+                             if max(abs(dx), abs(dy)) == anel]
+            for dx, dy in deslocamentos:
+                i, j = self._pontos_nas_celulas(pendentes, cx[pendentes] + dx, cy[pendentes] + dy)
+                if not len(i):
+                    continue
+                d = distancia_haversine_vetorial(lats[i], lons[i], self.lats[j], self.lons[j])
+                # minimo por consulta: ordenar por distancia e ficar com a primeira ocorrencia
+                ordem = np.lexsort((d, i))
+                i, j, d = i[ordem], j[ordem], d[ordem]
+                primeiros = np.ones(len(i), dtype=bool)
+                primeiros[1:] = i[1:] != i[:-1]
+                i, j, d = i[primeiros], j[primeiros], d[primeiros]
+                melhora = d < melhor_d[i]
+                melhor_d[i[melhora]] = d[melhora]
+                melhor_j[i[melhora]] = j[melhora]
+
+            # tudo o que esta fora deste anel fica a pelo menos `limite` metros
+            limite = anel * self.tamanho_celula / (fator_x * 1.001)
+            pendentes = pendentes[melhor_d[pendentes] > limite]
+            if not len(pendentes):
+                break
+        return melhor_j
+
+
+def _coordenadas(pontos):
+    return (np.array([p["latitude"] for p in pontos], dtype=np.float64),
+            np.array([p["longitude"] for p in pontos], dtype=np.float64))
+
+
+def filtrar_longe_de(pontos, referencias, distancia_minima):
+    """Pontos que nao tem nenhuma referencia a menos de `distancia_minima` (mantem a ordem)."""
+    if not pontos or not referencias:
+        return list(pontos)
+    grelha = GrelhaEspacial(*_coordenadas(referencias), max(distancia_minima, 1.0))
+    perto = grelha.algum_perto(*_coordenadas(pontos), distancia_minima)
+    return [p for p, rejeitado in zip(pontos, perto) if not rejeitado]
+
+
+def selecao_gulosa(pontos, distancia_minima):
+    """Percorre os pontos por ordem e aceita cada um se nao houver um ja aceite a menos de `distancia_minima`
+    (nem um aceite com o mesmo id_no). Os pares proximos sao calculados de uma vez com a grelha;
+    o ciclo guloso so consulta listas de vizinhos."""
+    if not pontos:
+        return []
+    lats, lons = _coordenadas(pontos)
+    grelha = GrelhaEspacial(lats, lons, max(distancia_minima, 1.0))
+    i, j, _ = grelha.pares_proximos(lats, lons, distancia_minima)
+    anteriores = j < i
+    vizinhos_anteriores = [[] for _ in pontos]
+    for a, b in zip(i[anteriores].tolist(), j[anteriores].tolist()):
+        vizinhos_anteriores[a].append(b)
+
+    aceite = [False] * len(pontos)
+    ids_aceites = set()
+    resultado = []
+    for k, ponto in enumerate(pontos):
+        if ponto["id_no"] in ids_aceites:
+            continue
+        if any(aceite[v] for v in vizinhos_anteriores[k]):
+            continue
+        aceite[k] = True
+        ids_aceites.add(ponto["id_no"])
+        resultado.append(ponto)
+    return resultado
+
+
+def _filtrar_ingenuo(pois_frota_data, zonas_data, distancia_minima):
+    # versao O(n*m) original, so para comparar no benchmark
+    from gestor_mapa import calcular_distancia
+    bombas = pois_frota_data.get("bombas_gasolina", [])
+    carregadores = [c for c in pois_frota_data.get("carregadores_eletricos", [])
+                    if all(calcular_distancia(c["latitude"], c["longitude"], b["latitude"], b["longitude"]) >= distancia_minima
+                           for b in bombas)]
+    prioritarios = bombas + carregadores
+    recolha, ids = [], set()
+    for categoria in zonas_data.values():
+        for p in categoria:
+            if p["id_no"] in ids:
+                continue
+            if any(calcular_distancia(p["latitude"], p["longitude"], q["latitude"], q["longitude"]) < distancia_minima
+                   for q in prioritarios + recolha):
+                continue
+            recolha.append(p)
+            ids.add(p["id_no"])
+    return bombas, carregadores, recolha
+
+
+if __name__ == "__main__":
+    from gestor_mapa import filtrar_pontos_com_hierarquia
+
+    rng = np.random.default_rng(0)
+
+    def pontos_aleatorios(n, id_inicial):
+        lats = 41.18 + rng.uniform(-0.15, 0.15, n)
+        lons = -8.69 + rng.uniform(-0.2, 0.2, n)
+        return [{"id_no": id_inicial + k, "latitude": float(a), "longitude": float(o)}
+                for k, (a, o) in enumerate(zip(lats, lons))]
+
+    for n in (2000, 10000, 40000):
+        pois = {"bombas_gasolina": pontos_aleatorios(n // 20, 0),
+                "carregadores_eletricos": pontos_aleatorios(n // 10, 10**6)}
+        zonas = {"recolha": pontos_aleatorios(n, 2 * 10**6)}
+
+        t0 = time.perf_counter()
+        rapido = filtrar_pontos_com_hierarquia(pois, zonas, 250)
+        t_rapido = time.perf_counter() - t0
+
+        if n <= 10000:
+            t0 = time.perf_counter()
+            ingenuo = _filtrar_ingenuo(pois, zonas, 250)
+            t_ingenuo = time.perf_counter() - t0
+            iguais = all([p["id_no"] for p in a] == [p["id_no"] for p in b] for a, b in zip(rapido, ingenuo))
+            print(f"{n:>6} candidatos: grelha {t_rapido:.3f}s | ingenuo {t_ingenuo:.3f}s | resultado igual: {iguais}")
+        else:
+            print(f"{n:>6} candidatos: grelha {t_rapido:.3f}s | {len(rapido[2])} pontos de recolha aceites")
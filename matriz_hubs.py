@@ -0,0 +1,521 @@
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from grafo_compacto import GrafoCompacto, carregar_grafo, dijkstra_multi_origem
+
+# Distancias entre hubs: o pequeno conjunto fixo de nos onde comecam ou acabam quase todas as
+# viagens (as zonas de recolha do despacho). Um Dijkstra invertido por hub da a distancia de cada
+# outro hub ate ele (a matriz hub a hub, entre_hubs) e os caminhos: de cada arvore so ficam os nos
+# por onde passa o caminho de algum hub ate a raiz, com o no seguinte, numa arvore esparsa. O
+# tamanho e hubs x hubs mais esses caminhos, nao hubs x nos do grafo.
+#
+# A distancia de um no qualquer (a posicao de um taxi) ate aos hubs e uma coluna calculada quando
+# e pedida (um Dijkstra a partir do no, ate fechar todos os hubs) e guardada em memoria, para as
+# MAX_COLUNAS usadas ha menos tempo.
+#
+# Quando o grafo foi lido da cache binaria (grafo_compacto.carregar_grafo), a matriz fica
+# guardada nessa pasta, com o nome derivado do hash do grafo (e dos pesos) e dos nos dos hubs, e
+# as proximas leituras (de qualquer processo) sao so mapear os ficheiros em memoria. A construcao
+# reparte os hubs por varios processos. Para construir antes de correr simulacoes:
+#
+#   python matriz_hubs.py --grafo matosinhos_5km.graphml --processos 8
+#
+# Quando os pesos do grafo mudam (trafego.py: tempos de percurso por hora do dia) e precisa outra
+# matriz; tambem fica guardada (a chave inclui os pesos), por isso uma hora que volta (no dia
+# seguinte, ou noutra simulacao) e so lida com em_cache. Para nao a refazer de raiz, o motor guarda
+# em memoria (nao no disco: sao hubs x nos) as arvores completas dos hubs (construir_com_arvores) e
+# reparar() volta a calcular so as arvores que usam arestas cujo peso mudou, com um Dijkstra dinamico
+# a partir dessas arestas (reparar_arvore, que tambem serve para a tabela dos postos).
+
+# uma arvore invalidada em mais do que esta fracao dos nos e recalculada de raiz
+FRACAO_RECALCULO = 0.5
+
+# muda quando os ficheiros guardados mudam de formato (faz parte da chave)
+VERSAO_FORMATO = 2
+ARRAYS = ("nos", "entre_hubs", "arvore_inicio", "arvore_nos", "arvore_proximo")
+
+# matrizes ja usadas neste processo, por chave (grafo, pesos e hubs); com trafego cada hora tem as
+# suas, por isso so ficam as MAX_MATRIZES_MEMORIA usadas ha menos tempo
+MAX_MATRIZES_MEMORIA = 16
+_matrizes = OrderedDict()
+
+# colunas (distancias de um no ate a cada hub) guardadas por matriz
+MAX_COLUNAS = 4096
+
+
+def _lembrar(chave, matriz):
+    _matrizes[chave] = matriz
+    _matrizes.move_to_end(chave)
+    while len(_matrizes) > MAX_MATRIZES_MEMORIA:
+        _matrizes.popitem(last=False)
+
+
+class MatrizHubs:
+    """entre_hubs[a, b] = distancia do hub a ate ao hub b, nos pesos do grafo; com pesos proprios
+    (por exemplo, segundos) entre_hubs_metros[a, b] e o comprimento desse caminho (sem eles e o
+    proprio entre_hubs).
+
+    Caminhos ate ao hub b: arvore_nos[arvore_inicio[b]:arvore_inicio[b + 1]] sao os nos (ordenados)
+    dos caminhos dos outros hubs ate b e arvore_proximo, nas mesmas posicoes, o no seguinte de cada um."""
+
+    def __init__(self, grafo, nos, entre_hubs, arvore_inicio, arvore_nos, arvore_proximo, entre_hubs_metros=None):
+        self.nos = np.asarray(nos, dtype=np.int32)
+        self.entre_hubs = entre_hubs
+        self.entre_hubs_metros = entre_hubs if entre_hubs_metros is None else entre_hubs_metros
+        self.arvore_inicio = arvore_inicio
+        self.arvore_nos = arvore_nos
+        self.arvore_proximo = arvore_proximo
+        self.hub_do_no = {int(no): h for h, no in enumerate(self.nos.tolist())}
+        # as colunas sao calculadas com os pesos com que a matriz foi feita (o grafo pode ja ter outros)
+        self._grafo = grafo
+        self._pesos = grafo.pesos
+        self._listas_pesos = None
+        self._colunas = OrderedDict()
+
+    def __len__(self):
+        return len(self.nos)
+
+    def _listas(self):
+        # (offsets, destinos, pesos, comprimentos) em listas Python, para _procurar
+        grafo = self._grafo
+        if self._listas_pesos is None:
+            if grafo.pesos is self._pesos:
+                offsets, destinos, pesos = grafo.listas_adjacencia()
+            else:
+                offsets, destinos, pesos = (a.tolist() for a in (grafo.offsets, grafo.destinos, self._pesos))
+            comprimentos = grafo.comprimentos.tolist() if self._pesos is not grafo.comprimentos else pesos
+            self._listas_pesos = (offsets, destinos, pesos, comprimentos)
+        return self._listas_pesos
+
+    def _procurar(self, origem, alvos):
+        """Dijkstra a partir de `origem` ate fechar todos os `alvos`. Devolve listas indexadas pelo no:
+        distancia, metros desse caminho e no anterior."""
+        offsets, destinos, pesos, comprimentos = self._listas()
+        n = len(offsets) - 1
+        inf = float('inf')
+        dist = [inf] * n
+        metros = [inf] * n
+        anterior = [-1] * n
+        fechado = [False] * n
+        dist[origem] = metros[origem] = 0.0
+        por_fechar = set(alvos)
+        heap = [(0.0, origem)]
+        while heap and por_fechar:
+            d, u = heapq.heappop(heap)
+            if fechado[u]:
+                continue
+            fechado[u] = True
+            por_fechar.discard(u)
+            for k in range(offsets[u], offsets[u + 1]):
+                v = destinos[k]
+                nd = d + pesos[k]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    metros[v] = metros[u] + comprimentos[k]
+                    anterior[v] = u
+                    heapq.heappush(heap, (nd, v))
+        return dist, metros, anterior
+
+    def _coluna(self, no):
+        coluna = self._colunas.get(no)
+        if coluna is not None:
+            self._colunas.move_to_end(no)
+            return coluna
+        h = self.hub_do_no.get(no)
+        if h is not None:
+            coluna = (self.entre_hubs[h], self.entre_hubs_metros[h])
+        else:
+            hubs = self.nos.tolist()
+            dist, metros, _ = self._procurar(no, hubs)
+            coluna = (np.array([dist[x] for x in hubs]), np.array([metros[x] for x in hubs]))
+        self._colunas[no] = coluna
+        if len(self._colunas) > MAX_COLUNAS:
+            self._colunas.popitem(last=False)
+        return coluna
+
+    def colunas(self, nos):
+        """(distancias, metros) de cada um dos `nos` (indices do grafo) ate cada hub, em arrays
+        (hubs x len(nos))."""
+        nos = np.asarray(nos, dtype=np.int64).reshape(-1)
+        distancias = np.empty((len(self.nos), len(nos)))
+        metros = np.empty((len(self.nos), len(nos)))
+        for j, no in enumerate(nos.tolist()):
+            distancias[:, j], metros[:, j] = self._coluna(no)
+        return distancias, metros
+
+    def caminho(self, no, hub):
+        """Nos a percorrer desde `no` (exclusive) ate ao hub; None se nao houver caminho. De outro hub
+        segue a arvore esparsa; de um no qualquer e uma procura ate ao hub."""
+        no, destino = int(no), int(self.nos[hub])
+        origem = self.hub_do_no.get(no)
+        if origem is None:
+            dist, _, anterior = self._procurar(no, [destino])
+            if not np.isfinite(dist[destino]):
+                return None
+            caminho = []
+            while destino != no:
+                caminho.append(destino)
+                destino = anterior[destino]
+            return caminho[::-1]
+
+        if not np.isfinite(self.entre_hubs[origem, hub]):
+            return None
+        inicio, fim = int(self.arvore_inicio[hub]), int(self.arvore_inicio[hub + 1])
+        nos_arvore, proximo = self.arvore_nos[inicio:fim], self.arvore_proximo[inicio:fim]
+        caminho = []
+        while no != destino:
+            no = int(proximo[np.searchsorted(nos_arvore, no)])
+            caminho.append(no)
+        return caminho
+
+    def arrays(self):
+        """Arrays a guardar (nome -> array); entre_hubs_metros so com pesos proprios."""
+        arrays = {nome: getattr(self, nome) for nome in ARRAYS}
+        if self.entre_hubs_metros is not self.entre_hubs:
+            arrays["entre_hubs_metros"] = self.entre_hubs_metros
+        return arrays
+
+    @classmethod
+    def carregar(cls, diretorio, grafo):
+        """Matriz guardada por _guardar, mapeada em memoria so de leitura."""
+        arrays = {nome: np.load(os.path.join(diretorio, f"{nome}.npy"), mmap_mode="r") for nome in ARRAYS}
+        metros = os.path.join(diretorio, "entre_hubs_metros.npy")
+        if os.path.exists(metros):
+            arrays["entre_hubs_metros"] = np.load(metros, mmap_mode="r")
+        return cls(grafo, **arrays)
+
+
+def nos_de(grafo, pontos):
+    """Indices (ordenados, sem repetidos) dos pontos {"id_no": ...} que existem no grafo."""
+    return sorted({grafo.indice[p["id_no"]] for p in pontos if p["id_no"] in grafo.indice})
+
+
+def _chave(grafo, nos):
+    h = hashlib.sha1(grafo.hash_pesos().encode())
+    h.update(np.asarray(nos, dtype=np.int32).tobytes())
+    h.update(bytes([VERSAO_FORMATO]))
+    return h.hexdigest()[:16]
+
+
+def metros_da_arvore(grafo, distancia, proximo):
+    """Comprimento do caminho de cada no ate a raiz da sua arvore (um hub, ou a origem de um
+    dijkstra_multi_origem reverso), seguindo `proximo` (duplicando os saltos:
+    log2 da profundidade da arvore em operacoes vetorizadas)."""
+    nos = np.arange(grafo.num_nos)
+    tem_proximo = proximo >= 0
+    salto = np.where(tem_proximo, proximo, nos)
+    metros = np.zeros(grafo.num_nos, dtype=np.float64)
+    metros[tem_proximo] = grafo.comprimentos_arestas(nos[tem_proximo], proximo[tem_proximo])
+    while True:
+        seguinte = salto[salto]
+        if np.array_equal(seguinte, salto):
+            break
+        metros += metros[salto]
+        salto = seguinte
+    return np.where(np.isfinite(distancia), metros, np.inf)
+
+
+def _arvore(grafo, no):
+    # Dijkstra invertido completo ate `no`: (distancia de cada no, no seguinte no caminho)
+    distancia, _, proximo = dijkstra_multi_origem(grafo, [int(no)], reverso=True, com_anterior=True)
+    return distancia, proximo
+
+
+def _linha(grafo, nos, b):
+    """Dijkstra invertido a partir do hub b: (distancias dos hubs ate b, metros desses caminhos,
+    nos da arvore esparsa de b, no seguinte de cada um)."""
+    return _linha_da_arvore(grafo, nos, *_arvore(grafo, nos[b]))
+
+
+def _linha_da_arvore(grafo, nos, distancia, proximo):
+    metros = metros_da_arvore(grafo, distancia, proximo) if grafo.tem_pesos() else distancia
+    # os caminhos dos hubs ate b juntam-se depressa: cada no e visitado uma vez
+    seguinte = proximo.tolist()
+    nos_arvore = set()
+    for x in nos.tolist():
+        while seguinte[x] >= 0 and x not in nos_arvore:
+            nos_arvore.add(x)
+            x = seguinte[x]
+    nos_arvore = np.array(sorted(nos_arvore), dtype=np.int32)
+    return distancia[nos], metros[nos], nos_arvore, proximo[nos_arvore]
+
+
+def _construir_bloco(tarefa):
+    # corre num processo de trabalho: le o grafo (mapeado) e devolve as linhas [inicio, fim)
+    diretorio_grafo, nos, inicio, fim = tarefa
+    grafo = GrafoCompacto.carregar(diretorio_grafo)
+    return [_linha(grafo, nos, b) for b in range(inicio, fim)]
+
+
+def construir(grafo, nos, processos=None):
+    """Matriz dos hubs `nos` (em memoria; ver obter_matriz). Reparte os hubs por `processos` (os do
+    CPU, por omissao) quando o grafo foi lido da cache binaria e nao foi alterado desde entao."""
+    nos = np.asarray(nos, dtype=np.int32)
+    processos = min(processos or os.cpu_count() or 1, len(nos))
+    # os processos leem o grafo do disco: so serve se for o mesmo que esta em memoria
+    if processos > 1 and grafo.diretorio is not None and grafo.versao == 0:
+        tamanho = -(-len(nos) // (processos * 4))
+        blocos = [(grafo.diretorio, nos, inicio, min(inicio + tamanho, len(nos)))
+                  for inicio in range(0, len(nos), tamanho)]
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            linhas = [linha for bloco in executor.map(_construir_bloco, blocos) for linha in bloco]
+    else:
+        linhas = [_linha(grafo, nos, b) for b in range(len(nos))]
+    return _montar(grafo, nos, linhas)
+
+
+def construir_com_arvores(grafo, nos):
+    """(matriz, arvores): a matriz de construir e a arvore completa de cada hub, uma lista de
+    (distancia, proximo) por hub, para reparar() na proxima mudanca de pesos."""
+    nos = np.asarray(nos, dtype=np.int32)
+    arvores = [_arvore(grafo, no) for no in nos.tolist()]
+    return _montar(grafo, nos, [_linha_da_arvore(grafo, nos, *arvore) for arvore in arvores]), arvores
+
+
+def _montar(grafo, nos, linhas):
+    entre_hubs = np.empty((len(nos), len(nos)), dtype=np.float64)
+    entre_hubs_metros = np.empty((len(nos), len(nos)), dtype=np.float64)
+    arvore_inicio = np.zeros(len(nos) + 1, dtype=np.int64)
+    for b, (distancias, metros, nos_arvore, _) in enumerate(linhas):
+        entre_hubs[:, b] = distancias
+        entre_hubs_metros[:, b] = metros
+        arvore_inicio[b + 1] = arvore_inicio[b] + len(nos_arvore)
+    arvore_nos = np.concatenate([linha[2] for linha in linhas]) if len(nos) else np.empty(0, dtype=np.int32)
+    arvore_proximo = np.concatenate([linha[3] for linha in linhas]) if len(nos) else np.empty(0, dtype=np.int32)
+    return MatrizHubs(grafo, nos, entre_hubs, arvore_inicio, arvore_nos, arvore_proximo,
+                      entre_hubs_metros if grafo.tem_pesos() else None)
+
+
+def alteracoes(grafo, pesos_antigos):
+    """As arestas cujo peso mudou de `pesos_antigos` (ordem do CSR) para os pesos atuais do grafo:
+    (aumentadas (origens, destinos), diminuidas (origens, destinos, pesos novos), quantas)."""
+    novos = np.asarray(grafo.pesos, dtype=np.float64)
+    antigos = np.asarray(pesos_antigos, dtype=np.float64)
+    origens = grafo.origens_arestas()
+    aumentou, diminuiu = novos > antigos, novos < antigos
+    return ((origens[aumentou], grafo.destinos[aumentou]),
+            (origens[diminuiu], grafo.destinos[diminuiu], novos[diminuiu]),
+            int(np.count_nonzero(aumentou) + np.count_nonzero(diminuiu)))
+
+
+def _subarvores(proximo, raizes):
+    """Mascara dos nos cujo caminho ate a raiz passa por alguma das `raizes` (incluindo-as),
+    duplicando os saltos como em metros_da_arvore."""
+    afetado = np.zeros(len(proximo), dtype=bool)
+    afetado[raizes] = True
+    salto = np.where(proximo >= 0, proximo, np.arange(len(proximo)))
+    while True:
+        seguinte = salto[salto]
+        afetado |= afetado[salto]
+        if np.array_equal(seguinte, salto):
+            return afetado
+        salto = seguinte
+
+
+def reparar_arvore(grafo, distancia, proximo, mudancas):
+    """Arvore de caminhos mais curtos invertida (distancia de cada no ate a raiz, ou ate a raiz mais
+    proxima de um dijkstra_multi_origem, e o no seguinte) corrigida para os pesos atuais, sabendo as
+    `mudancas` (alteracoes) desde os pesos em que foi calculada: Dijkstra dinamico semeado nas arestas
+    alteradas. Os nos abaixo de uma aresta da arvore que ficou mais pesada perdem a distancia e voltam a
+    ser ligados a partir dos vizinhos validos, as arestas que ficaram mais leves entram como candidatas
+    e as melhorias propagam-se como num Dijkstra.
+
+    Devolve (distancia, proximo, nos reparados): os mesmos arrays, com 0, se nenhuma aresta alterada a
+    afetar; None se a reparacao tocar em mais do que FRACAO_RECALCULO dos nos (sai mais barato refazer)."""
+    (origens, destinos), (origens_menos, destinos_menos, novos), _ = mudancas
+    raizes = origens[proximo[origens] == destinos]
+    candidatas = distancia[destinos_menos] + novos < distancia[origens_menos]
+    if not len(raizes) and not candidatas.any():
+        return distancia, proximo, 0
+    limite = FRACAO_RECALCULO * grafo.num_nos
+    afetados = np.flatnonzero(_subarvores(proximo, raizes)).tolist() if len(raizes) else []
+    if len(afetados) > limite:
+        return None
+
+    offsets, adjacentes, pesos = grafo.listas_adjacencia()
+    offsets_rev, adjacentes_rev, pesos_rev = grafo.listas_adjacencia(reverso=True)
+    dist = distancia.tolist()
+    seguinte = proximo.tolist()
+    inf = float('inf')
+    for x in afetados:
+        dist[x] = inf
+        seguinte[x] = -1
+    heap = []
+    # nos afetados: o melhor vizinho que ficou com a distancia valida
+    for x in afetados:
+        for k in range(offsets[x], offsets[x + 1]):
+            nd = dist[adjacentes[k]] + pesos[k]
+            if nd < dist[x]:
+                dist[x] = nd
+                seguinte[x] = adjacentes[k]
+        if dist[x] < inf:
+            heap.append((dist[x], x))
+    # arestas mais leves x -> y
+    for x, y, peso in zip(origens_menos[candidatas].tolist(), destinos_menos[candidatas].tolist(),
+                          novos[candidatas].tolist()):
+        nd = dist[y] + peso
+        if nd < dist[x]:
+            dist[x] = nd
+            seguinte[x] = y
+            heap.append((nd, x))
+    heapq.heapify(heap)
+
+    reparados = len(afetados)
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        reparados += 1
+        if reparados > limite:
+            return None
+        for k in range(offsets_rev[u], offsets_rev[u + 1]):
+            x = adjacentes_rev[k]
+            nd = d + pesos_rev[k]
+            if nd < dist[x]:
+                dist[x] = nd
+                seguinte[x] = u
+                heapq.heappush(heap, (nd, x))
+    return np.array(dist, dtype=np.float64), np.array(seguinte, dtype=np.int32), reparados
+
+
+def raizes_da_arvore(distancia, proximo):
+    """A raiz (o no de origem) do caminho de cada no, seguindo `proximo`; -1 sem caminho. Como a
+    origem de dijkstra_multi_origem."""
+    salto = np.where(proximo >= 0, proximo, np.arange(len(proximo)))
+    while True:
+        seguinte = salto[salto]
+        if np.array_equal(seguinte, salto):
+            break
+        salto = seguinte
+    return np.where(np.isfinite(distancia), salto, -1).astype(np.int32)
+
+
+def reparar(grafo, matriz, arvores, pesos_antigos):
+    """A matriz dos mesmos hubs para os pesos atuais do grafo, a partir da `matriz` e das `arvores`
+    (construir_com_arvores) calculadas com `pesos_antigos`: as arvores que nenhuma aresta alterada
+    afeta ficam como estavam (e as suas colunas da matriz tambem), as outras sao reparadas
+    (reparar_arvore) ou, se for quase tudo, recalculadas.
+
+    Devolve (matriz, arvores, estatisticas) com as arestas alteradas, as linhas afetadas e recalculadas
+    e os nos reparados. A matriz nao fica guardada: ver registar."""
+    nos = matriz.nos
+    mudancas = alteracoes(grafo, pesos_antigos)
+    estatisticas = {"linhas": len(nos), "arestas_alteradas": mudancas[2], "linhas_afetadas": 0,
+                    "linhas_recalculadas": 0, "nos_reparados": 0}
+    novas, linhas = [], []
+    for b, (distancia, proximo) in enumerate(arvores):
+        # as arvores dos hubs sao parecidas: se as primeiras tiveram quase todas de ser recalculadas, as
+        # restantes sao recalculadas logo, sem tentar repara-las
+        tentar = b < 4 or estatisticas["linhas_recalculadas"] < 0.9 * b
+        reparada = reparar_arvore(grafo, distancia, proximo, mudancas) if tentar else None
+        if reparada is None:
+            reparada = (*_arvore(grafo, nos[b]), 0)
+            estatisticas["linhas_recalculadas"] += 1
+        distancia_nova, proximo_novo, reparados = reparada
+        novas.append((distancia_nova, proximo_novo))
+        if distancia_nova is distancia:
+            inicio, fim = int(matriz.arvore_inicio[b]), int(matriz.arvore_inicio[b + 1])
+            linhas.append((matriz.entre_hubs[:, b], matriz.entre_hubs_metros[:, b], matriz.arvore_nos[inicio:fim],
+                           matriz.arvore_proximo[inicio:fim]))
+            continue
+        estatisticas["linhas_afetadas"] += 1
+        estatisticas["nos_reparados"] += reparados
+        linhas.append(_linha_da_arvore(grafo, nos, distancia_nova, proximo_novo))
+    return _montar(grafo, nos, linhas), novas, estatisticas
+
+
+def registar(grafo, matriz):
+    """Guarda a matriz (por exemplo, a de reparar) como a dos pesos atuais do grafo e devolve-a (mapeada
+    do disco, se o grafo tiver pasta)."""
+    chave = _chave(grafo, matriz.nos)
+    matriz = _guardar(grafo, chave, matriz)
+    _lembrar(chave, matriz)
+    return matriz
+
+
+def obter_matriz(grafo, nos, processos=None):
+    """Matriz dos hubs `nos` (indices do grafo, ordem mantida) para o conteudo atual do grafo: a ja
+    usada neste processo, a guardada na pasta do grafo, ou construida (e guardada) agora."""
+    nos = np.asarray(nos, dtype=np.int32)
+    matriz = em_cache(grafo, nos)
+    if matriz is not None:
+        return matriz
+    return registar(grafo, construir(grafo, nos, processos))
+
+
+def em_cache(grafo, nos):
+    """Matriz dos hubs `nos` para o conteudo atual do grafo se ja existir, em memoria ou na pasta do
+    grafo, sem a construir; senao None."""
+    chave = _chave(grafo, nos)
+    matriz = _matrizes.get(chave)
+    if matriz is not None:
+        _matrizes.move_to_end(chave)
+        return matriz
+    if grafo.diretorio is None:
+        return None
+    try:
+        matriz = MatrizHubs.carregar(os.path.join(grafo.diretorio, f"hubs_{chave}"), grafo)
+    except (FileNotFoundError, ValueError):
+        return None
+    _lembrar(chave, matriz)
+    return matriz
+
+
+def _guardar(grafo, chave, matriz):
+    """Escreve a matriz na pasta do grafo (numa pasta temporaria trocada no fim) e devolve-a mapeada
+    do disco; sem pasta (ou so de leitura) devolve a propria matriz."""
+    if grafo.diretorio is None:
+        return matriz
+    diretorio = os.path.join(grafo.diretorio, f"hubs_{chave}")
+    # pasta temporaria por processo: varios processos podem estar a guardar a mesma matriz
+    temporario = f"{diretorio}.tmp{os.getpid()}"
+    try:
+        shutil.rmtree(temporario, ignore_errors=True)
+        os.makedirs(temporario)
+        for nome, array in matriz.arrays().items():
+            np.save(os.path.join(temporario, f"{nome}.npy"), array)
+        try:
+            os.replace(temporario, diretorio)
+        except OSError:
+            # outro processo guardou-a primeiro (e a mesma matriz)
+            shutil.rmtree(temporario, ignore_errors=True)
+        return MatrizHubs.carregar(diretorio, grafo)
+    except OSError:
+        shutil.rmtree(temporario, ignore_errors=True)
+        return matriz
+
+
+def main():
+    import gestor_mapa as gm
+
+    parser = argparse.ArgumentParser(description="Constroi e guarda a matriz de distancias das zonas de recolha")
+    parser.add_argument("--grafo", default="matosinhos_5km.graphml")
+    parser.add_argument("--pois", default="pontos_interesse_matoshinhos.json")
+    parser.add_argument("--zonas", default="zonas_recolha_matosinhos.json")
+    parser.add_argument("--distancia-minima", type=float, default=250)
+    parser.add_argument("--processos", type=int, default=None)
+    args = parser.parse_args()
+
+    grafo = carregar_grafo(args.grafo)
+    with open(args.pois, "r", encoding="utf-8") as f:
+        pois_frota = json.load(f)
+    with open(args.zonas, "r", encoding="utf-8") as f:
+        zonas_recolha = json.load(f)
+    _, _, recolha = gm.filtrar_pontos_com_hierarquia(pois_frota, zonas_recolha, args.distancia_minima)
+    t0 = time.perf_counter()
+    matriz = obter_matriz(grafo, nos_de(grafo, recolha), args.processos)
+    print(f"zonas de recolha: {len(matriz)} hubs, {len(matriz.arvore_nos)} nos nos caminhos entre eles, "
+          f"em {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from scipy.stats import t as t_student
+except ImportError:
+    t_student = None
+
+import gestor_mapa as gm
+import simulacao_batch as sb
+from grafo_compacto import carregar_grafo
+
+# Corre o mesmo cenario com muitas sementes (e, opcionalmente, varias composicoes de frota)
+# num conjunto de processos e agrega os KPIs finais com intervalos de confianca a 95%.
+#
+#   python monte_carlo.py --sementes 200 --passos 5000 --frotas frota.json frota_so_eletricos.json
+#
+# Cada processo carrega o grafo uma unica vez, a partir da cache binaria mapeada em memoria
+# (grafo_compacto.carregar_grafo), por isso o grafo nunca e re-lido do GraphML nem enviado
+# (pickle) para as tarefas; cada tarefa recebe apenas (frota, semente) e devolve um dicionario de KPIs.
+
+KPIS_AGREGADOS = ("custo_total", "co2_total", "autonomia_media_km", "autonomia_min_km",
+                  "taxis_livres", "taxis_a_abastecer", "taxis_sem_energia")
+
+# valores criticos t de Student (bilateral, 95%) para poucos graus de liberdade, sem scipy
+_T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+         10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110,
+         18: 2.101, 19: 2.093, 20: 2.086, 25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+_dados = {}
+
+
+def _valor_critico_t(graus_liberdade):
+    if t_student is not None:
+        return float(t_student.ppf(0.975, graus_liberdade))
+    # sem a linha da tabela, a de menos graus de liberdade (valor maior: o intervalo nunca fica estreito demais)
+    return _T_95[max(limite for limite in _T_95 if limite <= graus_liberdade)]
+
+
+def _iniciar_trabalhador(ficheiro_grafo, ficheiro_pois, ficheiro_zonas):
+    G, pois_frota = gm.carregar_dados(ficheiro_grafo, ficheiro_pois)
+    with open(ficheiro_zonas, "r", encoding="utf-8") as f:
+        zonas_recolha = json.load(f)
+    _dados.update(G=G, pois_frota=pois_frota, zonas_recolha=zonas_recolha, ficheiro_grafo=ficheiro_grafo,
+                  ficheiro_pois=ficheiro_pois, ficheiro_zonas=ficheiro_zonas)
+
+
+def _correr_cenario(tarefa):
+    ficheiro_frota, semente, passos = tarefa
+    sim = sb.preparar_simulacao(semente, _dados["ficheiro_grafo"], _dados["ficheiro_pois"],
+                                _dados["ficheiro_zonas"], ficheiro_frota, G=_dados["G"],
+                                pois_frota=_dados["pois_frota"], zonas_recolha=_dados["zonas_recolha"])
+    kpis = sb.correr_batch(sim, passos)
+    resumo = {nome: kpis[nome] for nome in KPIS_AGREGADOS}
+    resumo.update(frota=ficheiro_frota, semente=semente, tempo_execucao_s=kpis["tempo_execucao_s"])
+    return resumo
+
+
+def agregar(resultados):
+    """Media, desvio padrao e intervalo de confianca a 95% de cada KPI."""
+    agregado = {"execucoes": len(resultados)}
+    n = len(resultados)
+    for nome in KPIS_AGREGADOS:
+        valores = [r[nome] for r in resultados]
+        media = sum(valores) / n if n else 0.0
+        desvio = math.sqrt(sum((v - media) ** 2 for v in valores) / (n - 1)) if n > 1 else 0.0
+        margem = _valor_critico_t(n - 1) * desvio / math.sqrt(n) if n > 1 else 0.0
+        agregado[nome] = {"media": media, "desvio": desvio, "ic95": [media - margem, media + margem]}
+    return agregado
+
+
+def correr_monte_carlo(sementes, passos, ficheiros_frota, ficheiro_grafo="matosinhos_5km.graphml",
+                       ficheiro_pois="pontos_interesse_matoshinhos.json",
+                       ficheiro_zonas="zonas_recolha_matosinhos.json", processos=None):
+    """Devolve (resultados por execucao, agregado por ficheiro de frota)."""
+    # garantir que a cache binaria existe antes de arrancar os processos (construida uma vez, em vez
+    # de uma vez por processo)
+    carregar_grafo(ficheiro_grafo)
+
+    tarefas = [(frota, semente, passos) for frota in ficheiros_frota for semente in sementes]
+    processos = processos or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_trabalhador,
+                             initargs=(ficheiro_grafo, ficheiro_pois, ficheiro_zonas)) as executor:
+        blocos = max(1, len(tarefas) // (processos * 4))
+        resultados = list(executor.map(_correr_cenario, tarefas, chunksize=blocos))
+
+    agregado = {frota: agregar([r for r in resultados if r["frota"] == frota]) for frota in ficheiros_frota}
+    return resultados, agregado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo de cenarios TaxiGreen em varios processos")
+    parser.add_argument("--sementes", type=int, default=100, help="numero de sementes por frota")
+    parser.add_argument("--semente-inicial", type=int, default=0)
+    parser.add_argument("--passos", type=int, default=1000)
+    parser.add_argument("--frotas", nargs="+", default=["frota.json"])
+    parser.add_argument("--grafo", default="matosinhos_5km.graphml")
+    parser.add_argument("--pois", default="pontos_interesse_matoshinhos.json")
+    parser.add_argument("--zonas", default="zonas_recolha_matosinhos.json")
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--saida", default="monte_carlo.json")
+    args = parser.parse_args()
+
+    sementes = range(args.semente_inicial, args.semente_inicial + args.sementes)
+    t0 = time.perf_counter()
+    resultados, agregado = correr_monte_carlo(sementes, args.passos, args.frotas, args.grafo,
+                                              args.pois, args.zonas, args.processos)
+    duracao = time.perf_counter() - t0
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump({"agregado": agregado, "execucoes": resultados}, f, ensure_ascii=False, indent=2)
+
+    print(f"{len(resultados)} execucoes em {duracao:.1f}s -> {args.saida}")
+    for frota, kpis in agregado.items():
+        custo = kpis["custo_total"]
+        mortos = kpis["taxis_sem_energia"]
+        print(f"  {frota}: custo {custo['media']:.2f} [{custo['ic95'][0]:.2f}, {custo['ic95'][1]:.2f}] | "
+              f"sem energia {mortos['media']:.2f} [{mortos['ic95'][0]:.2f}, {mortos['ic95'][1]:.2f}]")
+
+
+if __name__ == "__main__":
+    main()
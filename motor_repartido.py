@@ -0,0 +1,268 @@
+import multiprocessing as mp
+import traceback
+
+import numpy as np
+
+import despacho as dp
+import frota as fr
+import matriz_hubs as mh
+import motor_simulacao as ms
+import trafego as tr
+from grafo_compacto import carregar_grafo
+
+# Simulacao repartida por regioes do mapa, cada uma num processo com o seu MotorSimulacao:
+#
+#   python simulacao_batch.py --grafo matosinhos_5km.graphml --regioes 4 --passos 20000
+#
+# Os nos do grafo sao divididos em regioes (particionar: bissecao recursiva pelas coordenadas) e
+# cada taxi pertence ao processo da regiao onde esta. Todos os processos avancam ate ao mesmo passo
+# (a cada `sincronizacao` ticks); ai os taxis que sairam da sua regiao passam, com a rota e o resto
+# do estado, para o processo da regiao nova. Um taxi em servico so muda de processo depois de deixar
+# os passageiros, porque os pedidos sao do despachante que os atribuiu: ate la fica no processo da
+# regiao onde os recolheu, mesmo fora dela (frota.processo diz em que processo esta cada taxi).
+#
+# Cada regiao tem o seu despachante: os pedidos nascem nas zonas de recolha da regiao (com o mesmo
+# ritmo por zona da simulacao num so processo) e sao atribuidos aos taxis dessa regiao; o destino pode
+# ser qualquer zona. Os processos carregam o grafo e as matrizes de hubs da cache binaria mapeada em
+# memoria (como em monte_carlo), partilhada por todos.
+#
+# Sem pedidos os taxis sao independentes uns dos outros (fr.sorteio_uniforme) e o resultado e igual,
+# taxi a taxi, ao de MotorSimulacao. Os checkpoints e o perfil por fases nao estao disponiveis aqui.
+# Com o visualizador: Controlador.acao_simulacao_animada(regioes=4).
+
+
+def particionar(grafo, regioes):
+    """Regiao (0 .. regioes-1) de cada no: corta os nos ao meio (ou na proporcao das regioes de cada
+    lado) pelo eixo mais comprido, recursivamente; as regioes ficam com numeros de nos parecidos."""
+    x = grafo.x * np.cos(np.radians(np.mean(grafo.y))) if grafo.num_nos else grafo.x
+    y = grafo.y
+    regiao = np.zeros(grafo.num_nos, dtype=np.int32)
+    pilha = [(np.arange(grafo.num_nos), 0, regioes)]
+    while pilha:
+        nos, primeira, k = pilha.pop()
+        if k == 1 or not len(nos):
+            regiao[nos] = primeira
+            continue
+        eixo = x[nos] if np.ptp(x[nos]) >= np.ptp(y[nos]) else y[nos]
+        ordem = nos[np.argsort(eixo, kind="stable")]
+        metade = k // 2
+        corte = len(nos) * metade // k
+        pilha.append((ordem[:corte], primeira, metade))
+        pilha.append((ordem[corte:], primeira + metade, k - metade))
+    return regiao
+
+
+def _selecionar(dados, mascara):
+    """As linhas de `mascara` de um conjunto de taxis devolvido por Frota.separar."""
+    selecao = {nome: dados[nome][mascara] for nome in fr.COLUNAS}
+    indices = np.flatnonzero(mascara).tolist()
+    selecao["rotas"] = [dados["rotas"][i] for i in indices]
+    selecao["paradas"] = [dados["paradas"][i] for i in indices]
+    return selecao
+
+
+COLUNAS_VISTA = fr.COLUNAS + ("rotas", "paradas", "processo")
+
+
+class VistaFrota(fr.Frota):
+    """A frota de todas as regioes, na ordem do ficheiro da frota (sem rotas nem paradas), com
+    `processo`, o indice do processo onde esta cada taxi. Os arrays so sao pedidos aos processos
+    quando sao lidos depois de a simulacao avancar (invalidar), e nao a cada avancar_ate."""
+
+    def __init__(self, grafo, atualizar):
+        super().__init__(grafo, [], [])
+        self._atualizar = atualizar
+        self.invalidar()
+
+    def invalidar(self):
+        for nome in COLUNAS_VISTA:
+            self.__dict__.pop(nome, None)
+
+    def __getattr__(self, nome):
+        # so e chamado para os atributos que o objeto nao tem: os da vista, depois de invalidar
+        if nome not in COLUNAS_VISTA:
+            raise AttributeError(nome)
+        self._atualizar()
+        return self.__dict__[nome]
+
+
+def _criar_regiao(config):
+    grafo = carregar_grafo(config["ficheiro_grafo"])
+    sim = ms.MotorSimulacao(grafo, config["pois_frota"], config["algoritmo_procura"], semente=config["semente"],
+                            velocidade_kmh=config["velocidade_kmh"])
+    sim.semente_sorteio = config["semente_sorteio"]
+    sim.frota.juntar(config["taxis"])
+    if config["pedidos_por_hora"] > 0:
+        semente = None if config["semente"] is None else [config["semente"], config["indice"]]
+        sim.usar_despacho(dp.Despachante(sim.grafo, config["recolha"], config["pedidos_por_hora"],
+                                         config["janela_despacho"], segundos_por_passo=sim.segundos_por_passo,
+                                         semente=semente, partilha=config["partilha"],
+                                         desvio_maximo=config["desvio_maximo"], zonas_origem=config["zonas_origem"]))
+    if config["perfis"] is not None:
+        sim.usar_trafego(tr.PerfisVelocidade.de_dict(config["perfis"]), config["hora_inicial"])
+    return sim
+
+
+def _trabalhador(conexao, config):
+    """Ciclo de um processo: avanca a sua regiao e troca taxis com o coordenador (MotorRepartido)."""
+    try:
+        indice, regiao = config["indice"], config["regiao"]
+        sim = _criar_regiao(config)
+        while True:
+            comando, argumento = conexao.recv()
+            if comando == "fim":
+                break
+            if comando == "receber":
+                sim.frota.juntar(argumento)
+            elif comando == "avancar":
+                sim.avancar_ate(argumento)
+                frota = sim.frota
+                destinos = regiao[frota.no_decisao(np.arange(len(frota)))]
+                saem = np.flatnonzero((destinos != indice) & (frota.estado != fr.EM_SERVICO))
+                conexao.send(("ok", (frota.separar(saem), destinos[saem])))
+            elif comando == "vista":
+                conexao.send(("ok", {nome: getattr(sim.frota, nome) for nome in fr.COLUNAS}))
+            elif comando == "kpis":
+                conexao.send(("ok", {"despacho": sim.despacho.resumo() if sim.despacho is not None else None,
+                                     "hora_trafego": sim.hora_trafego, "matrizes_trafego": sim.matrizes_trafego}))
+    except Exception:
+        conexao.send(("erro", traceback.format_exc()))
+    finally:
+        conexao.close()
+
+
+class MotorRepartido:
+    """Simulacao com os taxis repartidos por regioes, uma por processo (ver o comentario do modulo).
+
+    Tem a interface que simulacao_batch.correr_batch, telemetria e o visualizador usam: passo_atual,
+    avancar_ate, executar_passo, calcular_kpis e frota, uma VistaFrota de toda a frota."""
+
+    def __init__(self, ficheiro_grafo, pois_frota, pontos_recolha, ficheiro_frota, regioes=2, semente=None,
+                 sincronizacao=1, pedidos_por_hora=0, janela_despacho=1, partilha=False, desvio_maximo=0.5,
+                 velocidade_kmh=None, ficheiro_perfis=None, hora_inicial=8.0, algoritmo_procura="custo_uniforme"):
+        regioes = max(int(regioes), 1)
+        self.grafo = carregar_grafo(ficheiro_grafo)
+        self.regiao = particionar(self.grafo, regioes)
+        self.sincronizacao = max(int(sincronizacao), 1)
+        self.passo_atual = 0
+        self.perfil = None
+        self.trafego = tr.PerfisVelocidade.de_ficheiro(ficheiro_perfis) if ficheiro_perfis else None
+        self.transferencias = 0
+
+        # frota inicial como em MotorSimulacao.criar_frota (mesma semente, mesmas posicoes)
+        base = ms.MotorSimulacao(self.grafo, pois_frota, algoritmo_procura, semente=semente,
+                                 velocidade_kmh=velocidade_kmh)
+        sucesso, mensagem_erro = base.criar_frota({"recolha": pontos_recolha}, ficheiro_frota)
+        if not sucesso:
+            raise ValueError(f"Nao foi possivel criar a frota: {mensagem_erro}")
+        frota = base.frota
+        if len(np.unique(frota.ids)) != len(frota):
+            raise ValueError("Os ids dos taxis tem de ser unicos para repartir a frota.")
+        self._ids = frota.ids.copy()
+        self._ordem_ids = np.argsort(self._ids)
+        self.frota = VistaFrota(self.grafo, self._atualizar_vista)
+
+        # matriz das zonas construida uma vez, antes de arrancar os processos (que a leem da cache)
+        zonas_origem = [None] * regioes
+        if pedidos_por_hora > 0:
+            nos_zonas = mh.nos_de(self.grafo, pontos_recolha)
+            mh.obter_matriz(self.grafo, nos_zonas)
+            zonas_origem = [np.flatnonzero(self.regiao[nos_zonas] == r) for r in range(regioes)]
+        perfis = self.trafego.para_dict() if self.trafego is not None else None
+
+        self._conexoes = []
+        self._processos = []
+        for indice in range(regioes):
+            no_regiao = np.flatnonzero(self.regiao[frota.no_decisao(np.arange(len(frota)))] == indice)
+            config = {
+                "indice": indice, "regiao": self.regiao, "ficheiro_grafo": ficheiro_grafo,
+                "pois_frota": pois_frota, "recolha": pontos_recolha, "zonas_origem": zonas_origem[indice],
+                "taxis": frota.separar(no_regiao), "semente": semente, "semente_sorteio": base.semente_sorteio,
+                "algoritmo_procura": algoritmo_procura, "velocidade_kmh": velocidade_kmh,
+                "pedidos_por_hora": pedidos_por_hora, "janela_despacho": janela_despacho, "partilha": partilha,
+                "desvio_maximo": desvio_maximo, "perfis": perfis, "hora_inicial": hora_inicial,
+            }
+            conexao, conexao_filho = mp.Pipe()
+            processo = mp.Process(target=_trabalhador, args=(conexao_filho, config), daemon=True)
+            processo.start()
+            conexao_filho.close()
+            self._conexoes.append(conexao)
+            self._processos.append(processo)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+    def fechar(self):
+        for conexao, processo in zip(self._conexoes, self._processos):
+            if processo.is_alive():
+                try:
+                    conexao.send(("fim", None))
+                except (BrokenPipeError, OSError):
+                    pass
+            processo.join(timeout=5)
+            conexao.close()
+        self._conexoes, self._processos = [], []
+
+    def _resposta(self, conexao):
+        estado, valor = conexao.recv()
+        if estado == "erro":
+            raise RuntimeError(f"Erro num processo da simulacao repartida:\n{valor}")
+        return valor
+
+    def _pedir_todos(self, comando, argumento=None):
+        # envia a todos antes de esperar por algum: as regioes trabalham em paralelo
+        for conexao in self._conexoes:
+            conexao.send((comando, argumento))
+        return [self._resposta(conexao) for conexao in self._conexoes]
+
+    def _sincronizar(self, passo):
+        """Todas as regioes ate `passo`; depois os taxis que mudaram de regiao passam de processo."""
+        for dados, destinos in self._pedir_todos("avancar", passo):
+            if not len(destinos):
+                continue
+            self.transferencias += len(destinos)
+            for indice in np.unique(destinos).tolist():
+                self._conexoes[indice].send(("receber", _selecionar(dados, destinos == indice)))
+        self.passo_atual = passo
+
+    def _atualizar_vista(self):
+        partes = self._pedir_todos("vista")
+        ids = np.concatenate([parte["ids"] for parte in partes])
+        # posicao de cada taxi no ficheiro da frota, para a vista ter sempre a mesma ordem
+        posicao = self._ordem_ids[np.searchsorted(self._ids, ids, sorter=self._ordem_ids)]
+        ordem = np.argsort(posicao)
+        for nome in fr.COLUNAS:
+            setattr(self.frota, nome, np.concatenate([parte[nome] for parte in partes])[ordem])
+        self.frota.rotas = [None] * len(ids)
+        self.frota.paradas = [[] for _ in range(len(ids))]
+        self.frota.processo = np.repeat(np.arange(len(partes)), [len(parte["ids"]) for parte in partes])[ordem]
+
+    def avancar_ate(self, passo):
+        if passo <= self.passo_atual:
+            return
+        while self.passo_atual < passo:
+            proximo = (self.passo_atual // self.sincronizacao + 1) * self.sincronizacao
+            self._sincronizar(min(proximo, passo))
+        self.frota.invalidar()
+
+    def executar_passo(self):
+        self.avancar_ate(self.passo_atual + 1)
+
+    def calcular_kpis(self):
+        kpis = ms.kpis_frota(self.frota, self.passo_atual)
+        partes = self._pedir_todos("kpis")
+        resumos = [parte["despacho"] for parte in partes if parte["despacho"] is not None]
+        if resumos:
+            kpis.update(dp.juntar_estatisticas(resumos, self.frota))
+        if self.trafego is not None:
+            # cada regiao obtem as suas matrizes: o trabalho de todas e somado
+            kpis["hora_trafego"] = partes[0]["hora_trafego"]
+            kpis.update(partes[0]["matrizes_trafego"])
+            for nome in ms.KPIS_CACHE:
+                kpis[nome] = sum(parte["matrizes_trafego"][nome] for parte in partes)
+        kpis["regioes"] = len(partes)
+        kpis["transferencias"] = self.transferencias
+        return kpis
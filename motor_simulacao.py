@@ -1,90 +1,93 @@
 import random
-import networkx as nx
 import json
 import os
-import math
-
-def calcular_distancia_haversine(lat1, lon1, lat2, lon2):
-    R = 6371000 
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-def heuristica(G, node_a, node_b):
-    lat1 = G.nodes[node_a]['y']
-    lon1 = G.nodes[node_a]['x']
-    lat2 = G.nodes[node_b]['y']
-    lon2 = G.nodes[node_b]['x']
-    return calcular_distancia_haversine(lat1, lon1, lat2, lon2)
-
-class Taxi:
-    def __init__(self, id, no_inicial, tipo_motor, capacidade, autonomia_max):
-        self.id = id
-        self.posicao_atual = no_inicial
-        
-        self.historico_movimento = [] #utilizado para debug
-        
-        self.objetivo_atual = None 
-        self.rota_atual = []       
-        
-        self.autonomia_maxima = autonomia_max * 1000
-        self.autonomia_atual = self.autonomia_maxima
-        self.custo_total = 0.0
-        self.emissoes_CO2 = 0.0
-        self.estado = "livre" 
-        
-        self.tipo_motor = tipo_motor
-        self.capacidade = capacidade
-        
-        if self.tipo_motor == "eletrico":
-            self.velocidade_carregamento = 500
-            self.custo_por_km = 0.06
-            self.emissao_por_km = 0.0
-        else:
-            self.velocidade_carregamento = self.autonomia_maxima
-            self.custo_por_km = 0.30
-            self.emissao_por_km = 0.11
-
-    def mover_para(self, novo_no, distancia_metros):
-        self.historico_movimento.append(self.posicao_atual)
-        if len(self.historico_movimento) > 20:
-            self.historico_movimento.pop(0)
-            
-        self.posicao_atual = novo_no
-        self.autonomia_atual -= distancia_metros
-        
-        custo_viagem = (distancia_metros / 1000.0) * self.custo_por_km
-        emissoes_viagem = (distancia_metros / 1000.0) * self.emissao_por_km
-        self.custo_total += custo_viagem
-        self.emissoes_CO2 += emissoes_viagem
-
-        if self.autonomia_atual <= 0:
-            self.autonomia_atual = 0
-            self.estado = "sem_energia"
-
-    def carregar(self):
-        if self.autonomia_atual < self.autonomia_maxima:
-            self.autonomia_atual += self.velocidade_carregamento
-            if self.autonomia_atual > self.autonomia_maxima:
-                self.autonomia_atual = self.autonomia_maxima
-            return False
-        else:
-            self.historico_movimento = []
-            return True 
+import time
+import numpy as np
+import algoritmos
+import frota as fr
+import matriz_hubs as mh
+import perfil as pf
+import trafego as tr
+from cache_rotas import CacheRotas
+from grafo_compacto import GrafoCompacto, dijkstra_multi_origem
+from heuristicas import calcular_distancia_haversine, heuristica  # noqa: F401
+
+# com movimento por tempo, limite de nos que um taxi atravessa num passo (arestas de comprimento 0)
+MAX_NOS_POR_PASSO = 64
+
+# contadores das matrizes do trafego, que dependem do que ja esta em cache (ou em memoria) no processo
+KPIS_CACHE = ("tempo_matrizes_s", "matrizes_construidas", "matrizes_reutilizadas", "matrizes_reparadas",
+              "tabelas_postos_reparadas")
+
+
+def kpis_frota(frota, passo):
+    n = len(frota)
+    return {
+        "passo": passo,
+        "num_taxis": n,
+        "custo_total": float(frota.custo.sum()),
+        "co2_total": float(frota.co2.sum()),
+        "autonomia_media_km": float(frota.autonomia.mean() / 1000.0) if n else 0.0,
+        "autonomia_min_km": float(frota.autonomia.min() / 1000.0) if n else 0.0,
+        "taxis_livres": int(np.count_nonzero(frota.estado == fr.LIVRE)),
+        "taxis_a_abastecer": int(np.count_nonzero(frota.estado == fr.A_ABASTECER)),
+        "taxis_sem_energia": int(np.count_nonzero(frota.estado == fr.SEM_ENERGIA)),
+        "taxis_em_servico": int(np.count_nonzero(frota.estado == fr.EM_SERVICO)),
+    }
 
-    def __repr__(self):
-        km_restantes = self.autonomia_atual / 1000
-        return (f"Taxi {self.id} ({self.tipo_motor}) | Aut: {km_restantes:.1f}km | Est: {self.estado}")
 
 class MotorSimulacao:
-    def __init__(self, G, pois_frota_data):
+    def __init__(self, G, pois_frota_data, algoritmo_procura="custo_uniforme", capacidade_cache_rotas=10000,
+                 semente=None, velocidade_kmh=None, segundos_por_passo=10.0):
+        # o networkx so serve para carregar o mapa; o motor trabalha sobre o grafo compacto
         self.G = G
+        self.grafo = G if isinstance(G, GrafoCompacto) else GrafoCompacto.de_networkx(G)
+        self.frota = fr.Frota(self.grafo, [], [])
         self.frota_taxis = []
         self.passo_atual = 0
         self.FATOR_CONSUMO = 1.0
         self.pois_frota = pois_frota_data
+        # gerador proprio para que a mesma semente de sempre a mesma simulacao
+        self.semente = semente
+        self.rng = random.Random(semente)
+        # sorteios por (taxi, passo) do passeio aleatorio, independentes da ordem dos taxis
+        self.semente_sorteio = semente if semente is not None else self.rng.getrandbits(63)
+
+        # algoritmo usado em encontrar_caminho (ver algoritmos.PROCURAS)
+        self.algoritmo_procura = algoritmo_procura
+        self.ultima_procura = None
+        # indice opcional (ALT / contraction hierarchy, ver preprocessamento_rotas)
+        self.indice_rotas = None
+        self._versao_indice_rotas = None
+        # rotas repetidas (recolhas, postos) partilhadas por abastecimento e despacho
+        self.cache_rotas = CacheRotas(capacidade_cache_rotas)
+
+        # tabela "distancia ate ao posto mais proximo" por tipo de motor
+        self.tabela_postos = {}
+        self._assinatura_tabela_postos = None
+
+        # procura de passageiros (opcional, ver despacho.Despachante)
+        self.despacho = None
+
+        # tempos e contadores por fase (opcional, ver perfil.Perfil)
+        self.perfil = None
+
+        # sem velocidade cada passo avanca uma aresta; com velocidade cada passo avanca
+        # velocidade x segundos_por_passo metros ao longo da rota (parando a meio das arestas)
+        self.segundos_por_passo = segundos_por_passo
+        self.metros_por_passo = velocidade_kmh / 3.6 * segundos_por_passo if velocidade_kmh else None
+
+        # trafego opcional (ver usar_trafego): perfis de velocidade por hora e hora em vigor nos pesos
+        self.trafego = None
+        self.hora_inicial = 0.0
+        self.hora_trafego = None
+        # matrizes das zonas obtidas nas mudancas de hora (construidas, ou ja guardadas de antes)
+        self.matrizes_trafego = {"mudancas_hora": 0, "tempo_matrizes_s": 0.0, "matrizes_construidas": 0,
+                                 "matrizes_reutilizadas": 0, "matrizes_reparadas": 0, "tabelas_postos_reparadas": 0}
+        # arvores completas da ultima matriz das zonas e das tabelas dos postos, com os pesos em que foram
+        # calculadas: na mudanca de hora seguinte sao reparadas (matriz_hubs.reparar) em vez de refeitas
+        self._arvores_zonas = None
+        self._arvores_postos = {}
 
     def criar_frota(self, zonas_recolha, config_file="frota.json"):
         lista_pontos_recolha = []
@@ -98,129 +101,384 @@ class MotorSimulacao:
         with open(config_file, 'r', encoding='utf-8') as f:
             config_frota = json.load(f)
 
-        for i, config_taxi in enumerate(config_frota):
-            ponto_inicial = random.choice(lista_pontos_recolha)
-            novo_taxi = Taxi(
-                id=config_taxi["id"],
-                no_inicial=ponto_inicial["id_no"],
-                tipo_motor=config_taxi["tipo_motor"],
-                capacidade=config_taxi["capacidade"],
-                autonomia_max=config_taxi["autonomia_max"]
-            )
-        
+        posicoes_iniciais = []
+        for config_taxi in config_frota:
+            ponto_inicial = self.rng.choice(lista_pontos_recolha)
+            posicoes_iniciais.append(self.grafo.indice[ponto_inicial["id_no"]])
 
-            self.frota_taxis.append(novo_taxi)
+        self.frota = fr.Frota(self.grafo, config_frota, posicoes_iniciais)
+        self.frota_taxis = self.frota.taxis()
         
         return True, ""
 
-    def encontrar_caminho(self, origem, destino):
-        try:
-            caminho = nx.dijkstra_path(self.G, origem, destino, weight='length')
-            distancia = nx.path_weight(self.G, caminho, weight='length')
+    def procurar_caminho(self, i_origem, i_destino):
+        """Como encontrar_caminho, mas com indices do grafo compacto. Devolve (array de indices, custo), com
+        o custo nos pesos das procuras (metros, ou segundos com trafego; ver algoritmos.calcula_custo)."""
+        em_cache = self.cache_rotas.obter(i_origem, i_destino, self.grafo.versao)
+        if em_cache is not None:
+            caminho, distancia = em_cache
+            if not len(caminho):
+                return None, float('inf')
             return caminho, distancia
-        except nx.NetworkXNoPath:
+
+        if self.indice_rotas is not None and self._versao_indice_rotas == self.grafo.versao:
+            procura = self.indice_rotas.procura
+        else:
+            procura = algoritmos.PROCURAS[self.algoritmo_procura]
+        if self.perfil is not None:
+            inicio = time.perf_counter()
+        resultado = procura(self.grafo, i_origem, i_destino)
+        self.ultima_procura = resultado
+        if self.perfil is not None:
+            self.perfil.fase("procura_rotas", inicio)
+            self.perfil.contar("nos_expandidos", resultado.nos_expandidos)
+        self.cache_rotas.guardar(i_origem, i_destino, resultado.caminho, resultado.custo, self.grafo.versao)
+        if resultado.caminho is None:
+            return None, float('inf')
+        return np.asarray(resultado.caminho, dtype=np.int32), resultado.custo
+
+    def encontrar_caminho(self, origem, destino):
+        indice = self.grafo.indice
+        if origem not in indice or destino not in indice:
+            return None, float('inf')
+        caminho, distancia = self.procurar_caminho(indice[origem], indice[destino])
+        if caminho is None:
             return None, float('inf')
+        return self.grafo.ids[caminho].tolist(), distancia
+
+    def usar_indice_rotas(self, indice_rotas):
+        # o indice deixa de ser usado se o grafo for alterado depois disto; e das distancias, por isso
+        # nunca vale com pesos de trafego
+        self.indice_rotas = indice_rotas
+        self._versao_indice_rotas = None if self.grafo.tem_pesos() else self.grafo.versao
+
+    def usar_despacho(self, despacho):
+        if despacho.segundos_por_passo != self.segundos_por_passo:
+            # as esperas, a taxa de chegada e as horas do despacho sao contadas em passos
+            raise ValueError(f"O despacho usa passos de {despacho.segundos_por_passo} s e o motor de "
+                             f"{self.segundos_por_passo} s.")
+        self.despacho = despacho
+        if self.metros_por_passo is not None:
+            # o despacho converte esperas (passos) em distancia
+            despacho.metros_por_passo = self.metros_por_passo
+
+    def usar_trafego(self, perfis, hora_inicial=8.0):
+        """Procuras pelo tempo de percurso, com as velocidades de `perfis` (trafego.PerfisVelocidade)
+        na hora do dia de cada passo (a simulacao comeca as hora_inicial). Com velocidade_kmh os
+        taxis andam a velocidade do perfil de cada aresta.
+
+        Os pesos do grafo passam a ser os dessa hora; a cada mudanca de hora o despacho passa para a
+        matriz das zonas desses pesos (guardada, se a hora ja foi vista, ou reparada a partir da anterior:
+        matriz_hubs.reparar), a tabela dos postos e reparada quando for precisa e as rotas em cache
+        deixam de valer."""
+        self.trafego = perfis
+        self.hora_inicial = hora_inicial
+        self.hora_trafego = None
+        self._atualizar_trafego()
+
+    def _atualizar_trafego(self, hora=None):
+        if hora is None:
+            hora = tr.hora_do_passo(self.passo_atual, self.segundos_por_passo, self.hora_inicial)
+        if hora == self.hora_trafego:
+            return
+        # a primeira hora nao conta como mudanca
+        estatisticas = self.matrizes_trafego if self.hora_trafego is not None else {}
+        inicio = time.perf_counter()
+        grafo = self.grafo
+        grafo.definir_pesos(self.trafego.pesos(grafo, hora))
+        if self.despacho is not None:
+            # a mesma hora ja vista (por exemplo, no dia seguinte) ja tem a matriz guardada
+            nos = self.despacho.tabelas.nos
+            matriz = mh.em_cache(grafo, nos)
+            if matriz is not None:
+                estatisticas["matrizes_reutilizadas"] = estatisticas.get("matrizes_reutilizadas", 0) + 1
+            elif self._arvores_zonas is not None and self._arvores_zonas[0] is grafo \
+                    and np.array_equal(self._arvores_zonas[2].nos, nos):
+                # so as arvores dos hubs que usam arestas cujo tempo mudou sao refeitas
+                _, pesos, anterior, arvores = self._arvores_zonas
+                matriz, arvores, _ = mh.reparar(grafo, anterior, arvores, pesos)
+                self._arvores_zonas = (grafo, grafo.pesos, matriz, arvores)
+                matriz = mh.registar(grafo, matriz)
+                estatisticas["matrizes_reparadas"] = estatisticas.get("matrizes_reparadas", 0) + 1
+            else:
+                matriz, arvores = mh.construir_com_arvores(grafo, nos)
+                self._arvores_zonas = (grafo, grafo.pesos, matriz, arvores)
+                matriz = mh.registar(grafo, matriz)
+                estatisticas["matrizes_construidas"] = estatisticas.get("matrizes_construidas", 0) + 1
+            self.despacho.usar_tabelas(matriz)
+        if estatisticas is self.matrizes_trafego:
+            estatisticas["mudancas_hora"] += 1
+            estatisticas["tempo_matrizes_s"] += time.perf_counter() - inicio
+        self.hora_trafego = hora
+
+    def ativar_perfil(self, perfil=None):
+        """Passa a medir o tempo de cada fase do tick; devolve o perfil (perfil.Perfil)."""
+        self.perfil = perfil if perfil is not None else pf.Perfil()
+        return self.perfil
+
+    def desativar_perfil(self):
+        perfil, self.perfil = self.perfil, None
+        return perfil
+
+    def _assinatura_postos(self):
+        ids_eletricos = tuple(p['id_no'] for p in self.pois_frota.get('carregadores_eletricos', []))
+        ids_gasolina = tuple(p['id_no'] for p in self.pois_frota.get('bombas_gasolina', []))
+        return (id(self.grafo), self.grafo.versao, ids_eletricos, ids_gasolina)
 
-    def encontrar_poi_mais_proximo(self, taxi):
-        if taxi.tipo_motor == 'eletrico':
-            lista_pois = self.pois_frota.get('carregadores_eletricos', [])
+    def _tabela_multi_origem(self, lista_pois):
+        origens = [self.grafo.indice[p['id_no']] for p in lista_pois if p['id_no'] in self.grafo.indice]
+        if self.perfil is not None:
+            inicio = time.perf_counter()
+        # distancia de cada no ate ao posto mais proximo = Dijkstra no grafo invertido
+        if not self.grafo.tem_pesos():
+            tabela = dijkstra_multi_origem(self.grafo, origens, reverso=True)
         else:
-            lista_pois = self.pois_frota.get('bombas_gasolina', [])
-        
-        melhor_distancia = float('inf')
-        melhor_no = None
-
-        for poi in lista_pois:
-            no_destino = poi['id_no']
-            try:
-                dist = nx.shortest_path_length(self.G, taxi.posicao_atual, no_destino, weight='length')
-                if dist < melhor_distancia:
-                    melhor_distancia = dist
-                    melhor_no = no_destino
-            except nx.NetworkXNoPath:
-                continue
+            # com trafego o posto mais proximo e o de menor tempo, mas a autonomia conta em metros
+            tempos, postos, proximos = self._arvore_postos(origens)
+            tabela = (mh.metros_da_arvore(self.grafo, tempos, proximos), postos)
+        if self.perfil is not None:
+            self.perfil.fase("tabela_postos", inicio)
+            self.perfil.contar("nos_expandidos", int(np.count_nonzero(tabela[1] >= 0)))
+        return tabela
+
+    def _arvore_postos(self, origens):
+        # a arvore da hora anterior e reparada a partir das arestas cujo tempo mudou (ou refeita, se
+        # a reparacao chegar a grande parte do grafo)
+        grafo, chave = self.grafo, tuple(origens)
+        anterior = self._arvores_postos.get(chave)
+        reparada = None
+        if anterior is not None and anterior[0] is grafo:
+            _, pesos, tempos, proximos, postos = anterior
+            reparada = mh.reparar_arvore(grafo, tempos, proximos, mh.alteracoes(grafo, pesos))
+        if reparada is None:
+            tempos, postos, proximos = dijkstra_multi_origem(grafo, origens, reverso=True, com_anterior=True)
+        else:
+            tempos, proximos, reparados = reparada
+            if reparados:
+                postos = mh.raizes_da_arvore(tempos, proximos)
+            self.matrizes_trafego["tabelas_postos_reparadas"] += 1
+        self._arvores_postos[chave] = (grafo, grafo.pesos, tempos, proximos, postos)
+        return tempos, postos, proximos
+
+    def construir_tabela_postos(self):
+        self.tabela_postos = {
+            'eletrico': self._tabela_multi_origem(self.pois_frota.get('carregadores_eletricos', [])),
+            'gasolina': self._tabela_multi_origem(self.pois_frota.get('bombas_gasolina', [])),
+        }
+        self._assinatura_tabela_postos = self._assinatura_postos()
 
-        return melhor_no, melhor_distancia
+    def invalidar_tabela_postos(self):
+        self._assinatura_tabela_postos = None
+
+    def _garantir_tabela_postos(self):
+        if self._assinatura_tabela_postos != self._assinatura_postos():
+            self.construir_tabela_postos()
+
+    def encontrar_poi_mais_proximo(self, taxi, verificar_tabela=True):
+        if verificar_tabela:
+            self._garantir_tabela_postos()
+
+        tipo = 'eletrico' if taxi.tipo_motor == 'eletrico' else 'gasolina'
+        distancias, posto_mais_proximo = self.tabela_postos[tipo]
+
+        i = self.grafo.indice.get(taxi.posicao_atual)
+        if i is None or posto_mais_proximo[i] < 0:
+            return None, float('inf')
+        return self.grafo.id_no(posto_mais_proximo[i]), float(distancias[i])
 
     def verificar_e_atribuir_abastecimento(self):
-        for taxi in self.frota_taxis:
-            if taxi.estado != 'livre' or taxi.autonomia_atual <= 0:
+        frota = self.frota
+        candidatos = frota.precisam_abastecer()
+        if not len(candidatos):
+            return
+        self._garantir_tabela_postos()
+
+        for codigo_motor, tipo in enumerate(fr.NOMES_MOTOR):
+            grupo = candidatos[frota.motor[candidatos] == codigo_motor]
+            if not len(grupo):
                 continue
+            distancias, postos = self.tabela_postos[tipo]
+            nos = frota.no_decisao(grupo)
+            dist_metros = distancias[nos]
+            destinos = postos[nos]
 
-            threshold = taxi.autonomia_maxima * 0.20 
-            
-            if taxi.autonomia_atual <= threshold:
-                destino_abastecimento, dist_metros = self.encontrar_poi_mais_proximo(taxi)
-                
-                if destino_abastecimento is None:
-                    continue
-
-                custo_real_viagem = dist_metros * self.FATOR_CONSUMO
-                margem_seguranca = custo_real_viagem * 1.10
-
-                if margem_seguranca < taxi.autonomia_atual:
-                    caminho, _ = self.encontrar_caminho(taxi.posicao_atual, destino_abastecimento)
-                    if caminho:
-                        taxi.estado = 'a_abastecer' 
-                        taxi.objetivo_atual = destino_abastecimento
-                        taxi.rota_atual = caminho
+            margem_seguranca = dist_metros * self.FATOR_CONSUMO * 1.10
+            viaveis = (destinos >= 0) & (margem_seguranca < frota.autonomia[grupo])
+
+            for i, no, destino_abastecimento in zip(grupo[viaveis], nos[viaveis], destinos[viaveis]):
+                caminho, _ = self.procurar_caminho(int(no), int(destino_abastecimento))
+                if caminho is not None and len(caminho):
+                    frota.estado[i] = fr.A_ABASTECER
+                    frota.objetivo[i] = destino_abastecimento
+                    frota.definir_rota(i, caminho)
+
+    def _passeio_aleatorio(self, indices, contador=None):
+        """Proximo no de cada taxi livre sem rota: um vizinho ao acaso, ou um no qualquer se estiver preso."""
+        frota, grafo = self.frota, self.grafo
+        contador = self.passo_atual if contador is None else contador
+        sorteio = fr.sorteio_uniforme(self.semente_sorteio, frota.ids[indices], contador)
+        posicoes = frota.posicao[indices]
+
+        grau = (grafo.offsets[posicoes + 1] - grafo.offsets[posicoes])
+        grau_rev = (grafo.offsets_rev[posicoes + 1] - grafo.offsets_rev[posicoes])
+        proximos = (sorteio * grafo.num_nos).astype(np.int32)
+
+        tem_saida = grau > 0
+        escolha = (grafo.offsets[posicoes[tem_saida]] + (sorteio[tem_saida] * grau[tem_saida]).astype(np.int64))
+        proximos[tem_saida] = grafo.destinos[escolha]
+
+        so_entrada = ~tem_saida & (grau_rev > 0)
+        escolha = (grafo.offsets_rev[posicoes[so_entrada]]
+                   + (sorteio[so_entrada] * grau_rev[so_entrada]).astype(np.int64))
+        proximos[so_entrada] = grafo.origens_rev[escolha]
+
+        presos = frota.contagem_no_historico(indices) >= 10
+        teleporte = presos | (~tem_saida & ~so_entrada)
+        proximos[teleporte] = (sorteio[teleporte] * grafo.num_nos).astype(np.int32)
+        frota.limpar_historico(indices[teleporte])
+        return proximos
+
+    def _proximas_arestas(self, indices, contador=None):
+        """Proximo no (e comprimento da aresta ate ele) de cada taxi: o seguinte da rota, um vizinho ao
+        acaso se estiver livre sem rota, ou -1 (fica parado, por exemplo a abastecer sem rota)."""
+        frota = self.frota
+        proximos = np.full(len(indices), -1, dtype=np.int32)
+        comprimentos = np.zeros(len(indices), dtype=np.float64)
+        rotas = frota.rotas
+        for k, i in enumerate(indices.tolist()):
+            if rotas[i]:
+                proximos[k], comprimentos[k] = rotas[i].avancar()
+
+        errantes = (proximos < 0) & (frota.estado[indices] == fr.LIVRE)
+        if errantes.any():
+            proximos[errantes] = self._passeio_aleatorio(indices[errantes], contador)
+            comprimentos[errantes] = self.grafo.comprimentos_arestas(frota.posicao[indices[errantes]],
+                                                                     proximos[errantes])
+        return proximos, comprimentos
+
+    def _avancar_taxis(self, indices):
+        """Avanca um no cada taxi: pela rota, se tiver, ou em passeio aleatorio se estiver livre.
+
+        Com movimento por tempo avanca antes metros_por_passo metros (ver _avancar_por_distancia).
+        Devolve os indices dos taxis que se moveram."""
+        if self.metros_por_passo is not None:
+            return self._avancar_por_distancia(indices)
+        frota = self.frota
+        proximos, distancias = self._proximas_arestas(indices)
+        movem = proximos >= 0
+        indices, proximos = indices[movem], proximos[movem]
+        if len(indices):
+            frota.mover(indices, proximos, distancias[movem] * self.FATOR_CONSUMO)
+        if self.despacho is not None:
+            self.despacho.seguir_paradas(self, indices)
+        return indices
+
+    def _velocidades(self, taxis):
+        """Metros por segundo de cada taxi na aresta em que esta, com o trafego da hora."""
+        frota = self.frota
+        tempos = self.grafo.pesos_arestas(frota.posicao[taxis], frota.proximo[taxis])
+        comprimentos = frota.comprimento_aresta[taxis]
+        velocidades = np.full(len(taxis), np.inf)
+        np.divide(comprimentos, tempos, out=velocidades, where=tempos > 0)
+        return velocidades
+
+    def _avancar_por_distancia(self, indices):
+        """Cada taxi percorre metros_por_passo metros: atravessa os nos que couberem nessa distancia
+        (com as mesmas decisoes em cada no que no movimento aresta a aresta) e o resto fica como
+        progresso na aresta seguinte. Com trafego percorre segundos_por_passo segundos, a
+        velocidade do perfil de cada aresta."""
+        frota = self.frota
+        com_trafego = self.trafego is not None
+        orcamento = np.full(len(indices), self.segundos_por_passo if com_trafego else self.metros_por_passo)
+        movidos = np.zeros(len(indices), dtype=bool)
+        ativos = np.arange(len(indices))
+        for iteracao in range(MAX_NOS_POR_PASSO):
+            if not len(ativos):
+                break
+            taxis = indices[ativos]
+            num_no = frota.proximo[taxis] < 0
+            if num_no.any():
+                partem = taxis[num_no]
+                # cada no atravessado no mesmo passo tem o seu sorteio
+                proximos, comprimentos = self._proximas_arestas(partem, self.passo_atual * MAX_NOS_POR_PASSO + iteracao)
+                frota.proximo[partem] = proximos
+                frota.comprimento_aresta[partem] = comprimentos
+                frota.progresso[partem] = 0.0
+                em_aresta = frota.proximo[taxis] >= 0
+                ativos, taxis = ativos[em_aresta], taxis[em_aresta]
+
+            falta = frota.comprimento_aresta[taxis] - frota.progresso[taxis]
+            if com_trafego:
+                velocidades = self._velocidades(taxis)
+                percorrido = np.minimum(orcamento[ativos] * velocidades, falta)
+                orcamento[ativos] = np.maximum(orcamento[ativos] - percorrido / velocidades, 0.0)
+            else:
+                percorrido = np.minimum(orcamento[ativos], falta)
+                orcamento[ativos] -= percorrido
+            frota.progresso[taxis] += percorrido
+            movidos[ativos] = True
+            frota.consumir(taxis, percorrido * self.FATOR_CONSUMO)
+
+            chegam = (percorrido >= falta) & (frota.estado[taxis] != fr.SEM_ENERGIA)
+            chegados = taxis[chegam]
+            frota.chegar(chegados, frota.proximo[chegados])
+            frota.proximo[chegados] = -1
+            frota.progresso[chegados] = 0.0
+            frota.comprimento_aresta[chegados] = 0.0
+            if self.despacho is not None:
+                self.despacho.seguir_paradas(self, chegados)
+
+            # continuam os que chegaram a um no com distancia por fazer, exceto quem chegou ao posto
+            ativos = ativos[chegam]
+            estado = frota.estado[chegados]
+            no_posto = (estado == fr.A_ABASTECER) & (frota.posicao[chegados] == frota.objetivo[chegados])
+            ativos = ativos[(orcamento[ativos] > 0) & (estado != fr.SEM_ENERGIA) & ~no_posto]
+        return indices[movidos]
 
     def executar_passo(self):
+        frota = self.frota
+        perfil = self.perfil
+        if perfil is not None:
+            t = perfil.iniciar_passo(frota)
+        if self.trafego is not None:
+            self._atualizar_trafego()
+            if perfil is not None:
+                t = perfil.fase("trafego", t)
+        if self.despacho is not None and self.passo_atual % self.despacho.janela == 0:
+            self.despacho.processar(self)
+            if perfil is not None:
+                t = perfil.fase("despacho", t)
         self.verificar_e_atribuir_abastecimento()
+        if perfil is not None:
+            t = perfil.fase("abastecimento", t)
 
-        for taxi in self.frota_taxis:
-            
-            if taxi.estado == "sem_energia":
-                continue
+        a_carregar = np.flatnonzero((frota.estado == fr.A_ABASTECER) & (frota.posicao == frota.objetivo)
+                                    & (frota.proximo < 0))
+        if len(a_carregar):
+            cheios = a_carregar[frota.carregar(a_carregar)]
+            frota.estado[cheios] = fr.LIVRE
+            frota.objetivo[cheios] = -1
+        if perfil is not None:
+            t = perfil.fase("carregamento", t)
 
-            if taxi.estado == "a_abastecer" and taxi.posicao_atual == taxi.objetivo_atual:
-                esta_cheio = taxi.carregar()
-                if esta_cheio:
-                    taxi.estado = "livre"
-                    taxi.objetivo_atual = None
-                continue 
-            
-            if taxi.estado == "livre" or taxi.estado == "a_abastecer":
-                
-                proximo_no = None
-                
-                if taxi.rota_atual:
-                    proximo_no = taxi.rota_atual.pop(0)
-                
-                elif taxi.estado == "livre":
-                    pos_atual = taxi.posicao_atual
-                    
-                    if taxi.historico_movimento.count(pos_atual) >= 10:
-                        todos_nos = list(self.G.nodes)
-                        proximo_no = random.choice(todos_nos)
-                        taxi.historico_movimento = [] 
-                    else:
-                        try:
-                            vizinhos = list(self.G.neighbors(pos_atual))
-                            if not vizinhos: 
-                                vizinhos = list(self.G.predecessors(pos_atual))
-                            
-                            if vizinhos:
-                                proximo_no = random.choice(vizinhos)
-                            else:
-                                todos_nos = list(self.G.nodes)
-                                proximo_no = random.choice(todos_nos)
-                                taxi.historico_movimento = []
-
-                        except (nx.NetworkXError, KeyError, IndexError):
-                            continue
-
-                if proximo_no:
-                    distancia = 0
-                    try:
-                        distancia = self.G[taxi.posicao_atual][proximo_no][0]['length']
-                    except KeyError:
-                        try:
-                            distancia = self.G[proximo_no][taxi.posicao_atual][0]['length']
-                        except KeyError:
-                            distancia = 0 
-                    
-                    distancia_consumida = distancia * self.FATOR_CONSUMO
-                    taxi.mover_para(proximo_no, distancia_consumida)
-        
-        self.passo_atual += 1
\ No newline at end of file
+        em_movimento = (frota.estado == fr.LIVRE) | (frota.estado == fr.A_ABASTECER) | (frota.estado == fr.EM_SERVICO)
+        em_movimento[a_carregar] = False
+        self._avancar_taxis(np.flatnonzero(em_movimento))
+        if perfil is not None:
+            perfil.fase("movimento", t)
+
+        self.passo_atual += 1
+
+    def avancar_ate(self, passo):
+        while self.passo_atual < passo:
+            self.executar_passo()
+
+    def calcular_kpis(self):
+        frota = self.frota
+        kpis = kpis_frota(frota, self.passo_atual)
+        if self.despacho is not None:
+            kpis.update(self.despacho.estatisticas(frota))
+        if self.trafego is not None:
+            kpis["hora_trafego"] = self.hora_trafego
+            kpis.update(self.matrizes_trafego)
+        return kpis
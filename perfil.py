@@ -0,0 +1,139 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+import frota as fr
+
+# Instrumentacao da simulacao. Com motor.ativar_perfil() o motor acumula o tempo de cada fase do
+# tick (despacho, abastecimento, carregamento, movimento; e, dentro delas, procura de rotas e
+# tabelas de postos) e conta procuras, nos expandidos e taxis por estado. Sem perfil ativo
+# (motor.perfil = None, o normal) o custo e um `if` por fase.
+#
+# Para ver o que se passa dentro de cada fase ha a Captura, que corre um bloco (por exemplo
+# sim.avancar_ate(N)) com cProfile e/ou tracemalloc.
+
+# fases medidas dentro de outras (o seu tempo tambem conta na fase de fora)
+FASES_INTERNAS = ("procura_rotas", "tabela_postos")
+
+
+class Perfil:
+    def __init__(self):
+        self.tempos = defaultdict(float)
+        self.chamadas = defaultdict(int)
+        self.contadores = defaultdict(int)
+        self.passos = 0
+        self.taxis_por_estado = np.zeros(len(fr.NOMES_ESTADO), dtype=np.int64)
+        self.t0 = time.perf_counter()
+
+    def iniciar_passo(self, frota):
+        """Conta um tick e os taxis em cada estado nesse tick. Devolve o instante atual."""
+        self.passos += 1
+        self.taxis_por_estado += np.bincount(frota.estado, minlength=len(self.taxis_por_estado))
+        return time.perf_counter()
+
+    def fase(self, nome, inicio):
+        """Soma a `nome` o tempo desde `inicio` e devolve o instante atual (inicio da fase seguinte)."""
+        agora = time.perf_counter()
+        self.tempos[nome] += agora - inicio
+        self.chamadas[nome] += 1
+        return agora
+
+    def contar(self, nome, n=1):
+        self.contadores[nome] += n
+
+    def relatorio(self, motor=None):
+        duracao = time.perf_counter() - self.t0
+        fases = {
+            nome: {"total_s": total, "chamadas": self.chamadas[nome],
+                   "media_ms": 1000.0 * total / self.chamadas[nome], "fracao": total / duracao if duracao else 0.0}
+            for nome, total in sorted(self.tempos.items(), key=lambda item: -item[1])
+        }
+        relatorio = {
+            "duracao_s": duracao,
+            "passos": self.passos,
+            "passos_por_s": self.passos / duracao if duracao else 0.0,
+            "fases": fases,
+            "contadores": dict(self.contadores),
+            "taxis_por_estado": {nome: float(n) / max(self.passos, 1)
+                                 for nome, n in zip(fr.NOMES_ESTADO, self.taxis_por_estado)},
+        }
+        if motor is not None:
+            relatorio["cache_rotas"] = motor.cache_rotas.estatisticas()
+        return relatorio
+
+
+def formatar(relatorio):
+    """Texto do relatorio para a consola."""
+    linhas = [f"{relatorio['passos']} passos em {relatorio['duracao_s']:.2f}s "
+              f"({relatorio['passos_por_s']:.0f} passos/s)"]
+    fases = relatorio["fases"]
+    for nome in sorted(fases, key=lambda nome: nome in FASES_INTERNAS):
+        fase = fases[nome]
+        if nome in FASES_INTERNAS:
+            nome = f"  {nome}"
+        linhas.append(f"  {nome:<20} {fase['total_s']:8.3f}s  {100 * fase['fracao']:5.1f}%  "
+                      f"{fase['chamadas']:>8} x {fase['media_ms']:.3f} ms")
+    for nome, n in relatorio["contadores"].items():
+        linhas.append(f"  {nome:<20} {n}")
+    if "cache_rotas" in relatorio:
+        cache = relatorio["cache_rotas"]
+        linhas.append(f"  cache de rotas       {cache['acertos']} acertos / {cache['falhas']} falhas "
+                      f"({100 * cache['taxa_acerto']:.1f}%)")
+    linhas.append("  taxis por estado     " + ", ".join(
+        f"{nome} {media:.1f}" for nome, media in relatorio["taxis_por_estado"].items()))
+    return "\n".join(linhas)
+
+
+class Captura:
+    """cProfile e/ou tracemalloc a volta de um bloco:
+
+        with Captura(memoria=True) as captura:
+            sim.avancar_ate(sim.passo_atual + 500)
+        print(captura.relatorio())
+    """
+
+    def __init__(self, cprofile=True, memoria=False, linhas=25):
+        self.cprofile = cprofile
+        self.memoria = memoria
+        self.linhas = linhas
+        self.perfilador = None
+        self.memoria_pico = 0
+        self._instantaneo = None
+
+    def __enter__(self):
+        if self.memoria:
+            tracemalloc.start()
+        if self.cprofile:
+            self.perfilador = cProfile.Profile()
+            self.perfilador.enable()
+        return self
+
+    def __exit__(self, *erro):
+        if self.perfilador is not None:
+            self.perfilador.disable()
+        if self.memoria:
+            self._instantaneo = tracemalloc.take_snapshot()
+            self.memoria_pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return False
+
+    def guardar(self, caminho):
+        """Escreve as estatisticas do cProfile (para pstats, snakeviz, ...)."""
+        self.perfilador.dump_stats(caminho)
+
+    def relatorio(self):
+        partes = []
+        if self.perfilador is not None:
+            texto = io.StringIO()
+            pstats.Stats(self.perfilador, stream=texto).sort_stats("cumulative").print_stats(self.linhas)
+            partes.append(texto.getvalue())
+        if self._instantaneo is not None:
+            partes.append(f"memoria: pico {self.memoria_pico / 2**20:.1f} MiB; maiores alocacoes ainda vivas:")
+            for estatistica in self._instantaneo.statistics("lineno")[:self.linhas]:
+                partes.append(f"  {estatistica}")
+        return "\n".join(partes)
@@ -0,0 +1,403 @@
+import argparse
+import heapq
+import os
+import random
+import time
+
+import numpy as np
+
+import algoritmos
+from grafo_compacto import carregar_grafo, dijkstra_multi_origem
+
+# Pre-processamento opcional do grafo para responder a consultas ponto-a-ponto
+# mais depressa que o Dijkstra simples:
+#   - IndiceALT: A* com limites inferiores dados por marcos (landmarks) e desigualdade triangular
+#   - HierarquiaContracao: contraction hierarchies, procura bidirecional so "para cima"
+# Ambos expoem procura(grafo, inicio, fim) -> algoritmos.ResultadoProcura e podem ser
+# guardados ao lado do .graphml (ver carregar_ou_construir).
+#
+# Os indices sao das distancias (comprimentos das arestas): ficam associados ao grafo pelo
+# hash_conteudo, que nao depende dos pesos de trafego, e nao se constroem nem usam num grafo
+# com pesos proprios (GrafoCompacto.definir_pesos).
+
+
+def _sem_pesos(grafo):
+    if grafo.tem_pesos():
+        raise ValueError("Os indices de rotas sao das distancias: o grafo nao pode ter pesos proprios (trafego).")
+
+
+class IndiceALT:
+    def __init__(self, marcos, dist_de, dist_para, assinatura):
+        self.marcos = marcos
+        self.dist_de = dist_de        # dist_de[l, v]   = d(marco l -> v)
+        self.dist_para = dist_para    # dist_para[l, v] = d(v -> marco l)
+        self.assinatura = assinatura
+        self.marcos_ativos = 4
+        self._linhas = {}
+
+    @classmethod
+    def construir(cls, grafo, num_marcos=16, semente=0):
+        _sem_pesos(grafo)
+        # escolha "farthest": cada novo marco e o no mais afastado dos marcos ja escolhidos
+        rng = random.Random(semente)
+        dist_inicial, _ = dijkstra_multi_origem(grafo, [rng.randrange(grafo.num_nos)])
+        dist_inicial[~np.isfinite(dist_inicial)] = -1
+        marcos = [int(np.argmax(dist_inicial))]
+        dist_de, dist_para = [], []
+        proximidade = np.full(grafo.num_nos, np.inf)
+
+        while True:
+            l = marcos[-1]
+            de, _ = dijkstra_multi_origem(grafo, [l])
+            para, _ = dijkstra_multi_origem(grafo, [l], reverso=True)
+            dist_de.append(de)
+            dist_para.append(para)
+            if len(marcos) == min(num_marcos, grafo.num_nos):
+                break
+            proximidade = np.minimum(proximidade, np.where(np.isfinite(de + para), de + para, np.inf))
+            candidatos = np.where(np.isfinite(proximidade), proximidade, -1)
+            candidatos[marcos] = -1
+            marcos.append(int(np.argmax(candidatos)))
+
+        return cls(np.array(marcos, dtype=np.int32),
+                   np.array(dist_de, dtype=np.float64),
+                   np.array(dist_para, dtype=np.float64),
+                   grafo.hash_conteudo())
+
+    def guardar(self, caminho):
+        np.savez(caminho, tipo="alt", marcos=self.marcos, dist_de=self.dist_de,
+                 dist_para=self.dist_para, assinatura=self.assinatura)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as dados:
+            # indices antigos, com as tabelas em float32, nao dao limites admissiveis: ficam sem
+            # assinatura, para serem reconstruidos
+            assinatura = str(dados["assinatura"]) if dados["dist_de"].dtype == np.float64 else ""
+            return cls(dados["marcos"], dados["dist_de"], dados["dist_para"], assinatura)
+
+    def _linha(self, tabela, l):
+        chave = (tabela, l)
+        if chave not in self._linhas:
+            array = self.dist_de if tabela == "de" else self.dist_para
+            self._linhas[chave] = array[l].tolist()
+        return self._linhas[chave]
+
+    def heuristica_para(self, inicio, fim):
+        """Heuristica ALT para o destino `fim`, so com os marcos que dao melhor limite em `inicio`."""
+        limites = []
+        for l in range(len(self.marcos)):
+            para_fim, de_fim = self.dist_para[l, fim], self.dist_de[l, fim]
+            if not (np.isfinite(para_fim) and np.isfinite(de_fim)):
+                continue
+            limite = max(self.dist_para[l, inicio] - para_fim, de_fim - self.dist_de[l, inicio])
+            limites.append((limite, l))
+        limites.sort(reverse=True)
+
+        termos = []
+        for _, l in limites[:self.marcos_ativos]:
+            termos.append((self._linha("para", l), float(self.dist_para[l, fim]),
+                           self._linha("de", l), float(self.dist_de[l, fim])))
+
+        def h(v):
+            melhor = 0.0
+            for para, para_fim, de, de_fim in termos:
+                limite = para[v] - para_fim
+                if limite > melhor:
+                    melhor = limite
+                limite = de_fim - de[v]
+                if limite > melhor:
+                    melhor = limite
+            return melhor
+
+        return h
+
+    def procura(self, grafo, inicio, fim):
+        return algoritmos.procura_A_estrela(grafo, inicio, fim, h=self.heuristica_para(inicio, fim))
+
+
+class HierarquiaContracao:
+    def __init__(self, ordem, subir, descer, atalhos, assinatura):
+        self.ordem = ordem            # ordem[v] = posicao de v na contracao
+        self.subir = subir            # (offsets, destinos, pesos): arestas v->w com ordem[w] > ordem[v]
+        self.descer = descer          # (offsets, origens, pesos): arestas u->v com ordem[u] > ordem[v], vistas a partir de v
+        self.atalhos = atalhos        # (u, w, meio): atalho u->w substitui u->meio->w
+        self.assinatura = assinatura
+        self._preparar_listas()
+
+    def _preparar_listas(self):
+        self._subir = tuple(a.tolist() for a in self.subir)
+        self._descer = tuple(a.tolist() for a in self.descer)
+        u, w, meio = self.atalhos
+        self._meio = dict(zip(zip(u.tolist(), w.tolist()), meio.tolist()))
+
+    @classmethod
+    def construir(cls, grafo, limite_testemunha=60):
+        _sem_pesos(grafo)
+        n = grafo.num_nos
+        saida = [dict() for _ in range(n)]
+        entrada = [dict() for _ in range(n)]
+        for u in range(n):
+            for k in range(grafo.offsets[u], grafo.offsets[u + 1]):
+                v = int(grafo.destinos[k])
+                saida[u][v] = float(grafo.comprimentos[k])
+                entrada[v][u] = saida[u][v]
+
+        meio = {}
+        contraidos = [False] * n
+        vizinhos_contraidos = [0] * n
+
+        def procura_testemunha(origem, excluido, limite, alvos):
+            # Dijkstra limitado no grafo que resta, sem passar pelo no a contrair
+            dist = {origem: 0.0}
+            heap = [(0.0, origem)]
+            fechados = 0
+            por_encontrar = len(alvos)
+            while heap and fechados < limite_testemunha and por_encontrar:
+                d, x = heapq.heappop(heap)
+                if d > dist[x]:
+                    continue
+                if d > limite:
+                    break
+                fechados += 1
+                if x in alvos:
+                    por_encontrar -= 1
+                for y, peso in saida[x].items():
+                    if y == excluido:
+                        continue
+                    nd = d + peso
+                    if nd < dist.get(y, float('inf')):
+                        dist[y] = nd
+                        heapq.heappush(heap, (nd, y))
+            return dist
+
+        def simular(v):
+            novos = []
+            for u, peso_uv in entrada[v].items():
+                alvos = {w: peso_uv + peso_vw for w, peso_vw in saida[v].items() if w != u}
+                if not alvos:
+                    continue
+                dist = procura_testemunha(u, v, max(alvos.values()), alvos)
+                for w, via_v in alvos.items():
+                    if dist.get(w, float('inf')) > via_v:
+                        novos.append((u, w, via_v))
+            prioridade = len(novos) - len(entrada[v]) - len(saida[v]) + vizinhos_contraidos[v]
+            return prioridade, novos
+
+        prioridades = [simular(v)[0] for v in range(n)]
+        heap = [(p, v) for v, p in enumerate(prioridades)]
+        heapq.heapify(heap)
+
+        ordem = np.zeros(n, dtype=np.int32)
+        arestas_subir, arestas_descer = [], []
+        posicao = 0
+        while heap:
+            p, v = heapq.heappop(heap)
+            if contraidos[v] or p != prioridades[v]:
+                continue
+            prioridade, novos = simular(v)
+            if heap and prioridade > heap[0][0]:
+                prioridades[v] = prioridade
+                heapq.heappush(heap, (prioridade, v))
+                continue
+
+            ordem[v] = posicao
+            posicao += 1
+            contraidos[v] = True
+            vizinhos_v = set(saida[v]) | set(entrada[v])
+            # tudo o que ainda esta ligado a v vai ser contraido depois, logo tem ordem superior
+            for w, peso in saida[v].items():
+                arestas_subir.append((v, w, peso))
+                del entrada[w][v]
+                vizinhos_contraidos[w] += 1
+            for u, peso in entrada[v].items():
+                arestas_descer.append((u, v, peso))
+                del saida[u][v]
+                vizinhos_contraidos[u] += 1
+            saida[v] = {}
+            entrada[v] = {}
+
+            for u, w, peso in novos:
+                if peso < saida[u].get(w, float('inf')):
+                    saida[u][w] = peso
+                    entrada[w][u] = peso
+                    meio[(u, w)] = v
+
+            # os vizinhos mudaram de grau: atualizar a prioridade deles
+            for x in {u for u, _, _ in novos} | {w for _, w, _ in novos} | vizinhos_v:
+                if not contraidos[x]:
+                    prioridades[x] = simular(x)[0]
+                    heapq.heappush(heap, (prioridades[x], x))
+
+        subir = _csr_por_origem(n, arestas_subir, 0, 1)
+        descer = _csr_por_origem(n, arestas_descer, 1, 0)
+        atalhos = (np.array([a[0] for a in meio], dtype=np.int32),
+                   np.array([a[1] for a in meio], dtype=np.int32),
+                   np.array(list(meio.values()), dtype=np.int32))
+        return cls(ordem, subir, descer, atalhos, grafo.hash_conteudo())
+
+    def guardar(self, caminho):
+        np.savez(caminho, tipo="ch", ordem=self.ordem,
+                 subir_offsets=self.subir[0], subir_destinos=self.subir[1], subir_pesos=self.subir[2],
+                 descer_offsets=self.descer[0], descer_origens=self.descer[1], descer_pesos=self.descer[2],
+                 atalhos_u=self.atalhos[0], atalhos_w=self.atalhos[1], atalhos_meio=self.atalhos[2],
+                 assinatura=self.assinatura)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as d:
+            return cls(d["ordem"],
+                       (d["subir_offsets"], d["subir_destinos"], d["subir_pesos"]),
+                       (d["descer_offsets"], d["descer_origens"], d["descer_pesos"]),
+                       (d["atalhos_u"], d["atalhos_w"], d["atalhos_meio"]),
+                       str(d["assinatura"]))
+
+    def _desempacotar(self, u, w, caminho):
+        pilha = [(u, w)]
+        while pilha:
+            a, b = pilha.pop()
+            m = self._meio.get((a, b))
+            if m is None:
+                caminho.append(b)
+            else:
+                pilha.append((m, b))
+                pilha.append((a, m))
+
+    def procura(self, grafo, inicio, fim):
+        t0 = time.perf_counter()
+        listas = (self._subir, self._descer)
+        dist = ({inicio: 0.0}, {fim: 0.0})
+        anterior = ({inicio: inicio}, {fim: fim})
+        heaps = ([(0.0, inicio)], [(0.0, fim)])
+        melhor, encontro = float('inf'), None
+        expandidos = 0
+        pico = 2
+
+        while heaps[0] or heaps[1]:
+            topo_f = heaps[0][0][0] if heaps[0] else float('inf')
+            topo_b = heaps[1][0][0] if heaps[1] else float('inf')
+            if min(topo_f, topo_b) >= melhor:
+                break
+            lado = 0 if topo_f <= topo_b else 1
+            d, u = heapq.heappop(heaps[lado])
+            if d > dist[lado][u]:
+                continue
+            expandidos += 1
+            outro = dist[1 - lado].get(u)
+            if outro is not None and d + outro < melhor:
+                melhor, encontro = d + outro, u
+
+            offsets, adjacentes, pesos = listas[lado]
+            for k in range(offsets[u], offsets[u + 1]):
+                v = adjacentes[k]
+                nd = d + pesos[k]
+                if nd < dist[lado].get(v, float('inf')):
+                    dist[lado][v] = nd
+                    anterior[lado][v] = u
+                    heapq.heappush(heaps[lado], (nd, v))
+            pico = max(pico, len(heaps[0]) + len(heaps[1]))
+
+        if encontro is None:
+            return algoritmos.ResultadoProcura(None, float('inf'), expandidos, pico, time.perf_counter() - t0)
+
+        # cadeia inicio -> encontro (arestas para cima) e encontro -> fim (arestas para baixo)
+        subida = [encontro]
+        while subida[-1] != inicio:
+            subida.append(anterior[0][subida[-1]])
+        subida.reverse()
+        descida = [encontro]
+        while descida[-1] != fim:
+            descida.append(anterior[1][descida[-1]])
+
+        caminho = [inicio]
+        for cadeia in (subida, descida):
+            for a, b in zip(cadeia, cadeia[1:]):
+                self._desempacotar(a, b, caminho)
+        return algoritmos.ResultadoProcura(caminho, melhor, expandidos, pico, time.perf_counter() - t0)
+
+
+def _csr_por_origem(n, arestas, coluna_origem, coluna_destino):
+    arestas = sorted(arestas, key=lambda a: a[coluna_origem])
+    contagem = np.bincount(np.array([a[coluna_origem] for a in arestas], dtype=np.int64), minlength=n)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(contagem, out=offsets[1:])
+    destinos = np.array([a[coluna_destino] for a in arestas], dtype=np.int32)
+    pesos = np.array([a[2] for a in arestas], dtype=np.float64)
+    return offsets, destinos, pesos
+
+
+TIPOS = {"alt": IndiceALT, "ch": HierarquiaContracao}
+
+
+def caminho_indice(caminho_graphml, tipo):
+    return f"{os.path.splitext(caminho_graphml)[0]}.{tipo}.npz"
+
+
+def carregar_ou_construir(grafo, caminho_graphml, tipo="ch"):
+    """Le o indice guardado ao lado do .graphml, ou constroi-o (e guarda) se faltar ou for de outro grafo."""
+    _sem_pesos(grafo)
+    caminho = caminho_indice(caminho_graphml, tipo)
+    classe = TIPOS[tipo]
+    if os.path.exists(caminho):
+        indice = classe.carregar(caminho)
+        if indice.assinatura == grafo.hash_conteudo():
+            return indice
+    indice = classe.construir(grafo)
+    indice.guardar(caminho)
+    return indice
+
+
+def carregar_se_existir(grafo, caminho_graphml):
+    """Indice ja construido para este grafo (CH tem preferencia sobre ALT), ou None (tambem com pesos proprios)."""
+    if grafo.tem_pesos():
+        return None
+    for tipo in ("ch", "alt"):
+        caminho = caminho_indice(caminho_graphml, tipo)
+        if os.path.exists(caminho):
+            indice = TIPOS[tipo].carregar(caminho)
+            if indice.assinatura == grafo.hash_conteudo():
+                return indice
+    return None
+
+
+def verificar_contra_dijkstra(grafo, indice, amostras=200, semente=0, tolerancia=1e-3):
+    """Compara distancias e caminhos do indice com a procura de custo uniforme (Dijkstra).
+    Devolve (numero de erros, tempo medio Dijkstra, tempo medio indice)."""
+    rng = random.Random(semente)
+    erros = 0
+    tempo_dijkstra = tempo_indice = 0.0
+    for _ in range(amostras):
+        inicio, fim = rng.randrange(grafo.num_nos), rng.randrange(grafo.num_nos)
+        referencia = algoritmos.procura_custo_uniforme(grafo, inicio, fim)
+        resultado = indice.procura(grafo, inicio, fim)
+        tempo_dijkstra += referencia.tempo
+        tempo_indice += resultado.tempo
+
+        if referencia.caminho is None or resultado.caminho is None:
+            erros += (referencia.caminho is None) != (resultado.caminho is None)
+            continue
+        custo_caminho = algoritmos.calcula_custo(grafo, resultado.caminho)
+        valido = resultado.caminho[0] == inicio and resultado.caminho[-1] == fim
+        if (not valido or abs(resultado.custo - referencia.custo) > tolerancia * max(1.0, referencia.custo)
+                or abs(custo_caminho - referencia.custo) > tolerancia * max(1.0, referencia.custo)):
+            erros += 1
+    return erros, tempo_dijkstra / amostras, tempo_indice / amostras
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-processamento ALT / CH do grafo de estradas")
+    parser.add_argument("graphml", nargs="?", default="matosinhos_5km.graphml")
+    parser.add_argument("--tipo", choices=sorted(TIPOS), default="ch")
+    parser.add_argument("--verificar", type=int, default=200, help="consultas aleatorias a comparar com o Dijkstra")
+    args = parser.parse_args()
+
+    grafo = carregar_grafo(args.graphml)
+    t0 = time.perf_counter()
+    indice = carregar_ou_construir(grafo, args.graphml, args.tipo)
+    print(f"Indice {args.tipo.upper()} pronto em {time.perf_counter() - t0:.1f}s "
+          f"({caminho_indice(args.graphml, args.tipo)})")
+
+    if args.verificar:
+        erros, t_dijkstra, t_indice = verificar_contra_dijkstra(grafo, indice, args.verificar)
+        print(f"{args.verificar} consultas: {erros} diferencas | "
+              f"Dijkstra {t_dijkstra * 1000:.2f}ms vs {args.tipo.upper()} {t_indice * 1000:.3f}ms por consulta")
@@ -1,7 +1,12 @@
 import gestor_mapa as gm
 import motor_simulacao as ms
+import motor_repartido as mr
 import visualizador as vis
 import view as vc
+import preprocessamento_rotas as pr
+import telemetria as tm
+import perfil as pf
+import checkpoint as ck
 import time
 import json
 import os
@@ -56,18 +61,26 @@ class Controlador:
         self.view_consola.mostrar_mensagem("A carregar visualizacao completa...")
         self.gestor_mapa.visualizar_mapa_com_pois()
 
-    def acao_simulacao_animada(self, passos_simulacao=1000):
+    def acao_simulacao_animada(self, passos_simulacao=1000, passos_por_frame=1, fps_maximo=20, intervalo_telemetria=50,
+                                perfilar=False, ficheiro_checkpoint=None, intervalo_checkpoint=500,
+                                ficheiro_grafo="matosinhos_5km.graphml", regioes=1):
+        """Com ficheiro_checkpoint (por omissao nao ha checkpoints) o estado e guardado nesse ficheiro a
+        cada intervalo_checkpoint passos e no fim, e a proxima simulacao pode ser retomada dele.
+        Com regioes > 1 cada regiao do mapa corre num processo (motor_repartido), sem checkpoints nem perfil."""
         self.view_consola.mostrar_mensagem("A preparar simulacao animada...")
+        if regioes > 1 and (ficheiro_checkpoint or perfilar):
+            self.view_consola.mostrar_erro("A simulacao repartida por regioes nao tem checkpoints nem perfil.")
+            return
 
         if not self.view_consola.verificar_ficheiros_necessarios([
-            ("matosinhos_5km.graphml", "Grafo de estradas", "opcao 1"),
+            (ficheiro_grafo, "Grafo de estradas", "opcao 1"),
             ("pontos_interesse_matoshinhos.json", "POIs da Frota", "opcao 1"),
             ("zonas_recolha_matosinhos.json", "Zonas de Recolha", "opcao 2"),
             ("frota.json", "Configuracao da Frota", "criar o ficheiro")
         ]):
             return
             
-        G, pois_frota = self.gestor_mapa.carregar_dados()
+        G, pois_frota = self.gestor_mapa.carregar_dados(ficheiro_grafo)
         zonas_recolha = {}
         try:
             with open("zonas_recolha_matosinhos.json", "r", encoding="utf-8") as f:
@@ -80,42 +93,84 @@ class Controlador:
             pois_frota, zonas_recolha, 250
         )
 
-        sim = self.motor_simulacao(G, pois_frota)
-        
-        zonas_filtradas_dict = {"recolha": plotar_recolha}
-        sucesso, mensagem_erro = sim.criar_frota(zonas_filtradas_dict, "frota.json")
-        if not sucesso:
-            self.view_consola.mostrar_erro(f"Nao foi possivel criar a frota: {mensagem_erro}")
-            return
+        # uma simulacao interrompida (janela fechada, erro) pode ser retomada do ultimo checkpoint
+        sim = None
+        if (ficheiro_checkpoint and os.path.exists(ficheiro_checkpoint) and
+                self.view_consola.perguntar_sim_nao(f"Retomar a simulacao guardada em '{ficheiro_checkpoint}'?")):
+            try:
+                sim = ck.carregar(ficheiro_checkpoint, G)
+                self.view_consola.mostrar_mensagem(f"Simulacao retomada no passo {sim.passo_atual}.")
+            except ValueError as e:
+                self.view_consola.mostrar_erro(f"Nao foi possivel retomar a simulacao: {e}")
 
-        fig, ax = self.view_grafica.preparar_janela()
-        self.view_consola.mostrar_mensagem("A iniciar simulacao...")
+        if regioes > 1:
+            # a frota desenhada e a vista de todas as regioes, pedida aos processos a cada frame
+            try:
+                sim = mr.MotorRepartido(ficheiro_grafo, pois_frota, plotar_recolha, "frota.json", regioes)
+            except ValueError as e:
+                self.view_consola.mostrar_erro(str(e))
+                return
+        elif sim is None:
+            sim = self.motor_simulacao(G, pois_frota)
+            zonas_filtradas_dict = {"recolha": plotar_recolha}
+            sucesso, mensagem_erro = sim.criar_frota(zonas_filtradas_dict, "frota.json")
+            if not sucesso:
+                self.view_consola.mostrar_erro(f"Nao foi possivel criar a frota: {mensagem_erro}")
+                return
+        # com um erro ou Ctrl+C a meio, a telemetria e escrita ate ao fim e os processos das regioes
+        # (motor_repartido) terminam na mesma
+        telemetria = None
+        try:
+            indice_rotas = pr.carregar_se_existir(sim.grafo, ficheiro_grafo) if regioes == 1 else None
+            if indice_rotas is not None:
+                sim.usar_indice_rotas(indice_rotas)
 
-        self.view_grafica.desenhar_fundo_mapa(ax, G, 
-                                              plotar_bombas, 
-                                              plotar_carregadores, 
-                                              plotar_recolha)
-        
-        artists_frame_anterior = []
+            fig, ax = self.view_grafica.preparar_janela()
+            self.view_consola.mostrar_mensagem("A iniciar simulacao...")
 
-        for i in range(passos_simulacao):
-            sim.executar_passo()
-            
-            self.view_consola.mostrar_estado_frota(i + 1, sim.frota_taxis)
-            
-            artists_frame_anterior, continuar = self.view_grafica.desenhar_frame_animado(
-                ax=ax,
-                G=G,
-                frota_taxis=sim.frota_taxis,
-                artists_anteriores=artists_frame_anterior
-            )
-            
-            if not continuar:
-                self.view_consola.mostrar_mensagem("Janela fechada. Simulacao terminada.")
-                break
+            self.view_grafica.desenhar_fundo_mapa(ax, G, 
+                                                  plotar_bombas, 
+                                                  plotar_carregadores, 
+                                                  plotar_recolha)
         
-        self.view_grafica.fechar_janela()
-        self.view_consola.mostrar_sucesso("Simulacao animada terminada.")
+            # o mapa fica em cache; so os taxis e o painel sao redesenhados, e so quando ha frame
+            renderizador = self.view_grafica.RenderizadorFrota(fig, ax, sim.frota, passos_por_frame, fps_maximo)
+            # resumo compacto da frota na consola a cada intervalo_telemetria passos (escrito noutra thread)
+            telemetria = tm.Telemetria([tm.SaidaConsola(self.view_consola.mostrar_mensagem)], intervalo_telemetria)
+            telemetria.iniciar(sim)
+            perfil = sim.ativar_perfil() if perfilar else None
+
+            for k in range(passos_simulacao):
+                sim.executar_passo()
+                telemetria.observar(sim, periodico=k + 1 < passos_simulacao)
+                if ficheiro_checkpoint and intervalo_checkpoint and sim.passo_atual % intervalo_checkpoint == 0:
+                    ck.guardar(sim, ficheiro_checkpoint, ficheiro_grafo)
+
+                if not renderizador.quer_frame(sim.passo_atual):
+                    continue
+                if perfil is not None:
+                    inicio = time.perf_counter()
+                aberta = renderizador.desenhar(sim.passo_atual)
+                if perfil is not None:
+                    perfil.fase("render", inicio)
+                if not aberta:
+                    self.view_consola.mostrar_mensagem("Janela fechada. Simulacao terminada.")
+                    break
+
+            if ficheiro_checkpoint:
+                ck.guardar(sim, ficheiro_checkpoint, ficheiro_grafo)
+                self.view_consola.mostrar_mensagem(f"Estado guardado em '{ficheiro_checkpoint}' (passo {sim.passo_atual}).")
+            telemetria.amostrar(sim, "final")
+            if perfil is not None:
+                self.view_consola.mostrar_mensagem(pf.formatar(perfil.relatorio(sim)))
+            renderizador.fechar()
+            self.view_grafica.fechar_janela()
+            self.view_consola.mostrar_sucesso("Simulacao animada terminada.")
+        finally:
+            if telemetria is not None:
+                telemetria.fechar()
+            if regioes > 1:
+                sim.fechar()
 
     def acao_sair(self):
         self.view_consola.mostrar_mensagem("Ate logo!")
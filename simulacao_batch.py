@@ -0,0 +1,194 @@
+import argparse
+import json
+import time
+
+import despacho as dp
+import gestor_mapa as gm
+import motor_repartido as mr
+import motor_simulacao as ms
+import perfil as pf
+import checkpoint as ck
+import telemetria as tm
+import trafego as tr
+import trajetoria as tj
+
+# Modo sem interface: corre o motor o mais depressa possivel (sem matplotlib nem
+# impressao da frota a cada tick) e escreve os KPIs da frota num ficheiro.
+#
+#   python simulacao_batch.py --semente 42 --passos 20000 --saida kpis.jsonl
+#
+# A saida e JSON Lines (um registo por linha) ou CSV se o nome acabar em .csv.
+# Os registos periodicos tem "tipo": "periodico" e o ultimo "tipo": "final" (ver telemetria.py);
+# com --eventos o JSONL inclui cada mudanca de estado de um taxi e com --consola mostra um resumo.
+# Com --perfil mede o tempo de cada fase do tick (ver perfil.py); --cprofile/--tracemalloc para mais detalhe.
+# Com --pedidos-por-hora N gera procura de passageiros e despacha-a em lote (ver despacho.py).
+# Com --trajetoria ficheiro.npz grava a frota para exportar depois em video (exportar_video.py).
+# Com --checkpoint ficheiro.npz guarda o estado no fim (e a cada --intervalo-checkpoint ticks) e
+# com --retomar ficheiro.npz continua uma simulacao guardada (ver checkpoint.py).
+# Com --velocidade KMH cada tick avanca a distancia feita a essa velocidade em vez de uma aresta.
+# Com --perfis-velocidade ficheiro.json as rotas sao pelo tempo de percurso na hora do dia (a partir
+# de --hora-inicial), com as velocidades por classe de estrada desse ficheiro (ver trafego.py).
+
+def preparar_simulacao(semente, ficheiro_grafo, ficheiro_pois, ficheiro_zonas, ficheiro_frota,
+                       distancia_minima=250, G=None, pois_frota=None, zonas_recolha=None,
+                       pedidos_por_hora=0, janela_despacho=1, partilha=False, desvio_maximo=0.5,
+                       velocidade_kmh=None, ficheiro_perfis=None, hora_inicial=8.0, regioes=1, sincronizacao=1):
+    """Carrega os dados (se nao forem dados ja carregados) e cria a simulacao com a frota posicionada.
+
+    Com regioes > 1 a simulacao e um motor_repartido.MotorRepartido (um processo por regiao), que tem
+    de ser fechado (fechar) no fim."""
+    if G is None or pois_frota is None:
+        G, pois_frota = gm.carregar_dados(ficheiro_grafo, ficheiro_pois)
+        if G is None:
+            raise FileNotFoundError(f"Nao foi possivel ler '{ficheiro_grafo}' ou '{ficheiro_pois}'.")
+    if zonas_recolha is None:
+        with open(ficheiro_zonas, "r", encoding="utf-8") as f:
+            zonas_recolha = json.load(f)
+
+    _, _, plotar_recolha = gm.filtrar_pontos_com_hierarquia(pois_frota, zonas_recolha, distancia_minima)
+
+    if regioes > 1:
+        return mr.MotorRepartido(ficheiro_grafo, pois_frota, plotar_recolha, ficheiro_frota, regioes, semente,
+                                 sincronizacao, pedidos_por_hora, janela_despacho, partilha, desvio_maximo,
+                                 velocidade_kmh, ficheiro_perfis, hora_inicial)
+
+    sim = ms.MotorSimulacao(G, pois_frota, semente=semente, velocidade_kmh=velocidade_kmh)
+    sucesso, mensagem_erro = sim.criar_frota({"recolha": plotar_recolha}, ficheiro_frota)
+    if not sucesso:
+        raise ValueError(f"Nao foi possivel criar a frota: {mensagem_erro}")
+    if pedidos_por_hora > 0:
+        sim.usar_despacho(dp.Despachante(sim.grafo, plotar_recolha, pedidos_por_hora, janela_despacho,
+                                         segundos_por_passo=sim.segundos_por_passo, semente=semente,
+                                         partilha=partilha, desvio_maximo=desvio_maximo))
+    if ficheiro_perfis:
+        sim.usar_trafego(tr.PerfisVelocidade.de_ficheiro(ficheiro_perfis), hora_inicial)
+    return sim
+
+
+def correr_batch(sim, passos, telemetria=None, gravador=None, checkpoints=None):
+    """Executa `passos` ticks e devolve os KPIs finais.
+
+    Com telemetria (telemetria.Telemetria) envia os KPIs a cada telemetria.intervalo ticks e no fim;
+    com um gravador (trajetoria.GravadorTrajetoria) grava tambem a frota a cada gravador.intervalo ticks;
+    com checkpoints (checkpoint.GravadorCheckpoint) guarda o estado a cada checkpoints.intervalo ticks e no fim."""
+    t0 = time.perf_counter()
+    fim = sim.passo_atual + passos
+    if telemetria is not None:
+        telemetria.iniciar(sim)
+    if gravador is not None and sim.passo_atual % gravador.intervalo == 0:
+        gravador.gravar(sim.passo_atual)
+    while sim.passo_atual < fim:
+        paragem = fim
+        if telemetria is not None and telemetria.eventos:
+            paragem = sim.passo_atual + 1  # cada mudanca de estado no passo em que acontece
+        elif telemetria is not None and telemetria.intervalo:
+            paragem = min(paragem, (sim.passo_atual // telemetria.intervalo + 1) * telemetria.intervalo)
+        if gravador is not None:
+            paragem = min(paragem, (sim.passo_atual // gravador.intervalo + 1) * gravador.intervalo)
+        if checkpoints is not None and checkpoints.intervalo:
+            paragem = min(paragem, (sim.passo_atual // checkpoints.intervalo + 1) * checkpoints.intervalo)
+        sim.avancar_ate(paragem)
+
+        if telemetria is not None:
+            # no fim o registo final e o deste passo
+            telemetria.observar(sim, periodico=sim.passo_atual < fim)
+        if gravador is not None and sim.passo_atual % gravador.intervalo == 0:
+            gravador.gravar(sim.passo_atual)
+        if checkpoints is not None and checkpoints.intervalo and sim.passo_atual % checkpoints.intervalo == 0:
+            checkpoints.guardar(sim)
+
+    if checkpoints is not None and (not checkpoints.intervalo or sim.passo_atual % checkpoints.intervalo):
+        checkpoints.guardar(sim)
+    kpis = sim.calcular_kpis()
+    kpis["tempo_execucao_s"] = time.perf_counter() - t0
+    if sim.perfil is not None:
+        kpis["perfil"] = sim.perfil.relatorio(sim)
+    if telemetria is not None:
+        telemetria.amostrar(sim, "final", kpis)
+    return kpis
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulacao TaxiGreen sem interface grafica")
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument("--passos", type=int, default=1000)
+    parser.add_argument("--grafo", default=None, help="por omissao matosinhos_5km.graphml (ou o do checkpoint)")
+    parser.add_argument("--pois", default="pontos_interesse_matoshinhos.json")
+    parser.add_argument("--zonas", default="zonas_recolha_matosinhos.json")
+    parser.add_argument("--frota", default="frota.json")
+    parser.add_argument("--saida", default="kpis_simulacao.jsonl")
+    parser.add_argument("--pedidos-por-hora", type=float, default=0, help="procura de passageiros (0 = sem pedidos)")
+    parser.add_argument("--janela", type=int, default=1, help="passos entre despachos em lote")
+    parser.add_argument("--partilha", action="store_true", help="viagens partilhadas (insercao em taxis em servico)")
+    parser.add_argument("--desvio-maximo", type=float, default=0.5, help="desvio relativo maximo por passageiro")
+    parser.add_argument("--checkpoint", default=None, help="guarda o estado da simulacao neste .npz no fim")
+    parser.add_argument("--intervalo-checkpoint", type=int, default=0, help="ticks entre checkpoints (0 = so no fim)")
+    parser.add_argument("--retomar", default=None, help="continua a simulacao guardada neste checkpoint")
+    parser.add_argument("--velocidade", type=float, default=None,
+                        help="km/h: movimento por tempo ao longo das rotas (por omissao, uma aresta por tick)")
+    parser.add_argument("--perfis-velocidade", default=None,
+                        help="velocidades por hora e classe de estrada (JSON, ex. perfis_velocidade.json)")
+    parser.add_argument("--hora-inicial", type=float, default=8.0, help="hora do dia no inicio da simulacao")
+    parser.add_argument("--regioes", type=int, default=1,
+                        help="reparte o mapa em regioes, cada uma num processo (ver motor_repartido.py)")
+    parser.add_argument("--sincronizacao", type=int, default=1, help="ticks entre trocas de taxis entre regioes")
+    parser.add_argument("--trajetoria", default=None, help="grava o estado da frota neste .npz (para exportar_video.py)")
+    parser.add_argument("--intervalo-trajetoria", type=int, default=1, help="ticks entre gravacoes da trajetoria")
+    parser.add_argument("--intervalo", type=int, default=100, help="ticks entre registos periodicos (0 = so o final)")
+    parser.add_argument("--eventos", action="store_true", help="escreve tambem cada mudanca de estado de um taxi (JSONL)")
+    parser.add_argument("--consola", action="store_true", help="mostra um resumo da frota a cada registo periodico")
+    parser.add_argument("--perfil", action="store_true", help="tempo por fase do tick e contadores (no registo final)")
+    parser.add_argument("--cprofile", default=None, help="corre com cProfile e guarda as estatisticas neste ficheiro")
+    parser.add_argument("--tracemalloc", action="store_true", help="mostra o pico de memoria e as maiores alocacoes")
+    args = parser.parse_args()
+    if args.regioes > 1 and (args.retomar or args.checkpoint or args.perfil):
+        parser.error("--regioes nao se combina com checkpoints nem com --perfil")
+    if args.grafo is None:
+        args.grafo = ck.ler_meta(args.retomar)["ficheiro_grafo"] if args.retomar else "matosinhos_5km.graphml"
+
+    if args.retomar:
+        # o cenario (frota, procura, motor, ...) e o do checkpoint
+        sim = ck.carregar(args.retomar, ficheiro_grafo=args.grafo)
+    else:
+        sim = preparar_simulacao(args.semente, args.grafo, args.pois, args.zonas, args.frota,
+                                 pedidos_por_hora=args.pedidos_por_hora, janela_despacho=args.janela,
+                                 partilha=args.partilha, desvio_maximo=args.desvio_maximo,
+                                 velocidade_kmh=args.velocidade, ficheiro_perfis=args.perfis_velocidade,
+                                 hora_inicial=args.hora_inicial, regioes=args.regioes,
+                                 sincronizacao=args.sincronizacao)
+    checkpoints = None
+    if args.checkpoint:
+        checkpoints = ck.GravadorCheckpoint(args.checkpoint, args.intervalo_checkpoint, args.grafo)
+    gravador = None
+    if args.trajetoria:
+        gravador = tj.GravadorTrajetoria(sim.frota, args.intervalo_trajetoria, args.trajetoria, sim.grafo, args.grafo)
+    if args.perfil:
+        sim.ativar_perfil()
+    saidas = [tm.SaidaFicheiro(args.saida)] + ([tm.SaidaConsola()] if args.consola else [])
+    telemetria = tm.Telemetria(saidas, args.intervalo, args.eventos)
+    captura = None
+    try:
+        if args.cprofile or args.tracemalloc:
+            with pf.Captura(cprofile=bool(args.cprofile), memoria=args.tracemalloc) as captura:
+                kpis = correr_batch(sim, args.passos, telemetria, gravador, checkpoints)
+        else:
+            kpis = correr_batch(sim, args.passos, telemetria, gravador, checkpoints)
+    finally:
+        telemetria.fechar()
+        if gravador is not None:
+            gravador.fechar()
+        if isinstance(sim, mr.MotorRepartido):
+            sim.fechar()
+
+    print(f"{args.passos} passos em {kpis['tempo_execucao_s']:.2f}s "
+          f"({args.passos / max(kpis['tempo_execucao_s'], 1e-9):.0f} ticks/s) -> {args.saida}")
+    if "perfil" in kpis:
+        print(pf.formatar(kpis["perfil"]))
+    if captura is not None:
+        if args.cprofile:
+            captura.guardar(args.cprofile)
+        print(captura.relatorio())
+
+
+if __name__ == "__main__":
+    main()
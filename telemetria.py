@@ -0,0 +1,146 @@
+import csv
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+
+import frota as fr
+
+# Telemetria da simulacao: em vez de imprimir a frota inteira a cada tick, o ciclo da simulacao
+# chama observar(sim), que so compara o vetor de estados com o da observacao anterior (para contar
+# as mudancas de estado) e, a cada `intervalo` passos, calcula os KPIs agregados. Os registos vao
+# para uma fila e uma thread de escrita entrega-os as saidas (consola, JSONL ou CSV), por isso o
+# custo no ciclo nao depende do numero de taxis vezes o numero de ticks.
+#
+# Registos: "periodico" (a cada intervalo), "final" e, com eventos=True, um "evento" por mudanca
+# de estado de um taxi (so nas saidas JSONL; o CSV e a consola ficam com os agregados).
+
+
+def resumo(registo):
+    """Uma linha com o estado agregado da frota, para a consola."""
+    partes = [f"tick {registo['passo']}",
+              f"livres {registo['taxis_livres']}",
+              f"a abastecer {registo['taxis_a_abastecer']}",
+              f"em servico {registo['taxis_em_servico']}",
+              f"sem energia {registo['taxis_sem_energia']}",
+              f"autonomia media {registo['autonomia_media_km']:.1f} km",
+              f"custo {registo['custo_total']:.2f}",
+              f"CO2 {registo['co2_total']:.2f}"]
+    if "pedidos_gerados" in registo:
+        partes.append(f"pedidos {registo['pedidos_concluidos']}/{registo['pedidos_gerados']}")
+    transicoes = registo.get("transicoes")
+    if transicoes:
+        partes.append(", ".join(f"{nome} {n}" for nome, n in transicoes.items()))
+    return " | ".join(partes)
+
+
+class SaidaConsola:
+    def __init__(self, mostrar=print):
+        self.mostrar = mostrar
+
+    def escrever(self, registo):
+        if registo["tipo"] != "evento":
+            self.mostrar(resumo(registo))
+
+    def fechar(self):
+        pass
+
+
+class SaidaFicheiro:
+    """JSON Lines (um registo por linha) ou CSV se o nome acabar em .csv (sem os eventos individuais)."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.formato_csv = caminho.lower().endswith(".csv")
+        self._ficheiro = open(caminho, "w", encoding="utf-8", newline="")
+        self._csv = None
+
+    def escrever(self, registo):
+        if self.formato_csv:
+            if registo["tipo"] == "evento":
+                return
+            registo = {nome: json.dumps(valor, ensure_ascii=False) if isinstance(valor, dict) else valor
+                       for nome, valor in registo.items()}
+            if self._csv is None:
+                self._csv = csv.DictWriter(self._ficheiro, fieldnames=list(registo), extrasaction="ignore")
+                self._csv.writeheader()
+            self._csv.writerow(registo)
+        else:
+            self._ficheiro.write(json.dumps(registo, ensure_ascii=False) + "\n")
+
+    def fechar(self):
+        self._ficheiro.close()
+
+
+class Telemetria:
+    def __init__(self, saidas, intervalo=100, eventos=False):
+        self.saidas = list(saidas)
+        self.intervalo = intervalo
+        self.eventos = eventos
+        self.t0 = time.perf_counter()
+        self._estado_anterior = None
+        num_estados = len(fr.NOMES_ESTADO)
+        self._transicoes = np.zeros((num_estados, num_estados), dtype=np.int64)
+        self._eventos = []  # (passo, ids, de, para) desde a ultima amostra
+        self._fila = queue.Queue(maxsize=1000)
+        self._escritor = threading.Thread(target=self._escrever_fila, daemon=True)
+        self._escritor.start()
+
+    def iniciar(self, sim):
+        """Estado de partida para as mudancas de estado e para o tempo de execucao."""
+        self.t0 = time.perf_counter()
+        self._estado_anterior = sim.frota.estado.copy()
+
+    def observar(self, sim, periodico=True):
+        """Chamar a cada passo (ou a cada paragem do motor): conta as mudancas de estado desde a
+        observacao anterior e, a cada `intervalo` passos, envia os KPIs para as saidas. Na ultima
+        observacao, seguida do registo final, periodico=False evita um registo repetido do mesmo passo."""
+        estado = sim.frota.estado
+        if self._estado_anterior is None or len(self._estado_anterior) != len(estado):
+            self._estado_anterior = estado.copy()
+        else:
+            mudaram = np.flatnonzero(estado != self._estado_anterior)
+            if len(mudaram):
+                de = self._estado_anterior[mudaram]
+                para = estado[mudaram]
+                np.add.at(self._transicoes, (de, para), 1)
+                if self.eventos:
+                    self._eventos.append((sim.passo_atual, sim.frota.ids[mudaram], de, para))
+                self._estado_anterior[mudaram] = para
+        if periodico and self.intervalo and sim.passo_atual % self.intervalo == 0:
+            self.amostrar(sim)
+
+    def amostrar(self, sim, tipo="periodico", kpis=None):
+        """Envia um registo com os KPIs (calculados agora, se nao forem dados) e as transicoes acumuladas."""
+        if kpis is None:
+            kpis = {**sim.calcular_kpis(), "tempo_execucao_s": time.perf_counter() - self.t0}
+        de, para = np.nonzero(self._transicoes)
+        transicoes = {f"{fr.NOMES_ESTADO[a]}->{fr.NOMES_ESTADO[b]}": int(self._transicoes[a, b])
+                      for a, b in zip(de, para)}
+        self._transicoes[:] = 0
+        eventos, self._eventos = self._eventos, []
+        self._fila.put(({"tipo": tipo, **kpis, "transicoes": transicoes}, eventos))
+
+    def _escrever_fila(self):
+        while True:
+            item = self._fila.get()
+            if item is None:
+                return
+            registo, eventos = item
+            for passo, ids, de, para in eventos:
+                for taxi, a, b in zip(ids.tolist(), de.tolist(), para.tolist()):
+                    evento = {"tipo": "evento", "passo": passo, "taxi": taxi,
+                              "de": fr.NOMES_ESTADO[a], "para": fr.NOMES_ESTADO[b]}
+                    for saida in self.saidas:
+                        saida.escrever(evento)
+            for saida in self.saidas:
+                saida.escrever(registo)
+
+    def fechar(self):
+        """Espera que a fila seja toda escrita e fecha as saidas."""
+        self._fila.put(None)
+        self._escritor.join()
+        for saida in self.saidas:
+            saida.fechar()
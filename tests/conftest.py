@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+
+import pytest
+
+# os modulos do projeto estao na raiz do repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gerador_sintetico as gs  # noqa: E402
+import simulacao_batch as sb  # noqa: E402
+
+# Cenario pequeno e sempre igual (gerador_sintetico) para os testes que comparam duas maneiras de
+# chegar ao mesmo resultado: motores, checkpoints, matrizes de hubs, ...
+
+NUM_NOS = 900
+NUM_TAXIS = 20
+
+
+def novo_grafo():
+    """Grafo sintetico do cenario; um novo de cada vez, porque o trafego muda os pesos do grafo."""
+    return gs.gerar_grafo("grelha", NUM_NOS, semente=11)
+
+
+@pytest.fixture(scope="session")
+def cenario(tmp_path_factory):
+    """Grafo, POIs, zonas de recolha e o ficheiro da frota (taxis com pouca autonomia, para haver
+    abastecimentos e taxis sem energia em poucas centenas de passos)."""
+    grafo = novo_grafo()
+    frota = gs.gerar_frota(NUM_TAXIS, semente=13)
+    for taxi in frota[::3]:
+        taxi["autonomia_max"] = 4
+    ficheiro_frota = tmp_path_factory.mktemp("cenario") / "frota.json"
+    with open(ficheiro_frota, "w", encoding="utf-8") as f:
+        json.dump(frota, f)
+    return {"grafo": grafo, "pois": gs.gerar_pois(grafo, semente=12), "zonas": gs.gerar_zonas(grafo, semente=14),
+            "frota": str(ficheiro_frota)}
+
+
+@pytest.fixture
+def criar_simulacao(cenario):
+    """Simulacao do cenario como em simulacao_batch (despacho, trafego, ...)."""
+    def criar(semente, G=None, **extra):
+        G = G if G is not None else cenario["grafo"]
+        return sb.preparar_simulacao(semente, None, None, None, cenario["frota"], G=G, pois_frota=cenario["pois"],
+                                     zonas_recolha=cenario["zonas"], **extra)
+    return criar
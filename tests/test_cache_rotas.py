@@ -0,0 +1,44 @@
+import numpy as np
+
+import motor_simulacao as ms
+from cache_rotas import CacheRotas
+from conftest import novo_grafo
+
+
+def test_invalidada_quando_o_grafo_muda():
+    cache = CacheRotas(capacidade=10)
+    cache.guardar(1, 2, [1, 5, 2], 30.0, versao_grafo=0)
+    assert cache.obter(1, 2, versao_grafo=0)[1] == 30.0
+    assert cache.obter(1, 2, versao_grafo=1) is None
+    assert len(cache) == 0
+    assert cache.invalidacoes == 1
+    assert (cache.acertos, cache.falhas) == (1, 1)
+
+
+def test_sai_a_rota_usada_ha_mais_tempo():
+    cache = CacheRotas(capacidade=2)
+    cache.guardar(0, 1, [0, 1], 1.0, 0)
+    cache.guardar(0, 2, [0, 2], 2.0, 0)
+    cache.obter(0, 1, 0)
+    cache.guardar(0, 3, [0, 3], 3.0, 0)
+    assert cache.obter(0, 2, 0) is None
+    assert cache.obter(0, 1, 0) is not None
+    assert cache.despejos == 1
+
+
+def test_motor_nao_usa_rotas_de_outra_versao_do_grafo():
+    grafo = novo_grafo()
+    sim = ms.MotorSimulacao(grafo, {})
+    caminho, distancia = sim.procurar_caminho(0, grafo.num_nos - 1)
+    assert sim.procurar_caminho(0, grafo.num_nos - 1)[1] == distancia
+    assert sim.cache_rotas.acertos == 1
+
+    # todas as arestas do caminho ficam dez vezes mais compridas
+    comprimentos = np.array(grafo.comprimentos)
+    for u, v in zip(caminho[:-1].tolist(), caminho[1:].tolist()):
+        k = grafo.offsets[u] + np.flatnonzero(grafo.vizinhos(u) == v)[0]
+        comprimentos[k] *= 10
+    grafo.definir_comprimentos(comprimentos)
+    _, nova_distancia = sim.procurar_caminho(0, grafo.num_nos - 1)
+    assert sim.cache_rotas.invalidacoes == 1
+    assert nova_distancia != distancia
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+import checkpoint as ck
+import motor_simulacao as ms
+import trafego as tr
+from conftest import novo_grafo
+
+PERFIS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perfis_velocidade.json")
+
+CASOS = {
+    "passos": {},
+    "despacho": {"pedidos_por_hora": 300, "janela_despacho": 3, "partilha": True},
+    "velocidade": {"pedidos_por_hora": 300, "velocidade_kmh": 30},
+}
+
+
+@pytest.mark.parametrize("caso", CASOS)
+def test_retomar_igual_a_nao_interromper(criar_simulacao, tmp_path, caso):
+    caminho = str(tmp_path / "sim.npz")
+    sim = criar_simulacao(5, **CASOS[caso])
+    sim.avancar_ate(400)
+    ck.guardar(sim, caminho)
+    sim.avancar_ate(1000)
+
+    retomada = ck.carregar(caminho, sim.grafo)
+    assert retomada.passo_atual == 400
+    retomada.avancar_ate(1000)
+    assert retomada.calcular_kpis() == sim.calcular_kpis()
+
+
+def test_retomar_com_trafego(criar_simulacao, tmp_path):
+    # o trafego muda os pesos do grafo: a simulacao retomada tem o seu
+    caminho = str(tmp_path / "sim.npz")
+    sim = criar_simulacao(5, G=novo_grafo(), velocidade_kmh=30)
+    sim.usar_trafego(tr.PerfisVelocidade.de_ficheiro(PERFIS), hora_inicial=7.5)
+    sim.avancar_ate(400)
+    ck.guardar(sim, caminho)
+    sim.avancar_ate(1500)
+
+    retomada = ck.carregar(caminho, novo_grafo())
+    retomada.avancar_ate(1500)
+    kpis, kpis_retomada = sim.calcular_kpis(), retomada.calcular_kpis()
+    assert kpis["mudancas_hora"] > 0
+    # construir ou reutilizar as matrizes depende do que ja esta em cache neste processo, nao da simulacao
+    for k in (kpis, kpis_retomada):
+        for nome in ms.KPIS_CACHE:
+            del k[nome]
+    assert kpis_retomada == kpis
+
+
+def test_carregar_com_outro_grafo(criar_simulacao, tmp_path):
+    caminho = str(tmp_path / "sim.npz")
+    ck.guardar(criar_simulacao(5), caminho)
+    outro = novo_grafo()
+    outro.comprimentos[0] += 1.0
+    with pytest.raises(ValueError):
+        ck.carregar(caminho, outro)
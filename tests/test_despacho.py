@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+import despacho as dp
+import frota as fr
+
+
+def _entregas(sim, passos):
+    """(distancia em viagem, viagem maxima) de cada pedido entregue, medida no odometro do taxi."""
+    despacho = sim.despacho
+    entregas = []
+    for _ in range(passos):
+        # pedidos a bordo (recolhidos, por entregar) e o taxi que os leva
+        a_bordo = {}
+        for i in np.flatnonzero(sim.frota.estado == fr.EM_SERVICO):
+            for _, pedido, recolha in sim.frota.paradas[i]:
+                linha = pedido - despacho.primeiro_pedido
+                if not recolha and not np.isnan(despacho.odometro_recolha[linha]):
+                    a_bordo[pedido] = (i, despacho.odometro_recolha[linha], despacho.viagem_maxima[linha])
+        sim.executar_passo()
+        for pedido, (i, odometro, viagem_maxima) in a_bordo.items():
+            if not despacho.em_curso[pedido - despacho.primeiro_pedido]:
+                entregas.append((sim.frota.distancia[i] - odometro, viagem_maxima))
+    return np.array(entregas)
+
+
+@pytest.mark.parametrize("desvio_maximo", [0.1, 0.4])
+def test_partilha_respeita_desvio_maximo(criar_simulacao, desvio_maximo):
+    sim = criar_simulacao(5, pedidos_por_hora=300, partilha=True, desvio_maximo=desvio_maximo)
+    entregas = _entregas(sim, 500)
+    assert sim.despacho.partilhados > 0
+    assert len(entregas) > 50
+    em_viagem, viagem_maxima = entregas.T
+    assert (em_viagem <= viagem_maxima * (1 + 1e-6) + 1e-3).all()
+    # com partilha ha viagens mais longas que a direta, mas nunca mais do que o desvio permite
+    assert (em_viagem > viagem_maxima / (1 + desvio_maximo) * (1 + 1e-6) + 1e-3).any()
+
+
+def test_desvio_maior_partilha_mais(criar_simulacao):
+    partilhados = []
+    for desvio_maximo in (0.0, 0.5):
+        sim = criar_simulacao(5, pedidos_por_hora=300, partilha=True, desvio_maximo=desvio_maximo)
+        sim.avancar_ate(500)
+        partilhados.append(sim.despacho.partilhados)
+    assert partilhados[0] < partilhados[1]
+
+
+def test_despacho_com_os_passos_do_motor(criar_simulacao):
+    sim = criar_simulacao(5, pedidos_por_hora=300)
+    assert sim.despacho.segundos_por_passo == sim.segundos_por_passo
+    zonas = [{"id_no": no} for no in sim.grafo.ids[sim.despacho.tabelas.nos].tolist()]
+    with pytest.raises(ValueError):
+        sim.usar_despacho(dp.Despachante(sim.grafo, zonas, 300, segundos_por_passo=sim.segundos_por_passo / 2))
+
+
+@pytest.mark.parametrize("q", [0, 10, 50, 90, 100])
+def test_percentil_do_histograma(q):
+    esperas = np.random.default_rng(3).poisson(12, 501)
+    histograma = np.bincount(esperas)
+    assert dp._percentil(histograma, q) == pytest.approx(np.percentile(esperas, q))
+
+
+def test_esperas_em_histograma(criar_simulacao):
+    sim = criar_simulacao(5, pedidos_por_hora=300)
+    sim.avancar_ate(400)
+    despacho = sim.despacho
+    assert despacho.esperas.sum() == despacho.recolhidos > 0
+    # o tamanho do histograma depende da maior espera, nao do numero de pedidos
+    assert despacho.esperas[-1] or len(despacho.esperas) < 2 * np.flatnonzero(despacho.esperas)[-1] + 2
+    kpis = sim.calcular_kpis()
+    assert 0 < kpis["espera_media_s"] <= kpis["espera_p90_s"]
+
+
+def _em_curso(despacho):
+    return set((np.flatnonzero(despacho.em_curso[:despacho.gerados - despacho.primeiro_pedido])
+                + despacho.primeiro_pedido).tolist())
+
+
+def test_taxi_sem_energia_em_servico(criar_simulacao):
+    sim = criar_simulacao(5, pedidos_por_hora=300)
+    frota, despacho = sim.frota, sim.despacho
+    # um taxi a caminho de uma recolha e outro com um passageiro a bordo ficam sem energia
+    a_recolher = a_bordo = None
+    while a_recolher is None or a_bordo is None:
+        sim.executar_passo()
+        for i in np.flatnonzero(frota.estado == fr.EM_SERVICO).tolist():
+            recolhas = [p for _, p, recolha in frota.paradas[i] if recolha]
+            if recolhas and a_recolher is None:
+                a_recolher = (i, recolhas[0])
+            elif frota.paradas[i] and not recolhas and a_bordo is None:
+                a_bordo = (i, frota.paradas[i][0][1])
+    for i, _ in (a_recolher, a_bordo):
+        frota.autonomia[i] = 1e-3
+    abandonados = despacho.abandonados
+    chegada = despacho.chegada[a_recolher[1] - despacho.primeiro_pedido]
+    sim.executar_passo()
+    assert (frota.estado[[a_recolher[0], a_bordo[0]]] == fr.SEM_ENERGIA).all()
+    sim.executar_passo()
+
+    assert not frota.paradas[a_recolher[0]] and not frota.paradas[a_bordo[0]]
+    assert despacho.abandonados >= abandonados + 1
+    assert not despacho.em_curso[a_bordo[1] - despacho.primeiro_pedido]
+    pedido = a_recolher[1]
+    assert despacho.chegada[pedido - despacho.primeiro_pedido] == chegada
+    assert pedido in despacho.pendentes_id or any(p == pedido for paradas in frota.paradas for _, p, _ in paradas)
+
+    # os pedidos em curso sao sempre os pendentes e os das paradas: nenhum fica preso a um taxi parado,
+    # e os arrays por pedido descartam os terminados
+    for _ in range(600):
+        sim.executar_passo()
+        nas_paradas = {p for paradas in frota.paradas for _, p, _ in paradas}
+        assert _em_curso(despacho) == set(despacho.pendentes_id.tolist()) | nas_paradas
+    assert despacho.primeiro_pedido > pedido
+    assert despacho.gerados <= despacho.primeiro_pedido + len(despacho.chegada)
+
+
+@pytest.mark.parametrize("forma", [(1, 1), (5, 5), (4, 9), (9, 4), (30, 40)])
+def test_hungaro_igual_ao_scipy(monkeypatch, forma):
+    scipy_optimize = pytest.importorskip("scipy.optimize")
+    rng = np.random.default_rng(sum(forma))
+    custos = rng.uniform(0, 5000, forma)
+    # alguns pares inviaveis, como em Despachante._custos
+    custos[rng.random(forma) < 0.2] = dp.CUSTO_INVIAVEL
+    linhas_scipy, colunas_scipy = scipy_optimize.linear_sum_assignment(custos)
+
+    monkeypatch.setattr(dp, "linear_sum_assignment", None)
+    linhas, colunas = dp.atribuicao_otima(custos)
+    assert len(linhas) == len(linhas_scipy) == min(forma)
+    assert list(linhas) == sorted(linhas)
+    assert len(set(colunas.tolist())) == len(colunas)
+    assert custos[linhas, colunas].sum() == pytest.approx(custos[linhas_scipy, colunas_scipy].sum())
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+from PIL import Image
+
+import exportar_video as ev
+import trajetoria as tj
+
+
+@pytest.fixture(scope="module")
+def trajetoria_gravada(cenario, tmp_path_factory):
+    """Trajetoria de 30 passos em blocos de 8 frames, com o grafo guardado na cache binaria ao lado de
+    mapa.graphml (os processos do exportador carregam-no de la)."""
+    import simulacao_batch as sb
+    pasta = tmp_path_factory.mktemp("exportar")
+    cenario["grafo"].guardar(str(pasta / "mapa.grafo"))
+    sim = sb.preparar_simulacao(7, None, None, None, cenario["frota"], G=cenario["grafo"],
+                                pois_frota=cenario["pois"], zonas_recolha=cenario["zonas"])
+    caminho = str(pasta / "trajetoria.npz")
+    gravador = tj.GravadorTrajetoria(sim.frota, caminho=caminho, grafo=sim.grafo,
+                                     ficheiro_grafo=str(pasta / "mapa.graphml"), frames_por_bloco=8)
+    for _ in range(30):
+        sim.executar_passo()
+        gravador.gravar(sim.passo_atual)
+    gravador.fechar()
+    return caminho
+
+
+@pytest.mark.parametrize("salto", [1, 3])
+def test_tarefas_cobrem_cada_frame_uma_vez(trajetoria_gravada, salto):
+    tarefas = ev._tarefas(trajetoria_gravada, salto, 2)
+    numeros = [numero for _, frames in tarefas for numero, _ in frames]
+    assert numeros == list(range(len(range(0, 30, salto))))
+    # o indice no bloco corresponde ao frame salto * numero da trajetoria
+    for bloco, frames in tarefas:
+        for numero, k in frames:
+            assert bloco * 8 + k == numero * salto
+
+
+def test_exportar_pngs(trajetoria_gravada, tmp_path):
+    saida = str(tmp_path / "frames")
+    escritos = ev.exportar(trajetoria_gravada, saida, fps=10, salto=3, processos=2, largura=320, altura=240)
+    assert escritos == 10
+    assert sorted(os.listdir(saida)) == [f"frame_{n:06d}.png" for n in range(10)]
+    with Image.open(os.path.join(saida, "frame_000009.png")) as imagem:
+        assert imagem.size == (320, 240)
+
+
+def test_exportar_gif(trajetoria_gravada, tmp_path):
+    saida = str(tmp_path / "simulacao.gif")
+    assert ev.exportar(trajetoria_gravada, saida, fps=10, salto=5, processos=1, largura=320, altura=240) == 6
+    with Image.open(saida) as gif:
+        assert gif.n_frames == 6
+
+
+def test_grafo_diferente(trajetoria_gravada, tmp_path):
+    import gerador_sintetico as gs
+    gs.gerar_grafo("grelha", 100, semente=3).guardar(str(tmp_path / "outro.grafo"))
+    with pytest.raises(ValueError):
+        ev.exportar(trajetoria_gravada, str(tmp_path / "frames"), ficheiro_grafo=str(tmp_path / "outro.graphml"),
+                    processos=1, largura=320, altura=240)
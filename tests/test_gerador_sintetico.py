@@ -0,0 +1,32 @@
+import os
+
+import osmnx as ox
+import pytest
+
+import gerador_sintetico as gs
+import trafego as tr
+from grafo_compacto import GrafoCompacto
+
+PERFIS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perfis_velocidade.json")
+
+
+@pytest.mark.parametrize("tipo", gs.REDES)
+def test_classes_de_estrada_mudam_com_a_hora(tipo):
+    grafo = gs.gerar_grafo(tipo, 2000, semente=1)
+    assert grafo.nomes_classes == gs.CLASSES
+    assert (grafo.classes == gs.PRIMARY).any() and (grafo.classes == gs.RESIDENTIAL).any()
+    perfis = tr.PerfisVelocidade.de_ficheiro(PERFIS)
+    alteradas = perfis.pesos(grafo, 7) != perfis.pesos(grafo, 8)
+    assert 0 < alteradas.mean() < 0.5
+
+
+def test_graphml_guarda_as_classes(tmp_path):
+    grafo = gs.gerar_grafo("grelha", 400, semente=2)
+    caminho = str(tmp_path / "grafo.graphml")
+    gs.guardar_graphml(grafo, caminho)
+    lido = GrafoCompacto.de_networkx(ox.load_graphml(caminho))
+
+    def classes(g):
+        return sorted(zip(g.ids[g.origens_arestas()].tolist(), g.ids[g.destinos].tolist(),
+                          [g.nomes_classes[c] for c in g.classes.tolist()]))
+    assert classes(lido) == classes(grafo)
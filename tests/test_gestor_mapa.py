@@ -0,0 +1,32 @@
+import pytest
+
+import gerador_sintetico as gs
+import gestor_mapa as gm
+
+
+def _filtrar_referencia(pois_frota_data, zonas_data, distancia_minima):
+    # a versao original, ponto a ponto contra todos os outros
+    bombas = pois_frota_data.get("bombas_gasolina", [])
+    carregadores = [c for c in pois_frota_data.get("carregadores_eletricos", [])
+                    if all(gm.calcular_distancia(c["latitude"], c["longitude"], b["latitude"], b["longitude"])
+                           >= distancia_minima for b in bombas)]
+    prioritarios = bombas + carregadores
+    recolha, ids_aceites = [], set()
+    for categoria in zonas_data.values():
+        for ponto in categoria:
+            if ponto["id_no"] in ids_aceites:
+                continue
+            if all(gm.calcular_distancia(ponto["latitude"], ponto["longitude"], p["latitude"], p["longitude"])
+                   >= distancia_minima for p in prioritarios + recolha):
+                recolha.append(ponto)
+                ids_aceites.add(ponto["id_no"])
+    return bombas, carregadores, recolha
+
+
+@pytest.mark.parametrize("distancia_minima", [0, 150, 250, 600])
+def test_filtrar_pontos_com_hierarquia_igual_a_comparar_todos(cenario, distancia_minima):
+    grafo = cenario["grafo"]
+    pois = gs.gerar_pois(grafo, num_bombas=15, num_carregadores=40, semente=3)
+    zonas = gs.gerar_zonas(grafo, num_zonas=800, semente=4)
+    assert gm.filtrar_pontos_com_hierarquia(pois, zonas, distancia_minima) == \
+        _filtrar_referencia(pois, zonas, distancia_minima)
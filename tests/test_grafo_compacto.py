@@ -0,0 +1,32 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from conftest import novo_grafo
+from grafo_compacto import GrafoCompacto
+
+
+def _guardar(diretorio):
+    novo_grafo().guardar(diretorio)
+    return GrafoCompacto.carregar(diretorio).hash_conteudo()
+
+
+def test_guardar_por_cima_de_uma_cache(tmp_path):
+    diretorio = str(tmp_path / "mapa.grafo")
+    grafo = novo_grafo()
+    grafo.guardar(diretorio)
+    grafo.comprimentos[0] += 1.0
+    grafo.marcar_alterado()
+    grafo.guardar(diretorio)
+    np.testing.assert_array_equal(GrafoCompacto.carregar(diretorio).comprimentos, grafo.comprimentos)
+    assert os.listdir(tmp_path) == ["mapa.grafo"]
+
+
+def test_varios_processos_a_guardar_a_mesma_cache(tmp_path):
+    diretorio = str(tmp_path / "mapa.grafo")
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        hashes = list(executor.map(_guardar, [diretorio] * 8))
+    assert set(hashes) == {novo_grafo().hash_conteudo()}
+    assert GrafoCompacto.carregar(diretorio).hash_conteudo() == hashes[0]
+    assert os.listdir(tmp_path) == ["mapa.grafo"]
@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+import pytest
+
+import matriz_hubs as mh
+import trafego as tr
+from conftest import novo_grafo
+from grafo_compacto import GrafoCompacto, dijkstra_multi_origem
+
+PERFIS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perfis_velocidade.json")
+
+
+def _grafo_com_classes():
+    # algumas avenidas no meio das ruas residenciais, para a mudanca de hora so mexer em parte das arestas
+    grafo = novo_grafo()
+    grafo.nomes_classes = ("primary", "secondary", "residential")
+    grafo.classes = np.random.default_rng(8).choice(3, grafo.num_arestas, p=(0.1, 0.1, 0.8)).astype(np.int16)
+    return grafo
+
+
+def _ate(grafo, no):
+    # distancia e metros de todos os nos ate `no` (um Dijkstra invertido)
+    distancia, _, proximo = dijkstra_multi_origem(grafo, [int(no)], reverso=True, com_anterior=True)
+    return distancia, mh.metros_da_arvore(grafo, distancia, proximo)
+
+
+@pytest.mark.parametrize("hora", [None, 8, 23])
+def test_entre_hubs_igual_a_um_dijkstra_por_hub(hora):
+    grafo = _grafo_com_classes()
+    if hora is not None:
+        grafo.definir_pesos(tr.PerfisVelocidade.de_ficheiro(PERFIS).pesos(grafo, hora))
+    nos = np.random.default_rng(9).choice(grafo.num_nos, 25, replace=False)
+    matriz = mh.construir(grafo, nos)
+    for b, no in enumerate(nos):
+        distancia, metros = _ate(grafo, no)
+        np.testing.assert_allclose(matriz.entre_hubs[:, b], distancia[nos], rtol=1e-6)
+        np.testing.assert_allclose(matriz.entre_hubs_metros[:, b], metros[nos], rtol=1e-9)
+
+
+@pytest.mark.parametrize("com_trafego", [False, True])
+def test_caminhos_e_colunas(com_trafego):
+    grafo = _grafo_com_classes()
+    if com_trafego:
+        grafo.definir_pesos(tr.PerfisVelocidade.de_ficheiro(PERFIS).pesos(grafo, 8))
+    rng = np.random.default_rng(10)
+    nos = rng.choice(grafo.num_nos, 20, replace=False)
+    matriz = mh.construir(grafo, nos)
+    outros = rng.choice(grafo.num_nos, 15, replace=False)
+    distancias, metros = matriz.colunas(outros)
+    assert distancias.shape == (len(nos), len(outros))
+    for b, no in enumerate(nos):
+        distancia, ate_b = _ate(grafo, no)
+        np.testing.assert_allclose(distancias[b], distancia[outros], rtol=1e-6)
+        np.testing.assert_allclose(metros[b], ate_b[outros], rtol=1e-9)
+        # de outro hub (arvore esparsa) e de um no qualquer (procura): caminhos validos, com os metros da matriz
+        for origem, esperado in ((int(nos[(b + 1) % len(nos)]), matriz.entre_hubs_metros[(b + 1) % len(nos), b]),
+                                 (int(outros[b % len(outros)]), metros[b, b % len(outros)])):
+            caminho = matriz.caminho(origem, b)
+            assert caminho[-1] == no
+            comprimento = grafo.comprimentos_arestas(np.array([origem] + caminho[:-1]), np.array(caminho)).sum()
+            assert comprimento == pytest.approx(esperado, rel=1e-9)
+
+
+def test_tamanho_hubs_ao_quadrado_mais_caminhos():
+    grafo = novo_grafo()
+    nos = np.arange(0, grafo.num_nos, 30)
+    matriz = mh.construir(grafo, nos)
+    assert matriz.entre_hubs.shape == (len(nos), len(nos))
+    # so os nos dos caminhos entre hubs, nao hubs x nos do grafo
+    assert len(matriz.arvore_nos) < len(nos) * grafo.num_nos / 4
+    assert all(array.size <= len(nos) ** 2 or nome.startswith("arvore") for nome, array in matriz.arrays().items())
+
+
+def test_guardada_e_mapeada(tmp_path):
+    novo_grafo().guardar(str(tmp_path / "grafo"))
+    grafo = GrafoCompacto.carregar(str(tmp_path / "grafo"))
+    nos = np.arange(0, grafo.num_nos, 45)
+    assert mh.em_cache(grafo, nos) is None
+    matriz = mh.obter_matriz(grafo, nos, processos=2)
+    assert isinstance(matriz.entre_hubs, np.memmap)
+
+    mh._matrizes.clear()
+    lida = mh.em_cache(GrafoCompacto.carregar(str(tmp_path / "grafo")), nos)
+    esperada = mh.construir(grafo, nos, processos=1)
+    for nome, array in esperada.arrays().items():
+        np.testing.assert_array_equal(lida.arrays()[nome], array)
+
+
+def _igual_a_construir(grafo, matriz):
+    recalculada = mh.construir(grafo, matriz.nos)
+    for nome, array in recalculada.arrays().items():
+        np.testing.assert_array_equal(matriz.arrays()[nome], array, err_msg=nome)
+
+
+@pytest.mark.parametrize("hora_antes,hora_depois", [(7, 8), (8, 6), (17, 18), (23, 0)])
+def test_reparar_igual_a_construir(hora_antes, hora_depois):
+    grafo = _grafo_com_classes()
+    perfis = tr.PerfisVelocidade.de_ficheiro(PERFIS)
+    nos = np.random.default_rng(9).choice(grafo.num_nos, 25, replace=False)
+    grafo.definir_pesos(perfis.pesos(grafo, hora_antes))
+    antes, arvores = mh.construir_com_arvores(grafo, nos)
+    antigos = grafo.pesos
+    grafo.definir_pesos(perfis.pesos(grafo, hora_depois))
+
+    reparada, arvores, estatisticas = mh.reparar(grafo, antes, arvores, antigos)
+    assert estatisticas["arestas_alteradas"] > 0
+    _igual_a_construir(grafo, reparada)
+    for no, (distancia, _) in zip(nos, arvores):
+        np.testing.assert_array_equal(distancia, mh._arvore(grafo, no)[0])
+
+
+def test_reparar_so_as_arvores_afetadas():
+    grafo = _grafo_com_classes()
+    grafo.definir_pesos(tr.PerfisVelocidade.de_ficheiro(PERFIS).pesos(grafo, 7))
+    antes, arvores = mh.construir_com_arvores(grafo, np.arange(0, grafo.num_nos, 40))
+    # um acidente (as arestas a volta de um no ficam mais lentas) e uma via aberta
+    antigos = grafo.pesos
+    perto = np.argsort((grafo.x - grafo.x[123]) ** 2 + (grafo.y - grafo.y[123]) ** 2)[:15]
+    pesos = antigos.copy()
+    pesos[np.isin(grafo.origens_arestas(), perto)] *= 4.0
+    pesos[np.random.default_rng(10).choice(grafo.num_arestas, 5, replace=False)] *= 0.5
+    grafo.definir_pesos(pesos)
+
+    reparada, arvores, estatisticas = mh.reparar(grafo, antes, arvores, antigos)
+    assert 0 < estatisticas["linhas_afetadas"]
+    assert estatisticas["linhas_recalculadas"] < estatisticas["linhas"] / 2
+    assert 0 < estatisticas["nos_reparados"] < estatisticas["linhas_afetadas"] * grafo.num_nos / 2
+    _igual_a_construir(grafo, reparada)
+
+    # sem mudancas de peso fica tudo igual, sem reparar nada
+    mesma, _, estatisticas = mh.reparar(grafo, reparada, arvores, grafo.pesos)
+    assert estatisticas["linhas_afetadas"] == estatisticas["arestas_alteradas"] == 0
+    _igual_a_construir(grafo, mesma)
+
+
+@pytest.mark.parametrize("fator", [4.0, 0.25])
+def test_reparar_arvore_de_varias_origens(fator):
+    # a tabela dos postos: uma arvore com uma raiz por posto
+    grafo = _grafo_com_classes()
+    grafo.definir_pesos(tr.PerfisVelocidade.de_ficheiro(PERFIS).pesos(grafo, 7))
+    postos = np.random.default_rng(11).choice(grafo.num_nos, 6, replace=False).tolist()
+    distancia, _, proximo = dijkstra_multi_origem(grafo, postos, reverso=True, com_anterior=True)
+    antigos = grafo.pesos
+    pesos = antigos.copy()
+    pesos[np.random.default_rng(12).choice(grafo.num_arestas, 30, replace=False)] *= fator
+    grafo.definir_pesos(pesos)
+
+    distancia, proximo, reparados = mh.reparar_arvore(grafo, distancia, proximo, mh.alteracoes(grafo, antigos))
+    assert 0 < reparados < grafo.num_nos * mh.FRACAO_RECALCULO
+    esperada, origem, esperado = dijkstra_multi_origem(grafo, postos, reverso=True, com_anterior=True)
+    np.testing.assert_array_equal(distancia, esperada)
+    np.testing.assert_array_equal(proximo, esperado)
+    np.testing.assert_array_equal(mh.raizes_da_arvore(distancia, proximo), origem)
+
+
+def test_medir_mudanca_compara_reparacao_e_recalculo():
+    grafo = _grafo_com_classes()
+    perfis = tr.PerfisVelocidade.de_ficheiro(PERFIS)
+    resultado, = tr.medir_mudanca(grafo, [np.arange(0, grafo.num_nos, 40)], perfis, 7, 8)
+    assert resultado["igual_a_construir"] and resultado["arestas_alteradas"] > 0
+    assert resultado["fracao_do_recalculo"] == pytest.approx(resultado["tempo_reparacao_s"] /
+                                                             resultado["tempo_construcao_s"])
+    postos = tr.medir_tabela_postos(grafo, [[1, 300, 700]], perfis, 7, 8)
+    assert all(r["igual_a_construir"] for r in postos)
+
+
+def test_hash_do_grafo_nao_depende_dos_pesos():
+    grafo = _grafo_com_classes()
+    sem_trafego = grafo.hash_conteudo()
+    grafo.definir_pesos(tr.PerfisVelocidade.de_ficheiro(PERFIS).pesos(grafo, 8))
+    assert grafo.hash_conteudo() == sem_trafego
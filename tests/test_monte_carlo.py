@@ -0,0 +1,19 @@
+import pytest
+
+import monte_carlo as mc
+
+scipy_stats = pytest.importorskip("scipy.stats")
+
+
+@pytest.mark.parametrize("graus_liberdade", [1, 9, 20, 21, 29, 45, 99, 150, 5000])
+def test_valor_critico_t(graus_liberdade):
+    exato = scipy_stats.t.ppf(0.975, graus_liberdade)
+    assert mc._valor_critico_t(graus_liberdade) == pytest.approx(exato)
+
+
+@pytest.mark.parametrize("graus_liberdade", [1, 9, 20, 21, 29, 45, 99, 150, 5000])
+def test_valor_critico_t_sem_scipy_nunca_menor(monkeypatch, graus_liberdade):
+    # sem scipy vale a linha da tabela de menos graus de liberdade: o intervalo so pode ficar mais largo
+    monkeypatch.setattr(mc, "t_student", None)
+    exato = scipy_stats.t.ppf(0.975, graus_liberdade)
+    assert exato - 1e-3 <= mc._valor_critico_t(graus_liberdade) <= exato + 0.1
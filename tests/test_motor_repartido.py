@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+import frota as fr
+import gerador_sintetico as gs
+import motor_simulacao as ms
+import simulacao_batch as sb
+import trafego as tr
+from conftest import novo_grafo
+
+PERFIS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perfis_velocidade.json")
+
+
+@pytest.fixture(scope="module")
+def ficheiro_grafo(cenario, tmp_path_factory):
+    # os processos das regioes carregam o grafo do ficheiro (da cache binaria ao lado dele)
+    caminho = str(tmp_path_factory.mktemp("repartido") / "grafo.graphml")
+    gs.guardar_graphml(cenario["grafo"], caminho)
+    return caminho
+
+
+@pytest.fixture
+def criar(cenario, ficheiro_grafo):
+    """A simulacao do cenario num so processo (regioes=1) ou repartida, com a mesma semente."""
+    def criar_simulacao(regioes, semente, **extra):
+        return sb.preparar_simulacao(semente, ficheiro_grafo, None, None, cenario["frota"], G=novo_grafo(),
+                                     pois_frota=cenario["pois"], zonas_recolha=cenario["zonas"], regioes=regioes,
+                                     **extra)
+    return criar_simulacao
+
+
+@pytest.mark.parametrize("extra", [{}, {"velocidade_kmh": 30, "ficheiro_perfis": PERFIS, "hora_inicial": 7.9}],
+                         ids=["aresta_por_passo", "trafego"])
+def test_kpis_iguais_ao_motor_num_processo(criar, extra):
+    # sem pedidos os taxis sao independentes: repartir a frota nao muda nada
+    um = criar(1, 3, **extra)
+    with criar(2, 3, **extra) as repartida:
+        um.avancar_ate(600)
+        repartida.avancar_ate(600)
+        kpis, kpis_repartida = um.calcular_kpis(), repartida.calcular_kpis()
+        assert kpis_repartida["transferencias"] > 0
+        assert {k: kpis_repartida[k] for k in kpis if k not in ms.KPIS_CACHE} == \
+            {k: v for k, v in kpis.items() if k not in ms.KPIS_CACHE}
+        for nome in fr.COLUNAS:
+            np.testing.assert_array_equal(getattr(repartida.frota, nome), getattr(um.frota, nome), err_msg=nome)
+        if extra:
+            assert isinstance(repartida.trafego, tr.PerfisVelocidade)
+
+
+def test_kpis_com_pedidos_perto_do_motor_num_processo(criar):
+    # com pedidos cada regiao tem o seu despachante: os mesmos ritmos, mas nao os mesmos pedidos
+    um = criar(1, 3, pedidos_por_hora=300)
+    with criar(2, 3, pedidos_por_hora=300) as repartida:
+        um.avancar_ate(600)
+        repartida.avancar_ate(600)
+        kpis, kpis_repartida = um.calcular_kpis(), repartida.calcular_kpis()
+    assert kpis_repartida["pedidos_gerados"] == pytest.approx(kpis["pedidos_gerados"], rel=0.1)
+    assert kpis_repartida["pedidos_concluidos"] == pytest.approx(kpis["pedidos_concluidos"], rel=0.2)
+    assert kpis_repartida["custo_total"] == pytest.approx(kpis["custo_total"], rel=0.1)
+
+
+def test_taxis_em_servico_ficam_no_processo(criar):
+    # os pedidos sao do despachante que os atribuiu: fora da sua regiao, so ficam os taxis em servico
+    fora_em_servico = 0
+    with criar(2, 5, pedidos_por_hora=300) as repartida:
+        for passo in range(50, 1001, 50):
+            repartida.avancar_ate(passo)
+            frota = repartida.frota
+            fora = repartida.regiao[frota.no_decisao(np.arange(len(frota)))] != frota.processo
+            assert np.all(frota.estado[fora] == fr.EM_SERVICO)
+            fora_em_servico += int(fora.sum())
+    assert fora_em_servico > 0
+
+
+def test_vista_so_e_pedida_quando_lida(criar):
+    with criar(2, 3) as repartida:
+        repartida.avancar_ate(10)
+        assert "estado" not in vars(repartida.frota)
+        estado = repartida.frota.estado
+        assert "posicao" in vars(repartida.frota)
+        assert repartida.frota.estado is estado
+        repartida.avancar_ate(20)
+        assert "estado" not in vars(repartida.frota)
+        assert len(repartida.frota) == len(estado)
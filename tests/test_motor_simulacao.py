@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+import matriz_hubs as mh
+import trafego as tr
+from conftest import novo_grafo
+from grafo_compacto import dijkstra_multi_origem
+
+PERFIS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perfis_velocidade.json")
+
+
+@pytest.mark.parametrize("com_trafego", [False, True])
+def test_tabela_postos_igual_a_um_dijkstra_por_posto(criar_simulacao, com_trafego):
+    sim = criar_simulacao(7, G=novo_grafo())
+    if com_trafego:
+        sim.usar_trafego(tr.PerfisVelocidade({"residential": 20}, 50), hora_inicial=8.0)
+    sim.construir_tabela_postos()
+    grafo = sim.grafo
+    for tipo, chave in (("eletrico", "carregadores_eletricos"), ("gasolina", "bombas_gasolina")):
+        postos = mh.nos_de(grafo, sim.pois_frota[chave])
+        # um Dijkstra invertido por posto, e o melhor de todos em cada no
+        por_posto = [dijkstra_multi_origem(grafo, [p], reverso=True, com_anterior=True) for p in postos]
+        distancias = np.array([d for d, _, _ in por_posto])
+        melhor = np.argmin(distancias, axis=0)
+        colunas = np.arange(grafo.num_nos)
+        metros, posto = sim.tabela_postos[tipo]
+        ate_posto = np.array([mh.metros_da_arvore(grafo, d, proximo) for d, _, proximo in por_posto])
+        np.testing.assert_allclose(metros, ate_posto[melhor, colunas], rtol=1e-9)
+        # em empates pode ficar outro posto, mas sempre a mesma distancia (nos pesos do grafo)
+        escolhido = [postos.index(int(p)) for p in posto]
+        np.testing.assert_allclose(distancias[escolhido, colunas], distancias[melhor, colunas], rtol=1e-6)
+
+
+def test_mudanca_de_hora_repara_matriz_e_tabela_postos(criar_simulacao):
+    sim = criar_simulacao(5, G=novo_grafo(), velocidade_kmh=30, pedidos_por_hora=300)
+    mh._matrizes.clear()
+    sim.usar_trafego(tr.PerfisVelocidade.de_ficheiro(PERFIS), hora_inicial=7.9)
+    sim.construir_tabela_postos()
+    sim.avancar_ate(1500)
+    sim.construir_tabela_postos()
+    kpis = sim.calcular_kpis()
+    assert kpis["mudancas_hora"] > 0
+    # as horas com os mesmos pesos reutilizam a matriz; as outras sao reparadas a partir da anterior
+    assert kpis["matrizes_reparadas"] > 0 and kpis["matrizes_construidas"] == 0
+    assert kpis["tabelas_postos_reparadas"] > 0
+
+    # a matriz e as tabelas reparadas sao as que se teriam construido de raiz
+    grafo = sim.grafo
+    recalculada = mh.construir(grafo, sim.despacho.tabelas.nos)
+    for nome, array in recalculada.arrays().items():
+        np.testing.assert_array_equal(sim.despacho.tabelas.arrays()[nome], array, err_msg=nome)
+    for tipo, chave in (("eletrico", "carregadores_eletricos"), ("gasolina", "bombas_gasolina")):
+        tempos, posto, proximo = dijkstra_multi_origem(grafo, mh.nos_de(grafo, sim.pois_frota[chave]), reverso=True,
+                                                       com_anterior=True)
+        metros, postos = sim.tabela_postos[tipo]
+        np.testing.assert_array_equal(metros, mh.metros_da_arvore(grafo, tempos, proximo))
+        np.testing.assert_array_equal(postos, posto)
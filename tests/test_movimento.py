@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import frota as fr
+import trafego as tr
+from conftest import novo_grafo
+
+
+def test_rota_acumulado():
+    grafo = novo_grafo()
+    caminho = [1, 2, 3, 33, 63]
+    rota = fr.Rota.de_caminho(grafo, 0, caminho)
+    arestas = grafo.comprimentos_arestas(np.array([0] + caminho[:-1]), np.array(caminho))
+    assert rota.restante() == pytest.approx(arestas.sum())
+    for k, no in enumerate(caminho):
+        assert rota.avancar() == (no, pytest.approx(arestas[k]))
+        assert rota.restante() == pytest.approx(arestas[k + 1:].sum())
+        assert len(rota) == len(caminho) - k - 1
+
+
+def _distancia_por_passo(sim, passos):
+    """Metros percorridos em cada passo pelos taxis que estavam e continuam livres (esses nunca param)."""
+    percorridos = []
+    for _ in range(passos):
+        antes_estado = sim.frota.estado.copy()
+        antes = sim.frota.distancia.copy()
+        sim.executar_passo()
+        livres = (antes_estado == fr.LIVRE) & (sim.frota.estado == fr.LIVRE)
+        percorridos.append((sim.frota.distancia - antes)[livres])
+    return np.concatenate(percorridos)
+
+
+def test_distancia_por_passo(criar_simulacao):
+    sim = criar_simulacao(7, velocidade_kmh=36.0)
+    assert sim.metros_por_passo == pytest.approx(100.0)
+    percorridos = _distancia_por_passo(sim, 200)
+    assert len(percorridos) > 1000
+    np.testing.assert_allclose(percorridos, 100.0, rtol=1e-5)
+    # os taxis param a meio das arestas
+    assert (sim.frota.progresso > 0).any()
+
+
+def test_distancia_por_passo_com_trafego(criar_simulacao):
+    # o perfil da 36 km/h a todas as estradas, a qualquer hora: em 10 s cada taxi livre anda 100 m
+    sim = criar_simulacao(7, G=novo_grafo(), velocidade_kmh=50.0)
+    sim.usar_trafego(tr.PerfisVelocidade({}, 36.0), hora_inicial=8.0)
+    percorridos = _distancia_por_passo(sim, 200)
+    assert len(percorridos) > 1000
+    np.testing.assert_allclose(percorridos, 100.0, rtol=1e-4)
+
+
+def test_aresta_por_passo(criar_simulacao):
+    # sem velocidade cada passo e uma aresta inteira
+    sim = criar_simulacao(7)
+    antes = sim.frota.posicao.copy()
+    percorridos = _distancia_por_passo(sim, 1)
+    livres = sim.frota.estado == fr.LIVRE
+    arestas = sim.grafo.comprimentos_arestas(antes[livres], sim.frota.posicao[livres])
+    np.testing.assert_allclose(percorridos, arestas * sim.FATOR_CONSUMO)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import frota as fr
+import perfil as pf
+from conftest import NUM_TAXIS
+
+
+@pytest.mark.parametrize("extra", [{}, {"pedidos_por_hora": 200.0}])
+def test_perfil_nao_muda_a_simulacao(criar_simulacao, extra):
+    normal = criar_simulacao(7, **extra)
+    medida = criar_simulacao(7, **extra)
+    perfil = medida.ativar_perfil()
+    for _ in range(300):
+        normal.executar_passo()
+        medida.executar_passo()
+    assert medida.desativar_perfil() is perfil
+    for coluna in fr.COLUNAS:
+        np.testing.assert_array_equal(getattr(medida.frota, coluna), getattr(normal.frota, coluna), err_msg=coluna)
+
+    relatorio = perfil.relatorio(medida)
+    assert relatorio["passos"] == 300
+    fases = {"abastecimento", "carregamento", "movimento"} | ({"despacho"} if extra else set())
+    assert fases <= set(relatorio["fases"])
+    assert all(fase["chamadas"] == 300 for nome, fase in relatorio["fases"].items() if nome in fases)
+    assert relatorio["contadores"]["nos_expandidos"] > 0
+    assert sum(relatorio["taxis_por_estado"].values()) == pytest.approx(NUM_TAXIS)
+    assert relatorio["cache_rotas"] == medida.cache_rotas.estatisticas()
+    assert "300 passos" in pf.formatar(relatorio)
+
+
+def test_captura(criar_simulacao):
+    sim = criar_simulacao(7)
+    with pf.Captura(memoria=True, linhas=5) as captura:
+        sim.avancar_ate(50)
+    assert captura.memoria_pico > 0
+    texto = captura.relatorio()
+    assert "avancar_ate" in texto
+    assert "memoria: pico" in texto
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import preprocessamento_rotas as pr
+from conftest import novo_grafo
+from grafo_compacto import dijkstra_multi_origem
+
+
+@pytest.fixture(scope="module")
+def grafo():
+    return novo_grafo()
+
+
+@pytest.mark.parametrize("tipo", sorted(pr.TIPOS))
+def test_igual_ao_dijkstra(grafo, tipo):
+    indice = pr.TIPOS[tipo].construir(grafo)
+    erros, _, _ = pr.verificar_contra_dijkstra(grafo, indice, amostras=150, semente=3)
+    assert erros == 0
+
+
+def test_heuristica_alt_admissivel(grafo):
+    indice = pr.IndiceALT.construir(grafo)
+    rng = np.random.default_rng(4)
+    for fim in rng.choice(grafo.num_nos, 10, replace=False).tolist():
+        ate_fim, _ = dijkstra_multi_origem(grafo, [fim], reverso=True)
+        h = indice.heuristica_para(0, fim)
+        alcancaveis = np.flatnonzero(np.isfinite(ate_fim))
+        assert all(h(v) <= ate_fim[v] for v in alcancaveis.tolist())
+
+
+def test_indice_alt_antigo_e_reconstruido(grafo, tmp_path):
+    indice = pr.IndiceALT.construir(grafo)
+    caminho = tmp_path / "mapa.graphml"
+    np.savez(pr.caminho_indice(str(caminho), "alt"), tipo="alt", marcos=indice.marcos,
+             dist_de=indice.dist_de.astype(np.float32), dist_para=indice.dist_para.astype(np.float32),
+             assinatura=indice.assinatura)
+    assert pr.carregar_se_existir(grafo, str(caminho)) is None
+    indice.guardar(pr.caminho_indice(str(caminho), "alt"))
+    assert pr.carregar_se_existir(grafo, str(caminho)).assinatura == grafo.hash_conteudo()
@@ -0,0 +1,61 @@
+import json
+import time
+
+import telemetria as tl
+
+
+class SaidaLenta:
+    """Saida em memoria que demora um pouco em cada registo, para a fila encher."""
+
+    def __init__(self):
+        self.registos = []
+        self.fechada = False
+
+    def escrever(self, registo):
+        time.sleep(0.0005)
+        self.registos.append(registo)
+
+    def fechar(self):
+        self.fechada = True
+
+
+def test_fechar_escreve_toda_a_fila(criar_simulacao, tmp_path):
+    sim = criar_simulacao(7)
+    lenta = SaidaLenta()
+    caminho = tmp_path / "telemetria.jsonl"
+    telemetria = tl.Telemetria([lenta, tl.SaidaFicheiro(str(caminho))], intervalo=1, eventos=True)
+    telemetria.iniciar(sim)
+    # mais amostras do que cabem na fila (1000): observar tem de esperar pela thread de escrita, nao perder registos
+    for _ in range(1200):
+        sim.executar_passo()
+        telemetria.observar(sim)
+    telemetria.amostrar(sim, tipo="final")
+    telemetria.fechar()
+
+    assert lenta.fechada
+    agregados = [r for r in lenta.registos if r["tipo"] != "evento"]
+    assert [r["passo"] for r in agregados] == list(range(1, 1201)) + [1200]
+    assert agregados[-1]["tipo"] == "final"
+
+    linhas = [json.loads(linha) for linha in caminho.read_text(encoding="utf-8").splitlines()]
+    assert linhas == lenta.registos
+    # um evento por mudanca de estado contada nas transicoes
+    eventos = [r for r in linhas if r["tipo"] == "evento"]
+    assert eventos
+    assert len(eventos) == sum(sum(r["transicoes"].values()) for r in agregados)
+
+
+def test_csv_sem_eventos(criar_simulacao, tmp_path):
+    sim = criar_simulacao(7)
+    caminho = tmp_path / "telemetria.csv"
+    telemetria = tl.Telemetria([tl.SaidaFicheiro(str(caminho))], intervalo=50, eventos=True)
+    telemetria.iniciar(sim)
+    for _ in range(200):
+        sim.executar_passo()
+        telemetria.observar(sim, periodico=sim.passo_atual < 200)
+    telemetria.amostrar(sim, tipo="final")
+    telemetria.fechar()
+
+    linhas = caminho.read_text(encoding="utf-8").splitlines()
+    assert linhas[0].startswith("tipo,")
+    assert [linha.split(",")[0] for linha in linhas[1:]] == ["periodico"] * 3 + ["final"]
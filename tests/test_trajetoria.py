@@ -0,0 +1,49 @@
+import numpy as np
+
+import trajetoria as tj
+
+
+def _gravar(sim, gravador, passos):
+    # copia de cada coluna gravada, para comparar com o ficheiro
+    esperado = {nome: [] for nome, _, _ in tj.COLUNAS}
+    for _ in range(passos):
+        sim.executar_passo()
+        gravador.gravar(sim.passo_atual)
+        for nome, atributo, tipo in tj.COLUNAS:
+            esperado[nome].append(getattr(sim.frota, atributo).astype(tipo))
+    return {nome: np.array(linhas) for nome, linhas in esperado.items()}
+
+
+def test_ida_e_volta(criar_simulacao, tmp_path):
+    sim = criar_simulacao(7)
+    caminho = str(tmp_path / "trajetoria.npz")
+    gravador = tj.GravadorTrajetoria(sim.frota, caminho=caminho, grafo=sim.grafo, ficheiro_grafo="mapa.graphml",
+                                     frames_por_bloco=16)
+    esperado = _gravar(sim, gravador, 70)
+    gravador.fechar()
+
+    trajetoria = tj.carregar_trajetoria(caminho)
+    assert trajetoria["frames"] == 70
+    assert trajetoria["ficheiro_grafo"] == "mapa.graphml"
+    assert trajetoria["hash_grafo"] == sim.grafo.hash_conteudo()
+    np.testing.assert_array_equal(trajetoria["ids"], sim.frota.ids)
+    np.testing.assert_array_equal(trajetoria["passos"], np.arange(1, 71))
+    for nome, valores in esperado.items():
+        np.testing.assert_array_equal(trajetoria[nome], valores, err_msg=nome)
+
+    # 70 frames em blocos de 16: o ultimo bloco fica incompleto e cada um pode ser lido sozinho
+    ultimo = next(tj.ler_blocos(caminho, ("estados",), [4]))
+    assert sorted(ultimo) == ["estados", "passos"]
+    np.testing.assert_array_equal(ultimo["estados"], esperado["estados"][64:])
+
+
+def test_gravar_antes_de_abrir_o_ficheiro(criar_simulacao, tmp_path):
+    sim = criar_simulacao(7)
+    gravador = tj.GravadorTrajetoria(sim.frota, frames_por_bloco=8)
+    esperado = _gravar(sim, gravador, 20)
+    caminho = str(tmp_path / "trajetoria.npz")
+    gravador.guardar(caminho, sim.grafo)
+
+    trajetoria = tj.carregar_trajetoria(caminho, colunas=("posicoes",))
+    assert "estados" not in trajetoria
+    np.testing.assert_array_equal(trajetoria["posicoes"], esperado["posicoes"])
@@ -0,0 +1,181 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+import matriz_hubs as mh
+from grafo_compacto import carregar_grafo, dijkstra_multi_origem
+
+# Trafego: velocidades por hora do dia e por classe de estrada (o atributo "highway" do OSM), lidas
+# de um ficheiro JSON como perfis_velocidade.json:
+#
+#   {"padrao": [24 valores em km/h], "classes": {"primary": [24 valores], "residential": 30, ...}}
+#
+# Cada classe tem 24 velocidades (uma por hora, a partir da meia-noite) ou uma so, constante; as
+# classes "*_link" usam a da classe principal quando nao tem perfil proprio e as restantes usam o
+# "padrao". Os pesos das procuras passam a ser o tempo de percurso de cada aresta, em segundos.
+#
+# Ao mudar de hora o motor (MotorSimulacao.usar_trafego) troca os pesos do grafo, passa o despacho
+# para a matriz de hubs das zonas de recolha desses pesos (guardada, se a hora ja foi vista, ou
+# reparada a partir da da hora anterior: matriz_hubs.reparar refaz so as arvores dos hubs que usam
+# arestas cujo tempo mudou) e repara a tabela dos postos quando for precisa (a arvore do Dijkstra
+# invertido a partir de todos os postos de cada tipo, com matriz_hubs.reparar_arvore). Para medir o
+# custo de uma mudanca de hora, com reparacao e de raiz:
+#
+#   python trafego.py --grafo matosinhos_5km.graphml --de 7 --para 8
+
+HORAS = 24
+
+
+def _por_hora(valor, nome):
+    if isinstance(valor, (int, float)):
+        valor = [valor] * HORAS
+    if len(valor) != HORAS or min(valor) <= 0:
+        raise ValueError(f"O perfil '{nome}' tem de ter {HORAS} velocidades positivas (ou uma so).")
+    return [float(v) for v in valor]
+
+
+class PerfisVelocidade:
+    """Velocidade (km/h) de cada classe de estrada em cada hora do dia."""
+
+    def __init__(self, classes, padrao):
+        self.classes = {nome: _por_hora(valor, nome) for nome, valor in classes.items()}
+        self.padrao = _por_hora(padrao, "padrao")
+
+    @classmethod
+    def de_ficheiro(cls, caminho):
+        with open(caminho, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        return cls.de_dict(dados)
+
+    @classmethod
+    def de_dict(cls, dados):
+        return cls(dados.get("classes", {}), dados["padrao"])
+
+    def para_dict(self):
+        return {"classes": self.classes, "padrao": self.padrao}
+
+    def perfil(self, classe):
+        if classe in self.classes:
+            return self.classes[classe]
+        if classe.endswith("_link") and classe[:-len("_link")] in self.classes:
+            return self.classes[classe[:-len("_link")]]
+        return self.padrao
+
+    def velocidades(self, grafo, hora):
+        """km/h de cada aresta do grafo (ordem do CSR) na hora dada (0 a 23)."""
+        if grafo.classes is None:
+            return np.full(grafo.num_arestas, self.padrao[hora])
+        por_classe = np.array([self.perfil(nome)[hora] for nome in grafo.nomes_classes] or [self.padrao[hora]])
+        return por_classe[grafo.classes]
+
+    def pesos(self, grafo, hora):
+        """Tempo de percurso de cada aresta, em segundos (para GrafoCompacto.definir_pesos)."""
+        return (grafo.comprimentos / (self.velocidades(grafo, hora) / 3.6)).astype(np.float32)
+
+
+def hora_do_passo(passo, segundos_por_passo, hora_inicial=0.0):
+    """Hora do dia (0 a 23) em que calha o passo, com a simulacao a comecar em hora_inicial."""
+    return int(hora_inicial + passo * segundos_por_passo / 3600.0) % HORAS
+
+
+def medir_mudanca(grafo, conjuntos_hubs, perfis, hora_antes, hora_depois):
+    """Mede o que custa ao despacho passar de hora_antes para hora_depois: reparar a matriz de cada
+    conjunto de hubs (matriz_hubs.reparar, como o motor faz) e, para comparar, construi-la de raiz com
+    os pesos novos. Devolve uma lista de resultados (um por conjunto)."""
+    grafo.definir_pesos(perfis.pesos(grafo, hora_antes))
+    antigos = grafo.pesos
+    antes = [mh.construir_com_arvores(grafo, nos) for nos in conjuntos_hubs]
+    grafo.definir_pesos(perfis.pesos(grafo, hora_depois))
+
+    resultados = []
+    for matriz, arvores in antes:
+        t0 = time.perf_counter()
+        reparada, _, estatisticas = mh.reparar(grafo, matriz, arvores, antigos)
+        tempo_reparacao = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        nova = mh.construir(grafo, matriz.nos)
+        tempo = time.perf_counter() - t0
+        finitas = np.isfinite(nova.entre_hubs) & np.isfinite(matriz.entre_hubs)
+        resultados.append({
+            **estatisticas,
+            "hubs": len(nova.nos),
+            "nos_arvores": len(nova.arvore_nos),
+            "tempo_reparacao_s": tempo_reparacao,
+            "tempo_construcao_s": tempo,
+            "fracao_do_recalculo": tempo_reparacao / tempo if tempo > 0 else 0.0,
+            "igual_a_construir": all(np.array_equal(getattr(reparada, nome), getattr(nova, nome))
+                                     for nome in mh.ARRAYS),
+            "variacao_maxima": float(np.abs(nova.entre_hubs[finitas] - matriz.entre_hubs[finitas]).max(initial=0.0)),
+        })
+    return resultados
+
+
+def medir_tabela_postos(grafo, conjuntos_postos, perfis, hora_antes, hora_depois):
+    """Como medir_mudanca, para a tabela dos postos de cada conjunto (tempo ate ao posto mais proximo):
+    reparar a arvore da hora antes (matriz_hubs.reparar_arvore) ou refazer o Dijkstra multi-origem."""
+    grafo.definir_pesos(perfis.pesos(grafo, hora_antes))
+    antigos = grafo.pesos
+    antes = [(postos, dijkstra_multi_origem(grafo, postos, reverso=True, com_anterior=True))
+             for postos in conjuntos_postos]
+    grafo.definir_pesos(perfis.pesos(grafo, hora_depois))
+
+    resultados = []
+    for postos, (tempos, _, proximos) in antes:
+        t0 = time.perf_counter()
+        reparada = mh.reparar_arvore(grafo, tempos, proximos, mh.alteracoes(grafo, antigos))
+        if reparada is not None and reparada[2]:
+            mh.raizes_da_arvore(reparada[0], reparada[1])
+        tempo_reparacao = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        novos = dijkstra_multi_origem(grafo, postos, reverso=True, com_anterior=True)
+        tempo = time.perf_counter() - t0
+        resultados.append({
+            "postos": len(postos),
+            # None: a reparacao chegava a mais de matriz_hubs.FRACAO_RECALCULO dos nos (o motor refaz)
+            "nos_reparados": None if reparada is None else reparada[2],
+            "tempo_reparacao_s": tempo_reparacao,
+            "tempo_construcao_s": tempo,
+            "fracao_do_recalculo": tempo_reparacao / tempo if tempo > 0 else 0.0,
+            "igual_a_construir": reparada is None or np.array_equal(reparada[0], novos[0]),
+        })
+    return resultados
+
+
+def main():
+    import gestor_mapa as gm
+
+    parser = argparse.ArgumentParser(description="Custo da matriz de hubs das zonas numa mudanca de hora")
+    parser.add_argument("--grafo", default="matosinhos_5km.graphml")
+    parser.add_argument("--pois", default="pontos_interesse_matoshinhos.json")
+    parser.add_argument("--zonas", default="zonas_recolha_matosinhos.json")
+    parser.add_argument("--perfis", default="perfis_velocidade.json")
+    parser.add_argument("--distancia-minima", type=float, default=250)
+    parser.add_argument("--de", type=int, default=7, help="hora antes da mudanca")
+    parser.add_argument("--para", type=int, default=8, help="hora depois da mudanca")
+    args = parser.parse_args()
+
+    grafo = carregar_grafo(args.grafo)
+    perfis = PerfisVelocidade.de_ficheiro(args.perfis)
+    with open(args.pois, "r", encoding="utf-8") as f:
+        pois_frota = json.load(f)
+    with open(args.zonas, "r", encoding="utf-8") as f:
+        zonas_recolha = json.load(f)
+    _, _, recolha = gm.filtrar_pontos_com_hierarquia(pois_frota, zonas_recolha, args.distancia_minima)
+    for r in medir_mudanca(grafo, [mh.nos_de(grafo, recolha)], perfis, args.de, args.para):
+        print(f"zonas de recolha: {r['hubs']} hubs, {r['arestas_alteradas']} arestas alteradas, "
+              f"{r['linhas_afetadas']} arvores afetadas ({r['linhas_recalculadas']} refeitas); reparacao em "
+              f"{r['tempo_reparacao_s']:.3f}s vs matriz nova em {r['tempo_construcao_s']:.3f}s "
+              f"({r['fracao_do_recalculo']:.0%}, igual: {r['igual_a_construir']}), "
+              f"variacao maxima entre hubs {r['variacao_maxima']:.3g}s")
+    tipos = ("carregadores_eletricos", "bombas_gasolina")
+    conjuntos = [mh.nos_de(grafo, pois_frota.get(tipo, [])) for tipo in tipos]
+    for tipo, r in zip(tipos, medir_tabela_postos(grafo, conjuntos, perfis, args.de, args.para)):
+        reparados = "refeita" if r["nos_reparados"] is None else f"{r['nos_reparados']} nos reparados"
+        print(f"{tipo}: {r['postos']} postos, {reparados}; reparacao em {r['tempo_reparacao_s']:.3f}s vs "
+              f"Dijkstra em {r['tempo_construcao_s']:.3f}s ({r['fracao_do_recalculo']:.0%}, "
+              f"igual: {r['igual_a_construir']})")
+
+if __name__ == "__main__":
+    main()
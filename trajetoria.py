@@ -0,0 +1,152 @@
+import queue
+import threading
+import zipfile
+
+import numpy as np
+
+# Gravacao do estado da frota ao longo de uma simulacao, para rever, exportar em video
+# (exportar_video.py) ou analisar uma execucao mais tarde sem a voltar a correr.
+#
+# Cada gravacao copia uma linha por coluna (no, estado, autonomia, custo, CO2 de todos os taxis)
+# para buffers pre-alocados de `frames_por_bloco` linhas. Quando um bloco enche e escrito no
+# ficheiro como um membro comprimido de um .npz ("posicoes_000000", "estados_000000", ...), por
+# isso a memoria usada nao cresce com a duracao da simulacao e o ficheiro pode ser lido bloco a
+# bloco (ler_blocos) ou inteiro (carregar_trajetoria) com o np.load normal.
+#
+# A compressao dos blocos (a parte cara) e feita numa thread de escrita, fora do ciclo da
+# simulacao; gravar() so copia as linhas para os buffers.
+
+# (nome da coluna no ficheiro, atributo da Frota, tipo gravado)
+COLUNAS = (
+    ("posicoes", "posicao", np.int32),
+    ("estados", "estado", np.int8),
+    ("autonomia", "autonomia", np.float32),
+    ("custo", "custo", np.float32),
+    ("co2", "co2", np.float32),
+)
+
+
+class GravadorTrajetoria:
+    def __init__(self, frota, intervalo=1, caminho=None, grafo=None, ficheiro_grafo="", frames_por_bloco=256):
+        self.frota = frota
+        self.intervalo = max(int(intervalo), 1)
+        self.frames = 0
+        self.num_blocos = 0
+        self._usados = 0
+        self.frames_por_bloco = frames_por_bloco
+        self._novos_buffers()
+        self._blocos = []  # blocos cheios enquanto nao houver ficheiro aberto
+        self._zip = None
+        self._fila = None
+        self._escritor = None
+        if caminho is not None:
+            self.abrir(caminho, grafo, ficheiro_grafo)
+
+    def __len__(self):
+        return self.frames
+
+    def _novos_buffers(self):
+        n = len(self.frota)
+        self._passos = np.empty(self.frames_por_bloco, dtype=np.int64)
+        self._colunas = {nome: np.empty((self.frames_por_bloco, n), dtype=tipo) for nome, _, tipo in COLUNAS}
+
+    def abrir(self, caminho, grafo=None, ficheiro_grafo=""):
+        """Abre o ficheiro de saida; a partir daqui cada bloco cheio e escrito logo em disco."""
+        self._zip = zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._escrever("ids", self.frota.ids)
+        self._escrever("ficheiro_grafo", np.array(ficheiro_grafo))
+        self._escrever("hash_grafo", np.array(grafo.hash_conteudo() if grafo is not None else ""))
+        # no maximo dois blocos a espera de escrita, para a memoria nao crescer se o disco for lento
+        self._fila = queue.Queue(maxsize=2)
+        self._escritor = threading.Thread(target=self._escrever_fila, daemon=True)
+        self._escritor.start()
+        for bloco in self._blocos:
+            self._fila.put(bloco)
+        self._blocos = []
+
+    def _escrever_fila(self):
+        while True:
+            bloco = self._fila.get()
+            if bloco is None:
+                return
+            self._escrever_bloco(bloco)
+
+    def gravar(self, passo):
+        k = self._usados
+        self._passos[k] = passo
+        for nome, atributo, _ in COLUNAS:
+            self._colunas[nome][k] = getattr(self.frota, atributo)
+        self._usados += 1
+        self.frames += 1
+        if self._usados == len(self._passos):
+            self._fechar_bloco()
+
+    def _fechar_bloco(self):
+        k = self._usados
+        if not k:
+            return
+        bloco = {"passos": self._passos[:k]}
+        bloco.update((nome, coluna[:k]) for nome, coluna in self._colunas.items())
+        # os buffers passam para o bloco (sem copia) e a gravacao continua em buffers novos
+        self._novos_buffers()
+        self._usados = 0
+        if self._zip is None:
+            self._blocos.append(bloco)
+        else:
+            self._fila.put(bloco)
+
+    def _escrever_bloco(self, bloco):
+        for nome, valores in bloco.items():
+            self._escrever(f"{nome}_{self.num_blocos:06d}", valores)
+        self.num_blocos += 1
+
+    def _escrever(self, nome, valores):
+        with self._zip.open(nome + ".npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asarray(valores), allow_pickle=False)
+
+    def fechar(self):
+        """Escreve o bloco incompleto e fecha o ficheiro."""
+        if self._zip is None:
+            return
+        self._fechar_bloco()
+        self._fila.put(None)
+        self._escritor.join()
+        self._escrever("frames", np.array(self.frames, dtype=np.int64))
+        self._zip.close()
+        self._zip = None
+        self._fila = self._escritor = None
+
+    def guardar(self, caminho, grafo=None, ficheiro_grafo=""):
+        """Escreve tudo o que foi gravado em `caminho` (se o ficheiro ainda nao estava aberto) e fecha-o."""
+        if self._zip is None:
+            self.abrir(caminho, grafo, ficheiro_grafo)
+        self.fechar()
+
+
+def ler_cabecalho(caminho):
+    """ids, ficheiro e hash do grafo e numero de frames, sem ler os blocos."""
+    with np.load(caminho) as dados:
+        return {"ids": dados["ids"], "ficheiro_grafo": str(dados["ficheiro_grafo"]),
+                "hash_grafo": str(dados["hash_grafo"]), "frames": int(dados["frames"])}
+
+
+def ler_blocos(caminho, colunas=None, blocos=None):
+    """Itera pelos blocos do ficheiro, cada um um dicionario {"passos": (k,), coluna: (k x taxis)}.
+
+    So um bloco de cada vez e descomprimido; `colunas` limita as colunas lidas e `blocos` (numeros
+    dos blocos, a partir de 0) os blocos."""
+    colunas = ("passos",) + tuple(colunas if colunas is not None else (nome for nome, _, _ in COLUNAS))
+    with np.load(caminho) as dados:
+        if blocos is None:
+            blocos = range(sum(1 for nome in dados.files if nome.startswith("passos_")))
+        for b in blocos:
+            yield {nome: dados[f"{nome}_{b:06d}"] for nome in colunas}
+
+
+def carregar_trajetoria(caminho, colunas=None):
+    """Le o ficheiro inteiro para arrays (frames x taxis), juntamente com o cabecalho."""
+    trajetoria = ler_cabecalho(caminho)
+    blocos = list(ler_blocos(caminho, colunas))
+    for nome in blocos[0] if blocos else ():
+        trajetoria[nome] = np.concatenate([bloco[nome] for bloco in blocos])
+    return trajetoria
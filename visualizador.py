@@ -1,14 +1,23 @@
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
-import osmnx as ox
 import os
+import math
+import time
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba_array
 from matplotlib.patches import Patch
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from matplotlib.legend_handler import HandlerBase
+from frota import SEM_ENERGIA
 
 fig, ax = None, None
 taxi_image = None
 
+# cores dos taxis por estado (livre, a abastecer, sem energia, em servico)
+CORES_ESTADO = ("#FFD700", "#FF8C00", "#808080", "#1E90FF")
+NOMES_ESTADO_PAINEL = ("Livre", "A abastecer", "MORTO", "Em servico")
+
 class HandlerImage(HandlerBase):
     def __init__(self, img_data, zoom=1):
         self.image_data = img_data
@@ -16,13 +25,15 @@ class HandlerImage(HandlerBase):
         super().__init__()
 
     def create_artists(self, legend, orig_handle, xdescent, ydescent, width, height, fontsize, trans):
-        oi = OffsetImage(self.image_data, zoom=self.zoom)
-        ab = AnnotationBbox(oi, (width / 2., height / 2.),
-                            xycoords="data",
+        # zoom relativo a altura da entrada da legenda (a imagem tem centenas de pixeis)
+        oi = OffsetImage(self.image_data, zoom=self.zoom * height / self.image_data.shape[0])
+        # posicao na caixa da entrada da legenda (coordenadas de `trans`), para o icone aparecer
+        # tambem na imagem de fundo guardada pelo RenderizadorFrota
+        ab = AnnotationBbox(oi, (width / 2. - xdescent, height / 2. - ydescent),
+                            xycoords=trans,
                             frameon=False,
                             pad=0,
                             annotation_clip=False)
-        ab.set_transform(trans)
         return [ab]
 
 def preparar_janela():
@@ -48,10 +59,26 @@ def fechar_janela():
     if fig:
         plt.close(fig)
 
-def desenhar_fundo_mapa(ax, G, plotar_bombas, plotar_carregadores, plotar_recolha):
-    ox.plot_graph(G, ax=ax, node_size=0, edge_color='#2E86AB', 
-                  edge_linewidth=0.8, edge_alpha=0.7, 
-                  bgcolor='#F8F9FA', show=False, close=False)
+def desenhar_estradas(ax, grafo, edge_color='#2E86AB', edge_linewidth=1.0, edge_alpha=None, bgcolor='#F8F9FA'):
+    # equivalente ao ox.plot_graph sem nos, mas a partir do GrafoCompacto (sem networkx)
+    estradas = LineCollection(grafo.segmentos(), colors=edge_color, linewidths=edge_linewidth,
+                              alpha=edge_alpha, zorder=1)
+    ax.add_collection(estradas)
+    ax.figure.set_facecolor(bgcolor)
+    ax.set_facecolor(bgcolor)
+
+    margem_x = (grafo.x.max() - grafo.x.min()) * 0.02
+    margem_y = (grafo.y.max() - grafo.y.min()) * 0.02
+    ax.set_xlim(grafo.x.min() - margem_x, grafo.x.max() + margem_x)
+    ax.set_ylim(grafo.y.min() - margem_y, grafo.y.max() + margem_y)
+    ax.set_aspect(1 / math.cos(math.radians(float(grafo.y.mean()))))
+    ax.set_axis_off()
+    return estradas
+
+def desenhar_fundo_mapa(ax, grafo, plotar_bombas, plotar_carregadores, plotar_recolha):
+    desenhar_estradas(ax, grafo, edge_color='#2E86AB', 
+                      edge_linewidth=0.8, edge_alpha=0.7, 
+                      bgcolor='#F8F9FA')
     
     legend_elements = []
     handler_map = {}
@@ -90,10 +117,16 @@ def desenhar_fundo_mapa(ax, G, plotar_bombas, plotar_carregadores, plotar_recolh
     
     if taxi_image is not None:
         taxi_legend_artist = OffsetImage(taxi_image, zoom=1)
+        taxi_legend_artist.set_label('Táxis')
         legend_elements.append(taxi_legend_artist)
-        handler_map[OffsetImage] = HandlerImage(taxi_image, zoom=0.5)
+        handler_map[OffsetImage] = HandlerImage(taxi_image, zoom=3.0)
     else:
         legend_elements.append(Patch(facecolor='yellow', edgecolor='black', label='Táxis'))
+
+    # os taxis sao quadrados com a cor do estado
+    for cor, nome in zip(CORES_ESTADO, NOMES_ESTADO_PAINEL):
+        if nome != "MORTO":
+            legend_elements.append(Patch(facecolor=cor, edgecolor='black', label=f'Táxi: {nome.lower()}'))
         
   
     ax.legend(handles=legend_elements, 
@@ -104,111 +137,85 @@ def desenhar_fundo_mapa(ax, G, plotar_bombas, plotar_carregadores, plotar_recolh
               framealpha=0.9,
               handletextpad=0.7)
 
-def desenhar_frame_animado(ax, G, frota_taxis, artists_anteriores):
-
-    if not plt.fignum_exists(fig.number):
-
-        return [], False 
-
-
-    novos_artists = [] 
-
-
-    if artists_anteriores:
-
-        for artist in artists_anteriores:
-
-            artist.remove()
-
-
-    if frota_taxis:
-
-        try:
-
-            texto_estado = "ESTADO DA FROTA:\n"
-
-            texto_estado += f"{'ID':<4}  {'Auto(km)':<8}   {'Custo':<8}     {'CO2':<6}   {'Estado'}\n"
-
-            texto_estado += "-"*48 + "\n"
-
-
-            for t in frota_taxis:
-
-                km_restantes = t.autonomia_atual / 1000.0
-
-                estado_str = "Livre"
-
-                if t.estado == "a_abastecer": estado_str = "A abastecer"
-
-                elif t.estado == "sem_energia": estado_str = "MORTO"
-
-                linha = f"{t.id:<4} {km_restantes:>7.1f}   {t.custo_total:>7.2f}€   {t.emissoes_CO2:>5.0f}kg      {estado_str}\n"
-
-                texto_estado += linha
-
-            text_artist = ax.text(1.02, 0.6, texto_estado, 
-                                  transform=ax.transAxes, 
-                                  fontsize=9, 
-                                  family='monospace', 
-                                  verticalalignment='center', 
-                                  bbox=dict(boxstyle='round', facecolor='white', alpha=1.0, edgecolor='gray'))
-
-            novos_artists.append(text_artist)
-
-
-        except Exception:
-
-            pass
-
-        try:
-
-            if taxi_image is not None:
-
-                for t in frota_taxis:
-
-                    if t.posicao_atual in G.nodes and t.estado != "sem_energia":
-
-                        x = G.nodes[t.posicao_atual]['x']
-
-                        y = G.nodes[t.posicao_atual]['y']
-
-                        oi = OffsetImage(taxi_image, zoom=0.08)
-
-                        ab = AnnotationBbox(oi, (x, y), xycoords='data', frameon=False, zorder=10)
-
-                        ax.add_artist(ab)
-
-                        novos_artists.append(ab)
-
-            else:
-
-                lons, lats = [], []
-
-                for t in frota_taxis:
-
-                    if t.posicao_atual in G.nodes and t.estado != "sem_energia":
-
-                        lons.append(G.nodes[t.posicao_atual]['x'])
-
-                        lats.append(G.nodes[t.posicao_atual]['y'])
-
-                
-
-                scatter = ax.scatter(lons, lats, c='yellow', s=120, 
-
-                                     marker='s', edgecolors='black', linewidth=1, zorder=10)
-
-                novos_artists.append(scatter)
-
-
-        except Exception:
-
-            pass
-
-    
-
-    plt.pause(0.05) 
-
-    
-
-    return novos_artists, True
\ No newline at end of file
+class RenderizadorFrota:
+    """Desenho da frota com blitting: o mapa estatico fica numa imagem de fundo guardada, os taxis
+    sao uma unica colecao (atualizada com set_offsets) e o painel de estado um unico texto.
+
+    A simulacao pode correr muitos passos por frame: quer_frame() so pede um frame a cada
+    passos_por_frame passos e no maximo fps_maximo vezes por segundo."""
+
+    def __init__(self, fig, ax, frota, passos_por_frame=1, fps_maximo=20, linhas_tabela=15):
+        self.fig = fig
+        self.ax = ax
+        self.frota = frota
+        self.passos_por_frame = max(int(passos_por_frame), 1)
+        self.intervalo_minimo = 1.0 / fps_maximo if fps_maximo else 0.0
+        self.linhas_tabela = linhas_tabela
+        self._ultimo_frame = 0.0
+        self._cores = to_rgba_array(CORES_ESTADO)
+
+        self.taxis = ax.scatter([], [], s=60, marker='s', edgecolors='black', linewidths=0.8,
+                                zorder=10, animated=True)
+        self.painel = ax.text(1.02, 0.6, "", transform=ax.transAxes, fontsize=9, family='monospace',
+                              verticalalignment='center', animated=True,
+                              bbox=dict(boxstyle='round', facecolor='white', alpha=1.0, edgecolor='gray'))
+
+        self._fundo = None
+        self._ligacao = fig.canvas.mpl_connect("draw_event", self._guardar_fundo)
+        fig.canvas.draw()
+
+    def _guardar_fundo(self, evento):
+        # chamado depois de cada redesenho completo (inicio, redimensionar, zoom...)
+        self._fundo = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._desenhar_animados()
+
+    def _desenhar_animados(self):
+        self.ax.draw_artist(self.taxis)
+        self.ax.draw_artist(self.painel)
+
+    def _texto_painel(self, passo):
+        frota = self.frota
+        contagens = np.bincount(frota.estado, minlength=len(NOMES_ESTADO_PAINEL))
+        linhas = [f"ESTADO DA FROTA (passo {passo}):",
+                  " | ".join(f"{nome}: {n}" for nome, n in zip(NOMES_ESTADO_PAINEL, contagens)),
+                  f"Custo total: {frota.custo.sum():.2f}€   CO2: {frota.co2.sum():.0f}kg",
+                  "",
+                  f"{'ID':<4}  {'Auto(km)':<8}   {'Custo':<8}     {'CO2':<6}   {'Estado'}",
+                  "-" * 48]
+        for i in range(min(len(frota), self.linhas_tabela)):
+            linhas.append(f"{frota.ids[i]:<4} {frota.autonomia[i] / 1000.0:>7.1f}   {frota.custo[i]:>7.2f}€   "
+                          f"{frota.co2[i]:>5.0f}kg      {NOMES_ESTADO_PAINEL[frota.estado[i]]}")
+        if len(frota) > self.linhas_tabela:
+            linhas.append(f"... (+{len(frota) - self.linhas_tabela} taxis)")
+        return "\n".join(linhas)
+
+    def quer_frame(self, passo):
+        if passo % self.passos_por_frame:
+            return False
+        return time.perf_counter() - self._ultimo_frame >= self.intervalo_minimo
+
+    def desenhar(self, passo):
+        """Atualiza taxis e painel e mostra o frame. Devolve False se a janela foi fechada."""
+        if not plt.fignum_exists(self.fig.number):
+            return False
+        self._ultimo_frame = time.perf_counter()
+
+        frota = self.frota
+        visiveis = np.flatnonzero(frota.estado != SEM_ENERGIA)
+        x, y = frota.coordenadas()
+        self.taxis.set_offsets(np.column_stack((x[visiveis], y[visiveis])))
+        self.taxis.set_facecolors(self._cores[frota.estado[visiveis]])
+        self.painel.set_text(self._texto_painel(passo))
+
+        canvas = self.fig.canvas
+        if self._fundo is not None and getattr(canvas, "supports_blit", False):
+            canvas.restore_region(self._fundo)
+            self._desenhar_animados()
+            canvas.blit(self.fig.bbox)
+        else:
+            canvas.draw_idle()
+        canvas.flush_events()
+        return True
+
+    def fechar(self):
+        self.fig.canvas.mpl_disconnect(self._ligacao)